@@ -0,0 +1,107 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import pickle
+import requests
+import shutil
+import sys
+import tempfile
+import time
+from typing import *
+from class_table import classTable
+from replay import ReplayAdapter, synthetic_lessons, load_recorded, LOGIN_COOKIE
+from instrument import metrics
+
+'''
+offline ingest benchmark, every request goes to replay.ReplayAdapter instead of jw.ustc.edu.cn
+$ python3 bench_ingest.py --rows 20000 --latency 0.2 --concurrency 8
+{"phase": "update_db", "seconds": 0.61, "pages": 20, "rows": 20000, "pages_per_s": 32.7, "rows_per_s": 32697.1, ...}
+each phase is printed as one json line, use --output to also write them to a file
+'''
+
+def run_phase(name: str, func: Callable, adapter: ReplayAdapter, rows: int = 0, verbose: bool = False) -> Dict:
+    before = dict(adapter.stats)
+    out = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stdout if verbose else out):
+        func()
+    seconds = time.perf_counter() - start
+    requests_cnt = {key: value - before.get(key, 0) for key, value in adapter.stats.items() if value - before.get(key, 0) > 0}
+    pages = requests_cnt.get('lesson_page', 0) + requests_cnt.get('lesson_page_not_modified', 0)
+    result = {'phase': name, 'seconds': round(seconds, 4), 'requests': requests_cnt}
+    if rows:
+        result.update({'pages': pages, 'rows': rows, 'pages_per_s': round(pages / seconds, 1), 'rows_per_s': round(rows / seconds, 1)})
+    return result
+
+def main(argv: List[str] = None) -> List[Dict]:
+    parser = argparse.ArgumentParser(description="offline ingest benchmark of class_table.py")
+    parser.add_argument('--rows', type=int, default=10000, help="synthetic lessons of the semester")
+    parser.add_argument('--recorded', help="json file of recorded lessons, used instead of synthetic lessons")
+    parser.add_argument('--semester', default='141')
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds added to every request")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="probability of a broken lesson page")
+    parser.add_argument('--concurrency', type=int, default=classTable.fetch_concurrency)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--no-stream', action='store_true', help="decode whole lesson pages instead of streaming them")
+    parser.add_argument('--no-cache', action='store_true', help="send every request to the adapter instead of through http_cache.db")
+    parser.add_argument('--ocr', action='store_true', help="login through CAS and tesseract instead of a cached session")
+    parser.add_argument('--output', help="also write the json lines to this file")
+    parser.add_argument('--verbose', action='store_true', help="keep the output of class_table.py")
+    args = parser.parse_args(argv)
+
+    lessons = load_recorded(args.recorded) if args.recorded else synthetic_lessons(args.semester, args.rows)
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        # course.db and session.plk are created in the working directory
+        os.chdir(workdir)
+        try:
+            for repeat in range(args.repeat):
+                for path in ['course.db', 'http_cache.db']:
+                    if os.path.exists(path):
+                        os.remove(path)
+                # files of each semester, see semester_store.py
+                shutil.rmtree('courses', ignore_errors=True)
+                adapter = ReplayAdapter({args.semester: lessons}, latency=args.latency, failure_rate=args.failure_rate, seed=repeat)
+                table = classTable("PB00000000", "replay")
+                table.transport_adapter = adapter
+                table.fetch_concurrency = args.concurrency
+                table.stream_json = not args.no_stream
+                if args.no_cache:
+                    table.http_cache_file = None
+                table.semester = args.semester
+                if not args.ocr:
+                    # a cached session accepted by the adapter, login() skips CAS and OCR
+                    cookies = requests.cookies.RequestsCookieJar()
+                    cookies.set(LOGIN_COOKIE, '1', domain='.ustc.edu.cn')
+                    with open(table.session_file, 'wb') as f:
+                        pickle.dump({'username': "PB00000000", 'cookies': cookies}, f, pickle.HIGHEST_PROTOCOL)
+                metrics.reset()
+                start = time.perf_counter()
+                phases = [
+                    run_phase('login', lambda: table.login(use_cache=not args.ocr), adapter, verbose=args.verbose),
+                    run_phase('semester_map', table.print_semester_id_map, adapter, verbose=args.verbose),
+                    run_phase('update_db', lambda: table.update_db(args.semester), adapter, len(lessons), args.verbose),
+                    run_phase('refresh_db', lambda: table.refresh_db(args.semester), adapter, len(lessons), args.verbose),
+                    run_phase('study_plan', table.get_study_plan, adapter, verbose=args.verbose),
+                    # going through the menu again, answered by the http cache
+                    run_phase('menu_again', lambda: (table.print_semester_id_map(), table.get_study_plan()), adapter, verbose=args.verbose),
+                ]
+                phases.append({'phase': 'end_to_end', 'seconds': round(time.perf_counter() - start, 4), 'requests': dict(adapter.stats), 'metrics': metrics.snapshot()})
+                for result in phases:
+                    result.update({'repeat': repeat, 'latency': args.latency, 'failure_rate': args.failure_rate, 'concurrency': args.concurrency})
+                    print(json.dumps(result, ensure_ascii=False))
+                results += phases
+                table.db.close()
+        finally:
+            os.chdir(cwd)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False) + '\n')
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import *
+from class_table import classTable, COURSE_UPSERT_SQL
+
+'''
+solver benchmark on synthetic semesters
+$ python3 bench_solver.py --courses 12 --sections 6 --periods 3 --density 0.3 --encoding compact classic --backend z3 native
+{"phase": "constraint", "encoding": "compact", "backend": "z3", "seconds": 0.02, "peak_kb": 812.3, "vars": 72, "assertions": 131, "nodes": 598, ...}
+each phase is printed as one json line, use --output to also write them to a file
+'''
+
+def synthetic_semester(semester_id: str, course_cnt: int, sections: int, periods: int, density: float, seed: int = 0) -> List[Dict]:
+    '''
+    generate course_cnt courses with `sections` classes each, every class takes `periods` (day, time) cells every week
+    the cells are drawn from a pool which gets smaller as density grows, so a higher density means more conflicts
+    '''
+    rand = random.Random(seed)
+    cells = [(day, time) for day in range(1, 6) for time in range(1, 14)]
+    pool = cells[:max(periods, int(round(len(cells) * (1 - density))))]
+    lessons = []
+    for course in range(course_cnt):
+        for section in range(sections):
+            chosen = sorted(rand.sample(pool, min(periods, len(pool))))
+            days = {}
+            for day, time in chosen:
+                days.setdefault(day, []).append(time)
+            lessons.append({
+                'id': course * 1000 + section,
+                'code': "B%04d.%02d" % (course, section + 1),
+                'course': {'code': "B%04d" % (course), 'nameZh': "课程%d" % (course), 'credits': 2.0},
+                'suggestScheduleWeeks': [],
+                'semester': {'id': int(semester_id)},
+                'teacherAssignmentList': [{'teacher': {'person': {'nameZh': "教师%d" % (rand.randint(1, sections * 2))}}}],
+                'requiredPeriodInfo': {'total': 40, 'theory': 40, 'practice': 0},
+                'stdCount': 0,
+                'limitCount': 100,
+                'scheduleText': {
+                    'dateTimeText': {'text': "1~18周"},
+                    'dateTimePlaceText': {'text': ';'.join("3C%03d: %d(%s)" % (101 + course % 50, day, ','.join(map(str, times))) for day, times in days.items())},
+                },
+            })
+    return lessons
+
+def formula_size(constraint) -> Dict[str, int]:
+    '''
+    number of distinct vars, expression nodes and top level conjuncts (nested And flattened) of a z3 formula
+    '''
+    import z3
+    assertions = 0
+    todo = [constraint]
+    while todo:
+        expr = todo.pop()
+        if z3.is_and(expr):
+            todo += expr.children()
+        elif not z3.is_true(expr):
+            assertions += 1
+    seen = set()
+    variables = set()
+    todo = [constraint]
+    while todo:
+        expr = todo.pop()
+        if expr.get_id() in seen:
+            continue
+        seen.add(expr.get_id())
+        if z3.is_const(expr) and expr.decl().kind() == z3.Z3_OP_UNINTERPRETED:
+            variables.add(expr.get_id())
+        todo += expr.children()
+    return {'vars': len(variables), 'nodes': len(seen), 'assertions': assertions}
+
+def measure(func: Callable, verbose: bool = False) -> Tuple[Any, Dict]:
+    out = io.StringIO()
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stdout if verbose else out):
+        result = func()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {'seconds': round(seconds, 5), 'peak_kb': round(peak / 1024, 1)}
+
+def main(argv: List[str] = None) -> List[Dict]:
+    parser = argparse.ArgumentParser(description="solver benchmark of class_table.py on synthetic semesters")
+    parser.add_argument('--courses', type=int, default=10)
+    parser.add_argument('--sections', type=int, default=5, help="classes per course")
+    parser.add_argument('--periods', type=int, default=3, help="(day, time) cells per class every week")
+    parser.add_argument('--density', type=float, default=0.3, help="0 spreads classes over the whole week, close to 1 packs them together")
+    parser.add_argument('--enumerate', type=int, default=50, help="solutions to enumerate")
+    parser.add_argument('--encoding', nargs='+', default=['compact'], choices=['compact', 'classic'])
+    parser.add_argument('--backend', nargs='+', default=['z3'], choices=['z3', 'native', 'check'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="also write the json lines to this file")
+    parser.add_argument('--verbose', action='store_true', help="keep the output of class_table.py")
+    args = parser.parse_args(argv)
+
+    semester = '900'
+    lessons = synthetic_semester(semester, args.courses, args.sections, args.periods, args.density, args.seed)
+    config = {'courses': args.courses, 'sections': args.sections, 'periods': args.periods, 'density': args.density}
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        # course.db is created in the working directory
+        os.chdir(workdir)
+        try:
+            table = classTable("PB00000000", "bench")
+            with contextlib.redirect_stdout(io.StringIO()):
+                table._prepare_database()
+            con = sqlite3.connect('course.db')
+            con.executemany(COURSE_UPSERT_SQL, [table._lesson_to_row(item) for item in lessons])
+            con.commit()
+            con.close()
+            course_code_list = sorted({item['course']['code'] for item in lessons})
+            for encoding in args.encoding:
+                for backend in args.backend:
+                    table = classTable("PB00000000", "bench")
+                    table.semester = semester
+                    table.course_code_list = course_code_list
+                    table.encoding = encoding
+                    table.solver_backend = backend
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        table.clear()
+                    phases = []
+                    course_list, stat = measure(table._get_courses_info, args.verbose)
+                    phases.append(dict(phase='courses_info', **stat))
+                    if backend != 'native':
+                        constraint, stat = measure(lambda: table._add_constraint(course_list), args.verbose)
+                        stat.update(formula_size(constraint))
+                        phases.append(dict(phase='constraint', **stat))
+                    solution, stat = measure(table._next_solution, args.verbose)
+                    stat['sat'] = solution is not None
+                    phases.append(dict(phase='solve', **stat))
+                    solutions, stat = measure(lambda: table.enumerate_solutions(args.enumerate), args.verbose)
+                    stat['solutions'] = len(solutions)
+                    phases.append(dict(phase='enumerate', **stat))
+                    if solution is not None:
+                        with contextlib.redirect_stdout(io.StringIO()):
+                            table.set_cur_class(0)
+                        _, stat = measure(table._place_lessons, args.verbose)
+                        phases.append(dict(phase='place', **stat))
+                    for result in phases:
+                        result.update(config, encoding=encoding, backend=backend)
+                        print(json.dumps(result, ensure_ascii=False))
+                    results += phases
+                    table.db.close()
+        finally:
+            os.chdir(cwd)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False) + '\n')
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from typing import *
+from class_table import classTable, COURSE_UPSERT_SQL
+from history_store import HistoryStore
+from replay import synthetic_lessons
+
+'''
+startup benchmark and import-time budget check of class_table.py
+$ python3 bench_startup.py --budget 100
+{"phase": "import", "ms": 21.3, "heavy_modules": [], "budget_ms": 100.0, "ok": true}
+{"phase": "command", "command": "print", "ms": 68.1, ...}
+exit code is 1 if importing class_table takes longer than the budget or loads any module of HEAVY_MODULES
+'''
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'class_table.py')
+
+# modules only some commands need, importing class_table must NOT load them
+HEAVY_MODULES = ['z3', 'requests', 'PIL', 'pytesseract', 'bs4', 'prettytable', 'tqdm']
+
+def import_time(repeat: int) -> float:
+    '''
+    best cumulative import time (ms) of class_table in a fresh interpreter, from python -X importtime
+    '''
+    best = None
+    for _ in range(repeat):
+        r = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import class_table'], cwd=os.path.dirname(SCRIPT),
+                           capture_output=True, text=True, check=True)
+        for line in r.stderr.splitlines():
+            fields = [item.strip() for item in line.split('|')]
+            if len(fields) == 3 and fields[2] == 'class_table':
+                ms = int(fields[1]) / 1000
+                best = ms if best is None else min(best, ms)
+    return best
+
+def heavy_modules() -> List[str]:
+    code = 'import sys, json, class_table; print(json.dumps([m for m in %r if m in sys.modules]))' % (HEAVY_MODULES)
+    r = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(SCRIPT), capture_output=True, text=True, check=True)
+    return json.loads(r.stdout)
+
+def command_time(args: List[str], repeat: int) -> float:
+    '''
+    best wall time (ms) of `python3 -m class_table args` in the working directory
+    -m runs the cached bytecode, `python3 class_table.py` compiles the whole file on every run
+    '''
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(SCRIPT))
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'class_table'] + args, stdout=subprocess.DEVNULL, env=env, check=True)
+        ms = (time.perf_counter() - start) * 1000
+        best = ms if best is None else min(best, ms)
+    return best
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="startup benchmark of class_table.py")
+    parser.add_argument('--budget', type=float, default=100.0, help="max ms to import class_table")
+    parser.add_argument('--rows', type=int, default=2000, help="synthetic lessons in course.db")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="also write the json lines to this file")
+    args = parser.parse_args(argv)
+
+    results = []
+    ms = import_time(args.repeat)
+    heavy = heavy_modules()
+    ok = ms is not None and ms <= args.budget and heavy == []
+    results.append({'phase': 'import', 'ms': round(ms, 1), 'heavy_modules': heavy, 'budget_ms': args.budget, 'ok': ok})
+
+    semester = '141'
+    lessons = synthetic_lessons(semester, args.rows)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        # course.db and history.db are created in the working directory
+        os.chdir(workdir)
+        try:
+            table = classTable("PB00000000", "bench")
+            with contextlib.redirect_stdout(io.StringIO()):
+                table._prepare_database()
+            con = sqlite3.connect('course.db')
+            con.executemany(COURSE_UPSERT_SQL, [table._lesson_to_row(item) for item in lessons])
+            con.commit()
+            con.close()
+            table.db.close()
+            classes = sorted({item['code'] for item in lessons})[:8]
+            HistoryStore(classTable.history_db).add(semester, sorted({item.split('.')[0] for item in classes}), classes)
+            for name, command in [('help', ['--help']),
+                                  ('print', ['-q', 'print', '-s', semester]),
+                                  ('export', ['-q', 'export', '-s', semester])]:
+                results.append({'phase': 'command', 'command': name, 'ms': round(command_time(command, args.repeat), 1)})
+        finally:
+            os.chdir(cwd)
+    for result in results:
+        print(json.dumps(result, ensure_ascii=False))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False) + '\n')
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
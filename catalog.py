@@ -0,0 +1,353 @@
+import array
+import hashlib
+import json
+import mmap
+import os
+import sys
+from typing import *
+from class_table import CourseDB, COURSE_SCHEMA, COURSE_COLUMNS
+from schedule_parser import WEEK_CNT, DAY_CNT, TIME_CNT, MASK_BYTES, ScheduleError, slot_bit, mask_to_blob, blob_to_mask, parse_masks
+
+'''
+all lessons of one semester in memory, stored by column and indexed, loaded once instead of querying course.db every time
+>>> from catalog import SemesterCatalog, slots_mask
+>>> catalog = SemesterCatalog.open(CourseDB(), '141', 'catalog_141.bin')
+>>> [section.classCode for section in catalog.find('CS1502', avoid=slots_mask(days=[1], times=[1, 2, 3, 4, 5]))]
+['CS1502.02', 'CS1502.04']    # sections of CS1502 not meeting on monday morning
+>>> catalog.meeting(slots_mask(weeks=[1], days=[3], times=[6]))
+['CS1502.01', 'MARX1004.03', ...]    # sections meeting on wednesday afternoon of week 1
+text columns are dictionary encoded (each distinct text once, rows keep an int32 code), numbers are typed arrays
+and schedule masks are packed MASK_BYTES per row, so the prebuilt file is mapped by mmap without decoding the rows
+'''
+
+MAGIC = b'USTCCAT1'
+# stands for NULL in integer columns, NaN does in real columns
+INT_NULL = -2 ** 63
+ALIGN = 8
+
+# array typecode of each sqlite type, text columns keep int32 codes into their distinct values
+TYPECODES = {'integer': 'q', 'real': 'd', 'text': 'i'}
+
+def slots_mask(weeks: Iterable[int] = None, days: Iterable[int] = None, times: Iterable[int] = None) -> int:
+    '''
+    schedule mask of every (week, day, time) combination, all weeks / days / times if None
+    >>> slots_mask(days=[1], times=[1, 2, 3, 4, 5])    # monday morning of every week
+    '''
+    mask = 0
+    for week in weeks or range(1, WEEK_CNT + 1):
+        for day in days or range(1, DAY_CNT + 1):
+            for time in times or range(1, TIME_CNT + 1):
+                mask |= 1 << slot_bit(week, day, time)
+    return mask
+
+class Section:
+    '''
+    one class of the catalog, mask is None if the schedule text is malformed
+    '''
+    __slots__ = ['classCode', 'courseCode', 'courseName', 'teacher', 'scheduleWeek', 'scheduleTime', 'curNum', 'maxNum', 'mask']
+
+    def __init__(self, classCode: str, courseCode: str, courseName: str, teacher: str, scheduleWeek: str, scheduleTime: str,
+                 curNum: int, maxNum: int, mask: Optional[int]) -> None:
+        self.classCode = classCode
+        self.courseCode = courseCode
+        self.courseName = courseName
+        self.teacher = teacher
+        self.scheduleWeek = scheduleWeek
+        self.scheduleTime = scheduleTime
+        self.curNum = curNum
+        self.maxNum = maxNum
+        self.mask = mask
+
+    def __repr__(self) -> str:
+        return "Section(%s %s %s %s %s)" % (self.classCode, self.courseName, self.teacher, self.scheduleWeek, self.scheduleTime)
+
+def _padding(size: int) -> int:
+    return -size % ALIGN
+
+class SemesterCatalog:
+    '''
+    read-only, drop-in for CourseDB in classTable (get_courses() and get_classes() of its semester)
+    hash indexes by courseCode, classCode and teacher are built when loaded, the index from slot to sections when first used
+    '''
+
+    def __init__(self, semester: str, count: int, fingerprint: str, columns: Dict[str, Sequence], values: Dict[str, List[Optional[str]]],
+                 masks: Sequence[int], has_mask: Sequence[int], mapped: mmap.mmap = None, views: List[memoryview] = []) -> None:
+        self.semester = str(semester)
+        self.count = count
+        # sha1 of (id, rowHash) of every row, tells whether course.db changed since the catalog was built
+        self.fingerprint = fingerprint
+        # column name -> array of the column, codes into values[column] for text columns
+        self.__columns = columns
+        self.__values = values
+        # MASK_BYTES bytes per row, has_mask[row] is 0 if the schedule text is malformed
+        self.__masks = masks
+        self.__has_mask = has_mask
+        self.__mapped = mapped
+        self.__views = list(views)
+        self.__by_course = self._index('courseCode')
+        self.__by_teacher = self._index('teacher')
+        codes, class_values = self.__columns['classCode'], self.__values['classCode']
+        self.__by_class = {class_values[codes[row]]: row for row in range(count)}
+        # slot bit -> rows occupying it, see slot_index()
+        self.__by_slot = None
+
+    def _index(self, column: str) -> Dict[str, List[int]]:
+        codes, values = self.__columns[column], self.__values[column]
+        rows_of_code = {}
+        for row in range(self.count):
+            rows_of_code.setdefault(codes[row], []).append(row)
+        return {values[code]: rows for code, rows in rows_of_code.items()}
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self) -> None:
+        '''
+        unmap the prebuilt file, the catalog can't be used any more
+        '''
+        if self.__mapped is not None:
+            for view in self.__views:
+                view.release()
+            self.__mapped.close()
+            self.__mapped = None
+
+    @staticmethod
+    def fingerprint_of(rows: Iterable[Tuple[int, str]]) -> str:
+        digest = hashlib.sha1()
+        for id, rowHash in rows:
+            digest.update(("%s:%s\n" % (id, rowHash)).encode())
+        return digest.hexdigest()
+
+    @classmethod
+    def db_fingerprint(cls, db: CourseDB, semester: str) -> str:
+        return cls.fingerprint_of(db.connection(semester).execute("SELECT id, rowHash FROM courses WHERE semester = ? ORDER BY id", (str(semester),)))
+
+    @classmethod
+    def from_db(cls, db: CourseDB, semester: str, on_error: Callable[[ScheduleError], None] = None) -> 'SemesterCatalog':
+        '''
+        read every lesson of the semester from course.db, masks not stored are parsed here, on_error gets each malformed schedule
+        '''
+        rows = db.connection(semester).execute("SELECT %s FROM courses WHERE semester = ? ORDER BY id" % (', '.join(COURSE_COLUMNS)), (str(semester),)).fetchall()
+        index = {column: num for num, column in enumerate(COURSE_COLUMNS)}
+        week_col, time_col, mask_col = index['scheduleWeek'], index['scheduleTime'], index['scheduleMask']
+        missing = [num for num, row in enumerate(rows) if row[mask_col] is None]
+        parsed, errors = parse_masks((rows[num][week_col], rows[num][time_col]) for num in missing)
+        if on_error is not None:
+            for e in errors:
+                on_error(e)
+        parsed = dict(zip(missing, parsed))
+        columns = {}
+        values = {}
+        for column, column_type in COURSE_SCHEMA:
+            if column == 'scheduleMask':
+                continue
+            num = index[column]
+            if column_type == 'text':
+                code_of = {}
+                columns[column] = array.array('i', [code_of.setdefault(row[num], len(code_of)) for row in rows])
+                values[column] = list(code_of)
+            elif column_type == 'integer':
+                columns[column] = array.array('q', [INT_NULL if row[num] is None else row[num] for row in rows])
+            else:
+                columns[column] = array.array('d', [float('nan') if row[num] is None else row[num] for row in rows])
+        masks = bytearray()
+        has_mask = array.array('b')
+        for num, row in enumerate(rows):
+            if row[mask_col] is not None:
+                masks += row[mask_col]
+                has_mask.append(1)
+            elif parsed[num] is not None:
+                masks += mask_to_blob(parsed[num])
+                has_mask.append(1)
+            else:
+                masks += bytes(MASK_BYTES)
+                has_mask.append(0)
+        fingerprint = cls.fingerprint_of((row[index['id']], row[index['rowHash']]) for row in rows)
+        return cls(semester, len(rows), fingerprint, columns, values, masks, has_mask)
+
+    def save(self, path: str) -> None:
+        '''
+        write the prebuilt file, replaced at once so a reader never maps half of it
+        '''
+        header = {'semester': self.semester, 'count': self.count, 'fingerprint': self.fingerprint, 'byteorder': sys.byteorder,
+                  'columns': {}, 'values': self.__values}
+        blocks = []
+        offset = 0
+        for name, data in list(self.__columns.items()) + [('__has_mask', self.__has_mask), ('__masks', self.__masks)]:
+            data = bytes(data)
+            header['columns'][name] = offset
+            blocks.append(data + bytes(_padding(len(data))))
+            offset += len(blocks[-1])
+        header_data = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        header_data += b' ' * _padding(len(MAGIC) + 8 + len(header_data))
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(MAGIC + len(header_data).to_bytes(8, 'little') + header_data)
+            for block in blocks:
+                f.write(block)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'SemesterCatalog':
+        '''
+        map the prebuilt file, only the distinct texts are decoded, raise ValueError if the file is broken
+        '''
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        views = []
+        try:
+            if mapped[:len(MAGIC)] != MAGIC:
+                raise ValueError("Not a catalog file: %s" % (path))
+            header_len = int.from_bytes(mapped[len(MAGIC):len(MAGIC) + 8], 'little')
+            start = len(MAGIC) + 8 + header_len
+            header = json.loads(mapped[len(MAGIC) + 8:start].decode('utf-8'))
+            if header['byteorder'] != sys.byteorder:
+                raise ValueError("Catalog file of another byte order: %s" % (path))
+            count = header['count']
+            whole = memoryview(mapped)
+            views.append(whole)
+
+            def column(name, typecode, itemsize):
+                offset = start + header['columns'][name]
+                view = whole[offset:offset + count * itemsize]
+                views.append(view)
+                if typecode is None:
+                    return view
+                view = view.cast(typecode)
+                views.append(view)
+                return view
+
+            columns = {name: column(name, TYPECODES[column_type], array.array(TYPECODES[column_type]).itemsize)
+                       for name, column_type in COURSE_SCHEMA if name != 'scheduleMask'}
+            has_mask = column('__has_mask', 'b', 1)
+            masks = column('__masks', None, MASK_BYTES)
+        except (KeyError, TypeError) as e:
+            for view in reversed(views):
+                view.release()
+            mapped.close()
+            raise ValueError("Broken catalog file %s: %s" % (path, e))
+        except Exception:
+            for view in reversed(views):
+                view.release()
+            mapped.close()
+            raise
+        return cls(header['semester'], count, header['fingerprint'], columns, header['values'], masks, has_mask, mapped, list(reversed(views)))
+
+    @classmethod
+    def open(cls, db: CourseDB, semester: str, path: str = None, on_error: Callable[[ScheduleError], None] = None) -> 'SemesterCatalog':
+        '''
+        map the prebuilt file if it is built from the same rows of course.db, otherwise read course.db and rebuild the file
+        '''
+        if path is not None and os.path.exists(path):
+            try:
+                catalog = cls.load(path)
+            except (ValueError, OSError):
+                catalog = None
+            if catalog is not None:
+                if catalog.semester == str(semester) and catalog.fingerprint == cls.db_fingerprint(db, semester):
+                    return catalog
+                catalog.close()
+        catalog = cls.from_db(db, semester, on_error)
+        if path is not None:
+            catalog.save(path)
+        return catalog
+
+    def value(self, row: int, column: str) -> Any:
+        if column == 'scheduleMask':
+            return bytes(self.__masks[row * MASK_BYTES:(row + 1) * MASK_BYTES]) if self.__has_mask[row] else None
+        data = self.__columns[column]
+        if column in self.__values:
+            return self.__values[column][data[row]]
+        item = data[row]
+        if item == INT_NULL or item != item:
+            return None
+        return item
+
+    def mask(self, row: int) -> Optional[int]:
+        if not self.__has_mask[row]:
+            return None
+        return int.from_bytes(self.__masks[row * MASK_BYTES:(row + 1) * MASK_BYTES], 'little')
+
+    def section(self, row: int) -> Section:
+        return Section(*[self.value(row, column) for column in Section.__slots__[:-1]], self.mask(row))
+
+    def _check(self, semester: str, columns: List[str]) -> None:
+        if str(semester) != self.semester:
+            raise Exception("Semester %s is not loaded" % (semester))
+        for column in columns:
+            if column not in COURSE_COLUMNS:
+                raise Exception("Unknown column: %s" % (column))
+
+    def get_courses(self, semester: str, course_codes: List[str], columns: List[str]) -> Dict[str, List[Tuple]]:
+        '''
+        same as CourseDB.get_courses()
+        '''
+        self._check(semester, columns)
+        return {courseCode: [tuple(self.value(row, column) for column in columns) for row in self.__by_course.get(courseCode, [])]
+                for courseCode in course_codes}
+
+    def get_classes(self, semester: str, class_codes: List[str], columns: List[str]) -> Dict[str, Tuple]:
+        '''
+        same as CourseDB.get_classes()
+        '''
+        self._check(semester, columns)
+        result = {}
+        for classCode in class_codes:
+            row = self.__by_class.get(classCode)
+            if row is not None:
+                result[classCode] = tuple(self.value(row, column) for column in columns)
+        return result
+
+    def slot_index(self) -> List[array.array]:
+        '''
+        slot bit -> rows occupying the slot, see slot_bit()
+        '''
+        if self.__by_slot is None:
+            by_slot = [array.array('i') for _ in range(WEEK_CNT * DAY_CNT * TIME_CNT)]
+            for row in range(self.count):
+                mask = self.mask(row) or 0
+                while mask:
+                    low = mask & -mask
+                    by_slot[low.bit_length() - 1].append(row)
+                    mask ^= low
+            self.__by_slot = by_slot
+        return self.__by_slot
+
+    def _meeting_rows(self, mask: int) -> Set[int]:
+        index = self.slot_index()
+        rows = set()
+        while mask:
+            low = mask & -mask
+            rows.update(index[low.bit_length() - 1])
+            mask ^= low
+        return rows
+
+    def meeting(self, mask: int) -> List[str]:
+        '''
+        class codes of the sections occupying any slot of the mask, by the slot index
+        '''
+        return [self.value(row, 'classCode') for row in sorted(self._meeting_rows(mask))]
+
+    def find(self, course_code: str = None, teacher: str = None, avoid: int = 0, meets: int = 0) -> List[Section]:
+        '''
+        sections of the course and the teacher (any if None), not occupying any slot of avoid and occupying some slot of meets (if not 0)
+        sections of malformed schedule never match avoid or meets
+        '''
+        if course_code is not None:
+            rows = self.__by_course.get(course_code, [])
+            if teacher is not None:
+                rows = [row for row in rows if self.value(row, 'teacher') == teacher]
+        elif teacher is not None:
+            rows = self.__by_teacher.get(teacher, [])
+        elif meets:
+            rows = sorted(self._meeting_rows(meets))
+        else:
+            rows = range(self.count)
+        result = []
+        for row in rows:
+            if avoid or meets:
+                mask = self.mask(row)
+                if mask is None or mask & avoid or (meets and not mask & meets):
+                    continue
+            result.append(self.section(row))
+        return result
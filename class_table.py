@@ -1,17 +1,27 @@
+from __future__ import annotations
 import io
 import os
-import PIL
-import pytesseract
 import re
-import requests
-from bs4 import BeautifulSoup
 from typing import *
 import json
 import sqlite3
-from tqdm import tqdm
-import z3
-from prettytable import PrettyTable
 import pickle
+import sys
+import hashlib
+import itertools
+import threading
+import queue
+from itertools import islice
+from conflict_graph import ConflictGraph
+from history_store import HistoryStore
+from instrument import metrics
+from json_stream import iter_json_array
+from presolve import PresolveResult, presolve, minimal_conflict
+from schedule_parser import WEEK_CNT, DAY_CNT, TIME_CNT, MASK_BYTES, slot_bit, mask_to_slots, mask_to_blob, blob_to_mask, ScheduleError, parse_schedule, schedule_mask, parse_masks
+from solver_backend import SolverBackend, Z3Backend, NativeBackend, CrossCheckBackend, enumerate_parallel
+
+# z3, requests, PIL, pytesseract, bs4, prettytable and concurrent.futures are imported by the methods using them,
+# so commands like printing a stored class table start without loading them
 
 '''
 >>> from class_table import classTable
@@ -26,19 +36,149 @@ class Alarm:
     WARNING = '\033[93m' #YELLOW
     FAIL = '\033[91m' #RED
     RESET = '\033[0m' #RESET COLOR
+    # logger(level, msg) receives every message instead of stdout if set
+    # e.g. instrument.JsonLogger() for json lines, instrument.quiet_logger to drop all messages
+    logger = None
     
     def success(msg: str) -> None:
+        if Alarm.logger is not None:
+            return Alarm.logger('success', msg)
         print(Alarm.OK + "[SUCC] " + Alarm.RESET + msg)
     
     def warning(msg: str) -> None:
+        if Alarm.logger is not None:
+            return Alarm.logger('warning', msg)
         print(Alarm.WARNING + "[WARN] " + Alarm.RESET + msg)
 
     def fail(msg: str) -> None:
+        if Alarm.logger is not None:
+            return Alarm.logger('fail', msg)
         print(Alarm.FAIL + "[FAIL] " + Alarm.RESET + msg)
     
     def info(msg: str) -> None:
+        if Alarm.logger is not None:
+            return Alarm.logger('info', msg)
         print("[INFO] " + msg)
 
+COURSE_SCHEMA = [
+    ('id', 'integer'),
+    ('classCode', 'text'),
+    ('courseCode', 'text'),
+    ('courseName', 'text'),
+    ('credits', 'real'),
+    ('suggestScheduleWeeks', 'text'),
+    ('semester', 'integer'),
+    ('teacher', 'text'),
+    ('timeTotal', 'real'),
+    ('timeTheory', 'real'),
+    ('timeExperiment', 'real'),
+    ('curNum', 'integer'),
+    ('maxNum', 'integer'),
+    ('scheduleWeek', 'text'),
+    ('scheduleTime', 'text'),
+    # hash of all the fields above, used by refresh_db to find changed lessons
+    ('rowHash', 'text'),
+    # occupancy bitmask of scheduleWeek and scheduleTime, see slot_bit()
+    ('scheduleMask', 'blob'),
+]
+
+COURSE_COLUMNS = [column for column, _ in COURSE_SCHEMA]
+
+COURSE_TABLE_SQL = "CREATE TABLE %%s (%s, PRIMARY KEY (semester, id))" % (
+    ', '.join(['%s %s' % (column, column_type) for column, column_type in COURSE_SCHEMA]),
+)
+
+COURSE_UPSERT_SQL = "INSERT INTO courses (%s) VALUES (%s) ON CONFLICT (semester, id) DO UPDATE SET %s" % (
+    ', '.join(COURSE_COLUMNS),
+    ', '.join(['?'] * len(COURSE_COLUMNS)),
+    ', '.join(['%s = excluded.%s' % (column, column) for column in COURSE_COLUMNS if column not in ('id', 'semester')]),
+)
+
+class CourseDB:
+    '''
+    data access layer of course.db
+    hold one long-lived connection, every lookup is parameterized and batched into one IN (...) query
+    >>> db = CourseDB()
+    >>> db.get_courses('141', ['CS1502', 'MARX1004'], ['classCode', 'teacher'])
+    {'CS1502': [('CS1502.01', '张三'), ...], 'MARX1004': [...]}
+    a semester having its own file in semester_dir (see semester_store.py) is read from that file,
+    others from the courses table of course.db, semester_dir None to keep every semester in course.db
+    '''
+    # keep the number of host parameters below SQLITE_MAX_VARIABLE_NUMBER of old sqlite
+    MAX_PARAMS = 500
+
+    def __init__(self, path: str = 'course.db', semester_dir: str = 'courses') -> None:
+        self.path = path
+        self.semester_dir = semester_dir
+        self.__con = None
+        # semester -> connection of its file
+        self.__semester_con = {}
+        self.__store = None
+        self.__lock = threading.Lock()
+
+    def store(self) -> Optional[SemesterStore]:
+        if self.semester_dir is None:
+            return None
+        if self.__store is None or self.__store.directory != self.semester_dir:
+            from semester_store import SemesterStore
+            self.__store = SemesterStore(self.semester_dir)
+        return self.__store
+
+    def connection(self, semester: str = None) -> sqlite3.Connection:
+        '''
+        connection of the file of the semester if it has one, of course.db otherwise
+        the file is replaced in place by a refresh, so the connection is kept until the file is removed
+        '''
+        if semester is not None:
+            semester = str(semester)
+            store = self.store()
+            if store is not None and store.exists(semester):
+                if semester not in self.__semester_con:
+                    self.__semester_con[semester] = sqlite3.connect(store.path(semester), check_same_thread=False)
+                return self.__semester_con[semester]
+            if semester in self.__semester_con:
+                self.__semester_con.pop(semester).close()
+        if self.__con is None:
+            self.__con = sqlite3.connect(self.path, check_same_thread=False)
+        return self.__con
+
+    def close(self) -> None:
+        for con in self.__semester_con.values():
+            con.close()
+        self.__semester_con = {}
+        if self.__con is not None:
+            self.__con.close()
+            self.__con = None
+
+    def _select_in(self, semester: str, key: str, values: List[str], columns: List[str]) -> List[Tuple]:
+        for column in [key] + list(columns):
+            if column not in COURSE_COLUMNS:
+                raise Exception("Unknown column: %s" % (column))
+        result = []
+        values = list(dict.fromkeys(values))
+        with self.__lock:
+            cur = self.connection(semester).cursor()
+            for start in range(0, len(values), self.MAX_PARAMS):
+                chunk = values[start:start + self.MAX_PARAMS]
+                result += cur.execute("SELECT %s, %s FROM courses WHERE semester = ? AND %s IN (%s) ORDER BY id" % (
+                    key, ', '.join(columns), key, ', '.join(['?'] * len(chunk))), [semester] + chunk).fetchall()
+        return result
+
+    def get_courses(self, semester: str, course_codes: List[str], columns: List[str]) -> Dict[str, List[Tuple]]:
+        '''
+        return all classes of each course code, course code not found maps to []
+        '''
+        course_list = {courseCode: [] for courseCode in course_codes}
+        for row in self._select_in(semester, 'courseCode', course_codes, columns):
+            course_list[row[0]].append(row[1:])
+        return course_list
+
+    def get_classes(self, semester: str, class_codes: List[str], columns: List[str]) -> Dict[str, Tuple]:
+        '''
+        return the row of each class code, class code not found is missing in the result
+        '''
+        return {row[0]: row[1:] for row in self._select_in(semester, 'classCode', class_codes, columns)}
+
 class classTable:
     __username = ""
     __password = ""
@@ -52,16 +192,81 @@ class classTable:
     # courses code list you want to schedule
     course_code_list = []
     __prefer_class_list = []
+    # solver session, kept alive across solve() while semester, courses and prefer classes are the same
+    __solver = None
+    __solver_key = None
+    # 'z3': z3 SMT solver, 'native': pure python backtracking, 'check': run both and cross-check
+    solver_backend = 'z3'
+    # class code -> z3 var of the last built constraint
+    __class_var = {}
+    # remove classes which can't be in any solution before building the solver, see presolve.py
+    presolve = True
+    # cookies of the last login, reused by login() while still valid
+    session_file = 'session.plk'
+    # solutions saved by save_history_model() and loaded by load_history_model(), kept per semester and course list
+    history_db = 'history.db'
+    # history of old versions, imported by load_history_model() if nothing of the course list is saved yet
+    legacy_history_file = 'history.plk'
+    # requests transport adapter used instead of the network, e.g. replay.ReplayAdapter for offline runs
+    transport_adapter = None
+    # responses of jw.ustc.edu.cn cached on disk by http_cache.py, None to always ask the server
+    http_cache_file = 'http_cache.db'
+    # seconds each endpoint is used without asking the server, overriding http_cache.DEFAULT_TTL, e.g. {'semester_index': 3600}
+    http_cache_ttl = {}
+    # max lesson-search pages fetched at the same time
+    fetch_concurrency = 8
+    # decode lesson pages while downloading, so memory is bounded by insert_batch_size instead of the page size
+    stream_json = True
+    # lessons written by one executemany
+    insert_batch_size = 200
+    # semesters downloaded at the same time by refresh_semesters(), they share the fetch_concurrency pages in flight
+    semester_concurrency = 4
+    # prebuilt catalog of each semester (%s is the semester id), mapped instead of reading course.db while it's up to date
+    # written beside the file holding the semester, see _catalog_path()
+    # None to always read course.db, see catalog.py
+    catalog_file = 'catalog_%s.bin'
+    # 'compact': pseudo-boolean exactly-one / at-most-one constraints, linear in the number of classes
+    # 'classic': the original And/Or/Not encoding, quadratic in the number of classes
+    encoding = 'compact'
+    # teachers you'd rather not have, only used by solve_optimal()
+    avoid_teacher_list = []
+    # periods counted as early morning by solve_optimal()
+    early_time_list = [1, 2]
+    # weight of each soft objective of solve_optimal()
+    # prefer: per course whose prefer class is chosen, teacher: per avoided teacher NOT chosen
+    # early: per early morning period NOT occupied, day: per week day without any class
+    optimize_weight = {'prefer': 10, 'teacher': 5, 'early': 1, 'day': 2}
 
-    def __init__(self, usrname, pwd) -> None:
+    def __init__(self, usrname, pwd, db: CourseDB = None) -> None:
         '''
         return the classTable object, will NOT login your account automatically
         >>> myTable = classTable("PB12345678", "qwert123")
         If you want to login, use login()
         >>> mytable.login()
+        db is where courses are read from, any object with get_courses() and get_classes() of CourseDB,
+        e.g. a schedule_service.SharedCatalog shared by many classTable
         '''
         self.__username = usrname
         self.__password = pwd
+        self.db = db if db is not None else CourseDB()
+        # the mutable defaults above are shared by all instances, every instance needs its own
+        self.__place_table = []
+        self.__history_model = []
+        self.__cur_classes = []
+        self.course_code_list = []
+        self.__prefer_class_list = []
+        self.__class_var = {}
+        # result of the last presolve and (semester, courses, prefer classes) it is for
+        self.__presolve_result = None
+        self.__presolve_key = None
+        self.__history_store = None
+        self.__http_cache = None
+        self.__catalog = None
+        # malformed schedule text -> reason, each of them is warned once
+        self.__schedule_errors = {}
+        self.avoid_teacher_list = []
+        self.early_time_list = list(self.early_time_list)
+        self.optimize_weight = dict(self.optimize_weight)
 
     def _check_login(self):
         if self.__session is None:
@@ -75,26 +280,139 @@ class classTable:
         '''
         self.__history_model = []
         self.__prefer_class_list = []
+        self._reset_history_constraint()
         Alarm.success("History model and Prefer class cleared")
     
+    def add_prefer_class(self, class_codes: List[str]) -> None:
+        '''
+        prefer the classes, the other classes of their courses are NOT preferred, same as selecting them in _select_prefer_class()
+        >>> myTable.add_prefer_class(['CS1502.01', 'CS1502.02'])
+        '''
+        catalog = self._get_catalog()
+        class_list = catalog.get_classes(self.semester, class_codes, ['courseCode'])
+        for class_id in class_codes:
+            if class_id not in class_list:
+                Alarm.fail("No such class: %s" % (class_id))
+                raise Exception("No such class: %s" % (class_id))
+        course_codes = list(dict.fromkeys(class_list[class_id][0] for class_id in class_codes))
+        course_list = catalog.get_courses(self.semester, course_codes, ['classCode'])
+        for courseCode in course_codes:
+            select_list = [class_id for class_id in class_codes if class_list[class_id][0] == courseCode]
+            classes = [item[0] for item in course_list[courseCode] if item[0] not in select_list]
+            self.__prefer_class_list.append((select_list, classes))
+
+    def _get_history_store(self) -> HistoryStore:
+        if self.__history_store is None or self.__history_store.path != self.history_db:
+            self.__history_store = HistoryStore(self.history_db)
+        return self.__history_store
+
+    def _get_catalog(self) -> SemesterCatalog:
+        '''
+        lessons of current semester loaded once, raise sqlite3.OperationalError if course.db has no courses yet
+        a db holding catalogs itself (schedule_service.SharedCatalog) gives its own
+        '''
+        if hasattr(self.db, 'catalog'):
+            return self.db.catalog(self.semester)
+        if self.__catalog is None or self.__catalog.semester != str(self.semester):
+            from catalog import SemesterCatalog
+            self._drop_catalog()
+            self.__catalog = SemesterCatalog.open(self.db, self.semester, self._catalog_path(), self._report_schedule_error)
+            if len(self.__catalog) == 0:
+                Alarm.warning("No course of semester %s, please update_db() first" % (self.semester))
+        return self.__catalog
+
+    def _catalog_path(self) -> Optional[str]:
+        '''
+        the catalog file is kept next to the lessons it is built from, in semester_dir if the semester has its own file, beside course.db otherwise
+        '''
+        if self.catalog_file is None:
+            return None
+        store = self.db.store()
+        directory = store.directory if store is not None and store.exists(self.semester) else os.path.dirname(self.db.path)
+        return os.path.join(directory, self.catalog_file % (self.semester))
+
+    def _drop_catalog(self) -> None:
+        '''
+        course.db changed, the catalog is loaded again when used next time
+        '''
+        if self.__catalog is not None:
+            self.__catalog.close()
+            self.__catalog = None
+
+    def find_sections(self, course_code: str = None, teacher: str = None, avoid: int = 0, meets: int = 0) -> List[Section]:
+        '''
+        sections of current semester by the indexes of the catalog, see SemesterCatalog.find()
+        >>> from catalog import slots_mask
+        >>> mytable.find_sections('CS1502', avoid=slots_mask(days=[1], times=[1, 2, 3, 4, 5]))    # not on monday morning
+        [Section(CS1502.02 计算机网络 张三 1~18周 3C102: 2(3,4,5)), ...]
+        '''
+        return self._get_catalog().find(course_code, teacher, avoid, meets)
+
+    def prefer_free(self, weeks: List[int] = None, days: List[int] = None, times: List[int] = None) -> Dict[str, List[str]]:
+        '''
+        prefer the sections NOT meeting the given slots for every course of course_code_list, see catalog.slots_mask()
+        courses whose sections all meet them, or none does, are left alone
+        return the preferred class codes of each course
+        >>> mytable.prefer_free(days=[1], times=[1, 2, 3, 4, 5])    # rather not on monday morning
+        '''
+        from catalog import slots_mask
+        avoid = slots_mask(weeks, days, times)
+        catalog = self._get_catalog()
+        preferred = {}
+        for courseCode in self.course_code_list:
+            classes = [section.classCode for section in catalog.find(courseCode)]
+            free = [section.classCode for section in catalog.find(courseCode, avoid=avoid)]
+            if free != [] and len(free) < len(classes):
+                self.add_prefer_class(free)
+                preferred[courseCode] = free
+        Alarm.success("Prefer classes free at those times of %d courses" % (len(preferred)))
+        return preferred
+
     def save_history_model(self):
-        with open('history.plk', 'wb') as f:
-            pickle.dump(self.__history_model, f, pickle.HIGHEST_PROTOCOL)
-        Alarm.success("History model saved")
-    
+        '''
+        save history_model of current semester and course_code_list, solutions already saved are skipped
+        '''
+        if self.semester == '' or self.course_code_list == []:
+            Alarm.fail("Please set semester and lessons first!")
+            return
+        cnt = self._get_history_store().add_many(self.semester, self.course_code_list, self.__history_model)
+        Alarm.success("History model saved, %d new solutions" % (cnt))
+
     def load_history_model(self):
-        with open('history.plk', 'rb') as f:
-            self.__history_model = pickle.load(f)
-        Alarm.success("History model loaded")
+        '''
+        load history_model of current semester and course_code_list
+        if course_code_list is empty, the course list of the semester solved last time is used
+        '''
+        if self.semester == '':
+            Alarm.fail("Please set semester first!")
+            return
+        store = self._get_history_store()
+        if self.course_code_list == []:
+            course_lists = store.course_lists(self.semester)
+            if course_lists == []:
+                Alarm.fail("No history of semester %s" % (self.semester))
+                raise Exception("No history of semester %s" % (self.semester))
+            self.course_code_list = course_lists[0]
+        self.__history_model = store.load(self.semester, self.course_code_list)
+        if self.__history_model == [] and os.path.exists(self.legacy_history_file):
+            cnt = store.import_pickle(self.legacy_history_file, self.semester, self.course_code_list)
+            Alarm.info("%d solutions imported from %s" % (cnt, self.legacy_history_file))
+            self.__history_model = store.load(self.semester, self.course_code_list)
+        self._reset_history_constraint()
+        Alarm.success("History model loaded, %d solutions" % (len(self.__history_model)))
     
     def list_history_model(self):
         for num in range(len(self.__history_model)):
             print(str(num) + '\t' + str(self.__history_model[num]))
         Alarm.info("History model list done")
     
-    def set_cur_class(self, select):
-        self.__cur_classes = self.__history_model[select]
-        Alarm.success("Current class table set to " + str(self.__history_model[select]))
+    def set_cur_class(self, select: Union[int, List[str]]):
+        '''
+        select a solution of history_model by its number, or give the class codes directly
+        '''
+        self.__cur_classes = self.__history_model[select] if isinstance(select, int) else list(select)
+        self.__place_table = []
+        Alarm.success("Current class table set to " + str(self.__cur_classes))
 
     def config(self):
         '''
@@ -107,57 +425,172 @@ class classTable:
         self.semester = input()
         Alarm.success("Config done!")
 
-    def login(self) -> None:
+    def _new_session(self) -> requests.Session:
+        import requests
+        # https://stackoverflow.com/a/35504626/5958455
+        from urllib3.util.retry import Retry
+        from requests.adapters import HTTPAdapter
+
+        retries = Retry(total=2,
+                        backoff_factor=0.5,
+                        status_forcelist=[500, 502, 503, 504])
+
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(max_retries=retries, pool_maxsize=max(10, self.fetch_concurrency)))
+        session.headers["User-Agent"] = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Safari/537.36 Edg/92.0.902.67"
+        if self.transport_adapter is not None:
+            session.mount("https://", self.transport_adapter)
+        if self.http_cache_file is not None:
+            from http_cache import CachingAdapter
+            session.mount("https://jw.ustc.edu.cn/", CachingAdapter(session.get_adapter("https://jw.ustc.edu.cn/"), self._get_http_cache(), self.__username))
+        return session
+
+    def _get_http_cache(self) -> HttpCache:
+        from http_cache import HttpCache
+        if self.__http_cache is None or self.__http_cache.path != self.http_cache_file:
+            self.__http_cache = HttpCache(self.http_cache_file, self.http_cache_ttl)
+        return self.__http_cache
+
+    def _get_parsed(self, kind: str, url: str, parse: Callable[[str], Any]) -> Any:
+        '''
+        GET the url and parse its text, the result is reused while the cached response is fresh, so it costs no request
+        '''
+        cache = self._get_http_cache() if self.http_cache_file is not None else None
+        if cache is not None:
+            value = cache.get_parsed(self.__username, url, kind)
+            if value is not None:
+                return value
+        r = self.__session.get(url)
+        if r.status_code != 200:
+            raise Exception("Get %s failed" % (url))
+        value = parse(r.text)
+        if cache is not None:
+            cache.put_parsed(self.__username, url, kind, r.content, value)
+        return value
+
+    def clear_http_cache(self, endpoint: str = None) -> None:
+        '''
+        drop cached responses of the endpoint, all of them if None
+        >>> mytable.clear_http_cache('semester_index')    # semester_index, lesson_page, program or plan
+        '''
+        dropped = self._get_http_cache().invalidate(endpoint)
+        Alarm.success("%d cached responses dropped" % (dropped))
+
+    def print_http_cache_stats(self) -> Dict[str, Any]:
+        stats = self._get_http_cache().stats()
+        print(json.dumps(stats, ensure_ascii=False, indent=2))
+        return stats
+
+    def _check_session(self, session: requests.Session) -> bool:
+        '''
+        check the session is logged in to jw.ustc.edu.cn, an expired session is redirected to the login page
+        '''
+        import requests
+        try:
+            # the same url as the semester-id map, it must NOT be answered by the cache
+            r = session.get("https://jw.ustc.edu.cn/for-std/lesson-search/index/24441", allow_redirects=False, timeout=10,
+                            headers={'Cache-Control': 'no-cache'})
+        except requests.RequestException:
+            return False
+        return r.status_code == 200
+
+    def _load_session(self) -> Optional[requests.Session]:
+        '''
+        return the cached session of this account if it is still valid
+        '''
+        if not os.path.exists(self.session_file):
+            return None
+        try:
+            with open(self.session_file, 'rb') as f:
+                cache = pickle.load(f)
+        except Exception:
+            return None
+        if cache.get('username') != self.__username:
+            return None
+        session = self._new_session()
+        session.cookies.update(cache['cookies'])
+        if not self._check_session(session):
+            Alarm.info("Cached session expired")
+            return None
+        return session
+
+    def _save_session(self) -> None:
+        '''
+        written to a new file readable only by you which replaces session_file, so the mode of an old file is not kept
+        '''
+        path = self.session_file + '.tmp'
+        if os.path.exists(path):
+            os.remove(path)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump({'username': self.__username, 'cookies': self.__session.cookies}, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(path, self.session_file)
+
+    def _binarize_captcha(self, img: PIL.Image.Image) -> PIL.Image.Image:
+        '''
+        pixels with g >= 40 and r < 80 become black, others become white
+        '''
+        import PIL.Image
+        from PIL import ImageChops
+        r, g, _ = img.convert('RGB').split()
+        black = ImageChops.multiply(r.point(lambda v: 255 if v < 80 else 0), g.point(lambda v: 255 if v >= 40 else 0))
+        band = ImageChops.invert(black)
+        return PIL.Image.merge('RGB', (band, band, band))
+
+    @metrics.timed('login')
+    def login(self, use_cache: bool = True, max_retry: int = 3) -> None:
         '''
         login your account
         login logic from https://github.com/iBug/thu-checkin
+        the session is cached in session_file, next login reuses it while it's still valid
+        captcha recognition may be wrong, so at most max_retry times will be tried
         '''
-        # https://stackoverflow.com/a/35504626/5958455
-        from urllib3.util.retry import Retry
-        from requests.adapters import HTTPAdapter
+        if use_cache:
+            session = self._load_session()
+            if session is not None:
+                self.__session = session
+                Alarm.success("Login Success! (cached session)")
+                return
+        import PIL.Image
+        import pytesseract
 
         CAS_LOGIN_URL = "https://passport.ustc.edu.cn/login"
         CAS_CAPTCHA_URL = "https://passport.ustc.edu.cn/validatecode.jsp?type=login"
         CAS_RETURN_URL = "https://jw.ustc.edu.cn/ucas-sso/login"
 
-        retries = Retry(total=2,
-                        backoff_factor=0.5,
-                        status_forcelist=[500, 502, 503, 504])
+        for retry in range(max_retry):
+            self.__session = self._new_session()
+            r = self.__session.get(CAS_LOGIN_URL, params={"service": CAS_RETURN_URL})
+            x = re.search(r"""<input.*?name="CAS_LT".*?>""", r.text).group(0)
+            cas_lt = re.search(r'value="(LT-\w*)"', x).group(1)
 
-        self.__session = requests.Session()
-        self.__session.mount("https://", HTTPAdapter(max_retries=retries))
-        self.__session.headers["User-Agent"] = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Safari/537.36 Edg/92.0.902.67"
-        r = self.__session.get(CAS_LOGIN_URL, params={"service": CAS_RETURN_URL})
-        x = re.search(r"""<input.*?name="CAS_LT".*?>""", r.text).group(0)
-        cas_lt = re.search(r'value="(LT-\w*)"', x).group(1)
-
-        r = self.__session.get(CAS_CAPTCHA_URL)
-        img = PIL.Image.open(io.BytesIO(r.content))
-        pix = img.load()
-        for i in range(img.size[0]):
-            for j in range(img.size[1]):
-                r, g, b = pix[i, j]
-                if g >= 40 and r < 80:
-                    pix[i, j] = (0, 0, 0)
-                else:
-                    pix[i, j] = (255, 255, 255)
-        lt_code = pytesseract.image_to_string(img).strip()
-        Alarm.success("Captcha done!")
-
-        data = {
-            "model": "uplogin.jsp",
-            "service": CAS_RETURN_URL,
-            "warn": "",
-            "showCode": "1",
-            "username": self.__username,
-            "password": self.__password,
-            "button": "",
-            "CAS_LT": cas_lt,
-            "LT": lt_code,
-        }
-        Alarm.info("Try login...")
-        r = self.__session.post(CAS_LOGIN_URL, data=data)
-        Alarm.success("Login Success!")
+            r = self.__session.get(CAS_CAPTCHA_URL)
+            with metrics.span('captcha_ocr'):
+                img = self._binarize_captcha(PIL.Image.open(io.BytesIO(r.content)))
+                lt_code = pytesseract.image_to_string(img).strip()
+            Alarm.success("Captcha done!")
+
+            data = {
+                "model": "uplogin.jsp",
+                "service": CAS_RETURN_URL,
+                "warn": "",
+                "showCode": "1",
+                "username": self.__username,
+                "password": self.__password,
+                "button": "",
+                "CAS_LT": cas_lt,
+                "LT": lt_code,
+            }
+            Alarm.info("Try login...")
+            r = self.__session.post(CAS_LOGIN_URL, data=data)
+            if self._check_session(self.__session):
+                self._save_session()
+                Alarm.success("Login Success!")
+                return
+            Alarm.warning("Login failed, retrying... (%d/%d)" % (retry + 1, max_retry))
+        self.__session = None
+        Alarm.fail("Login failed")
+        raise Exception("Login failed")
 
     def print_semester_id_map(self):
         '''
@@ -175,68 +608,262 @@ class classTable:
         +----------------+-----+
         >>> mytable.semester = "202"    # if you want to schedule class table for 2021-Summer
         '''
+        from prettytable import PrettyTable
         self._check_login()
         Alarm.info("Try get semester info...")
-        r = self.__session.get("https://jw.ustc.edu.cn/for-std/lesson-search/index/24441")
-        if r.status_code != 200:
+
+        def parse(text):
+            from bs4 import BeautifulSoup
+            soup = BeautifulSoup(text, "html.parser")
+            semester = soup.find("select", {"id": "semester"})
+            return {item.attrs['value']: item.text for item in semester.find_all("option")}
+
+        try:
+            semester_id_table = self._get_parsed('semester_map', "https://jw.ustc.edu.cn/for-std/lesson-search/index/24441", parse)
+        except Exception:
             Alarm.fail("Semester info get failed")
             raise Exception("Semester info get failed")
-        else:
-            soup = BeautifulSoup(r.text, "html.parser")
-            semester = soup.find("select", {"id": "semester"})
-            semester_id_table = {item.attrs['value']: item.text for item in semester.find_all("option")}
-            Alarm.success("Get semester info success")
+        Alarm.success("Get semester info success")
         table = PrettyTable(['semester', 'id'])
         for key, value in semester_id_table.items():
             table.add_row([value, key])
         print(table)
 
-    def _get_courses_by_semester(self, semester_id: str) -> List[Dict[str, str]]:
+    def _fetch_course_page(self, semester_id: str, page: int, page_size: int = 1000, max_retry: int = 3) -> Dict:
+        '''
+        fetch one lesson-search page, retry at most max_retry times if the page is broken
+        '''
+        import requests
+        url = "https://jw.ustc.edu.cn/for-std/lesson-search/semester/%s/search/24441?queryPage__=%d%%2C%d&sort__=code%%2Casc" % (semester_id, page, page_size)
+        for retry in range(max_retry):
+            with metrics.span('fetch_page'):
+                r = self.__session.get(url)
+            if r.status_code == 200:
+                try:
+                    with metrics.span('json_decode'):
+                        page_json = json.loads(r.text)
+                    metrics.count('pages')
+                    return page_json
+                except ValueError:
+                    pass
+            metrics.count('page_retries')
+            Alarm.info("Page %d failed, retrying... (%d/%d)" % (page, retry + 1, max_retry))
+        Alarm.fail("Courses get failed")
+        raise Exception("Courses get failed")
+
+    def search_lessons(self, semester_id: str, course_code: str) -> List[Dict]:
+        '''
+        lessons of one course by a narrow lesson-search query, a few rows instead of the whole semester
+        raise Exception if the page is broken, the caller decides whether to retry
+        '''
+        from urllib.parse import quote
+        self._check_login()
+        url = "https://jw.ustc.edu.cn/for-std/lesson-search/semester/%s/search/24441?codeLike=%s&queryPage__=1%%2C1000&sort__=code%%2Casc" % (semester_id, quote(course_code))
+        with metrics.span('fetch_lessons'):
+            r = self.__session.get(url, timeout=10)
+        if r.status_code != 200:
+            raise Exception("Lessons of %s get failed, status %d" % (course_code, r.status_code))
+        try:
+            lessons = json.loads(r.text)['data']
+        except (ValueError, KeyError):
+            raise Exception("Lessons of %s get failed, broken page" % (course_code))
+        # codeLike also matches longer codes, e.g. CS1502 matches CS15021
+        return [item for item in lessons if item['course']['code'] == course_code]
+
+    def watch_seats(self, interval: float = 60.0, polls: int = None, all_classes: bool = False, jsonl: str = None,
+                    callback: Callable[[Dict], None] = None, rate: float = 1.0) -> Dict[str, Tuple[int, int]]:
+        '''
+        poll stdCount / limitCount of the classes of current class table (every class of course_code_list if all_classes
+        or there is no current class table) until Ctrl-C, see seat_watcher.py
+        changes are told by Alarm, and appended to jsonl as json lines if set
+        return the seats of the last poll, class code -> (stdCount, limitCount)
+        >>> mytable.watch_seats(interval=30, jsonl='seats.jsonl')
+        '''
+        from seat_watcher import SeatWatcher
+        self._check_login()
+        if self.semester == '':
+            Alarm.fail("Please set semester first!")
+            raise Exception("Please set semester first!")
+        if self.__cur_classes != [] and not all_classes:
+            classes = list(self.__cur_classes)
+            class_list = self._get_catalog().get_classes(self.semester, classes, ['courseCode'])
+            courses = [class_list[class_id][0] if class_id in class_list else class_id.split('.')[0] for class_id in classes]
+        else:
+            classes = None
+            courses = list(self.course_code_list)
+        if courses == []:
+            Alarm.fail("Nothing to watch, please set lessons or a class table first")
+            raise Exception("Nothing to watch")
+
+        def tell(event):
+            seats = "%s/%s" % (event.get('stdCount'), event.get('limitCount'))
+            msg = "%s %s %s: %s" % (event['classCode'], event.get('courseName', ''), event['event'], seats)
+            if event['event'] == 'opened':
+                Alarm.success(msg)
+            elif event['event'] in ['filled', 'removed']:
+                Alarm.warning(msg)
+            else:
+                Alarm.info(msg)
+            if callback is not None:
+                callback(event)
+
+        watcher = SeatWatcher(self, self.semester, courses, classes, tell, jsonl, rate)
+        Alarm.info("Watching %d courses every %ss, press Ctrl-C to stop" % (len(watcher.courses), interval))
+        watcher.run(interval, polls)
+        return watcher.snapshot
+
+    def _iter_courses_by_semester(self, semester_id: str, concurrency: int = None, max_retry: int = 3) -> Iterator[List[Dict]]:
+        '''
+        yield lesson pages of the semester as soon as they arrive
+        pages are fetched by a thread pool with at most `concurrency` requests in flight,
+        so the order of the yielded pages is NOT guaranteed
+        '''
+        from concurrent.futures import ThreadPoolExecutor, as_completed
         if semester_id == None or semester_id == "":
             Alarm.fail("Semester id is empty")
             raise Exception("Semester id is empty")
-        r = self.__session.get("https://jw.ustc.edu.cn/for-std/lesson-search/semester/%s/search/24441?queryPage__=1%%2C1&sort__=code%%2Casc" % (semester_id))
-        if r.status_code != 200:
-            print("Courses get failed")
-            raise Exception("Courses get failed")
-        course_cnt = json.loads(r.text)['_page_']['totalRows']
+        if concurrency is None:
+            concurrency = self.fetch_concurrency
+        course_cnt = self._fetch_course_page(semester_id, 1, 1, max_retry)['_page_']['totalRows']
         Alarm.info("Course cnt: %d" % (course_cnt))
-        course_info_list = []
-        page_cnt = 1
-        max_retry = 3
-        while(course_cnt - (page_cnt - 1) * 1000> 0):
-            Alarm.info("Try get courses page %d" % (page_cnt))
-            r = self.__session.get("https://jw.ustc.edu.cn/for-std/lesson-search/semester/%s/search/24441?queryPage__=%s%%2C1000&sort__=code%%2Casc" % (semester_id, str(page_cnt)))
-            if r.status_code != 200:
-                Alarm.fail("Courses get failed")
-                raise Exception("Courses get failed")
-            else:
+        page_total = (course_cnt + 999) // 1000
+        if page_total == 0:
+            return
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, page_total))) as executor:
+            futures = {executor.submit(self._fetch_course_page, semester_id, page, 1000, max_retry): page for page in range(1, page_total + 1)}
+            try:
+                for future in as_completed(futures):
+                    Alarm.info("Got courses page %d" % (futures[future]))
+                    yield future.result()['data']
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def _stream_course_page(self, semester_id: str, page: int, page_size: int = 1000, max_retry: int = 3, batch_size: int = None) -> Iterator[List[Tuple]]:
+        '''
+        decode one lesson-search page while downloading it, yield rows of courses table in batches
+        only the fields stored are kept, the lesson json is dropped as soon as its batch is converted
+        a broken page is fetched again, so rows already yielded may be yielded again
+        '''
+        import requests
+        batch_size = batch_size or self.insert_batch_size
+        url = "https://jw.ustc.edu.cn/for-std/lesson-search/semester/%s/search/24441?queryPage__=%d%%2C%d&sort__=code%%2Casc" % (semester_id, page, page_size)
+        for retry in range(max_retry):
+            try:
+                with metrics.span('fetch_page'):
+                    r = self.__session.get(url, stream=True)
+                with r:
+                    if r.status_code == 200:
+                        lessons = iter_json_array(r.iter_content(65536), 'data')
+                        while True:
+                            # the page is decoded while it is read, so this includes waiting for the download
+                            with metrics.span('json_decode'):
+                                batch = list(itertools.islice(lessons, batch_size))
+                            if batch == []:
+                                break
+                            yield self._lessons_to_rows(batch)
+                        metrics.count('pages')
+                        return
+            except (ValueError, requests.RequestException):
+                pass
+            metrics.count('page_retries')
+            Alarm.info("Page %d failed, retrying... (%d/%d)" % (page, retry + 1, max_retry))
+        Alarm.fail("Courses get failed")
+        raise Exception("Courses get failed")
+
+    def _iter_course_rows(self, semester_id: str, concurrency: int = None, max_retry: int = 3, batch_size: int = None) -> Iterator[List[Tuple]]:
+        '''
+        yield rows of courses table of the semester in batches as soon as they are decoded
+        with stream_json, pages are streamed by a thread pool into a bounded queue,
+        otherwise whole pages from _iter_courses_by_semester() are converted
+        '''
+        from concurrent.futures import ThreadPoolExecutor
+        batch_size = batch_size or self.insert_batch_size
+        if not self.stream_json:
+            for page_info in self._iter_courses_by_semester(semester_id, concurrency, max_retry):
+                for start in range(0, len(page_info), batch_size):
+                    yield self._lessons_to_rows(page_info[start:start + batch_size])
+            return
+        if semester_id == None or semester_id == "":
+            Alarm.fail("Semester id is empty")
+            raise Exception("Semester id is empty")
+        if concurrency is None:
+            concurrency = self.fetch_concurrency
+        course_cnt = self._fetch_course_page(semester_id, 1, 1, max_retry)['_page_']['totalRows']
+        Alarm.info("Course cnt: %d" % (course_cnt))
+        page_total = (course_cnt + 999) // 1000
+        if page_total == 0:
+            return
+        workers = max(1, min(concurrency, page_total))
+        batches = queue.Queue(maxsize=workers * 2)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
                 try:
-                    course_info_list += json.loads(r.text)['data']
-                except:
-                    max_retry -= 1
-                    if max_retry == 0:
-                        Alarm.fail("Courses get failed")
-                        raise Exception("Courses get failed")
-                    else:
-                        Alarm.info("Page %d failed, retrying..." % (page_cnt))
-                        continue
-            page_cnt += 1
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def worker(page):
+            try:
+                for batch in self._stream_course_page(semester_id, page, 1000, max_retry, batch_size):
+                    if not put(('rows', batch)):
+                        return
+                put(('done', page))
+            except Exception as e:
+                put(('error', e))
+
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            for page in range(1, page_total + 1):
+                executor.submit(worker, page)
+            remaining = page_total
+            while remaining > 0:
+                kind, payload = batches.get()
+                if kind == 'rows':
+                    yield payload
+                elif kind == 'done':
+                    remaining -= 1
+                    Alarm.info("Got courses page %d" % (payload))
+                else:
+                    raise payload
+        finally:
+            stop.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _get_courses_by_semester(self, semester_id: str, concurrency: int = None, max_retry: int = 3) -> List[Dict[str, str]]:
+        course_info_list = []
+        for page in self._iter_courses_by_semester(semester_id, concurrency, max_retry):
+            course_info_list += page
         Alarm.success("Get courses success, get %d courses" % (len(course_info_list)))
         return course_info_list
 
     def drop_database(self):
         '''
         drop class info database
-        the database save in the same folder as this file with name "course.db"
+        the database is self.db.path ("course.db" by default), with the files of semesters in semester_dir
+        use prune_semesters() to drop old semesters only
         '''
-        if os.path.exists("course.db"):
+        store = self._get_semester_store()
+        semester_ids = store.semesters() if store is not None else []
+        if os.path.exists(self.db.path) or semester_ids != []:
             Alarm.warning("Database exists, pls type 'Yes, Sure' to drop it")
             safe_word = input()
             if(safe_word != "Yes, Sure"):
                 Alarm.success("Drop database cancelled")
                 return
-            con = sqlite3.connect('course.db')
+            self.db.close()
+            for semester_id in semester_ids:
+                store.remove(semester_id)
+            self.__solver = None
+            self._drop_catalog()
+            if not os.path.exists(self.db.path):
+                Alarm.success("Database drop success")
+                return
+            con = sqlite3.connect(self.db.path)
             cur = con.cursor()
             try:
                 cur.execute('''DELETE FROM courses''')
@@ -248,127 +875,441 @@ class classTable:
     def _prepare_database(self):
         '''
         make sure the database exists, if not then create it
+        old databases without primary key will be migrated, duplicated rows are merged
         '''
         Alarm.info("Prepare database...")
-        if not os.path.exists("course.db"):
-            con = sqlite3.connect('course.db')
-            cur = con.cursor()
-            # Create table
-            cur.execute('''CREATE TABLE courses
-                        (id integer, 
-                        classCode text, 
-                        courseCode text, 
-                        courseName text, 
-                        credits real, 
-                        suggestScheduleWeeks text, 
-                        semester integer, 
-                        teacher text, 
-                        timeTotal real,
-                        timeTheory real,
-                        timeExperiment real,
-                        curNum integer,
-                        maxNum integer,
-                        scheduleWeek text,
-                        scheduleTime text)''')
+        con = sqlite3.connect(self.db.path)
+        cur = con.cursor()
+        try:
+            # WAL is persistent, readers are not blocked while a semester is being written
+            cur.execute("PRAGMA journal_mode=WAL")
+            columns = cur.execute("PRAGMA table_info(courses)").fetchall()
+            exist_columns = [column[1] for column in columns]
+            if columns == []:
+                cur.execute(COURSE_TABLE_SQL % ("courses"))
+                Alarm.success("Database created")
+            elif not any(column[5] for column in columns):
+                Alarm.warning("Database has no primary key, migrating...")
+                cur.execute(COURSE_TABLE_SQL % ("courses_new"))
+                # keep the last inserted row of each (semester, id)
+                cur.execute("INSERT OR REPLACE INTO courses_new (%s) SELECT %s FROM courses ORDER BY rowid" % (
+                    ', '.join(exist_columns), ', '.join(exist_columns)))
+                cur.execute("DROP TABLE courses")
+                cur.execute("ALTER TABLE courses_new RENAME TO courses")
+                Alarm.success("Database migrated")
+            else:
+                for column, column_type in COURSE_SCHEMA:
+                    if column not in exist_columns:
+                        cur.execute("ALTER TABLE courses ADD COLUMN %s %s" % (column, column_type))
+                        Alarm.info("Column %s added" % (column))
+            # lessons stored before scheduleMask existed
+            rows = cur.execute("SELECT scheduleWeek, scheduleTime, semester, id FROM courses WHERE scheduleMask IS NULL").fetchall()
+            masks, errors = parse_masks((row[0], row[1]) for row in rows)
+            for e in errors:
+                self._report_schedule_error(e)
+            cur.executemany("UPDATE courses SET scheduleMask = ? WHERE semester = ? AND id = ?",
+                            [(mask_to_blob(mask), row[2], row[3]) for mask, row in zip(masks, rows) if mask is not None])
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_courses_course_code ON courses (courseCode, semester)")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_courses_class_code ON courses (classCode, semester)")
             con.commit()
+        finally:
             con.close()
-            Alarm.success("Database created")
+
+    def _lessons_to_rows(self, items: List[Dict]) -> List[Tuple]:
+        '''
+        rows of a batch of lessons, timed as one schedule_parse span since parsing the schedule takes most of it
+        '''
+        with metrics.span('schedule_parse'):
+            return [self._lesson_to_row(item) for item in items]
+
+    def _lesson_to_row(self, item: Dict) -> Tuple:
+        '''
+        convert one lesson json from lesson-search to a row of courses table
+        '''
+        if item['teacherAssignmentList'] != []:
+            teacher = item['teacherAssignmentList'][0]['teacher']['person']['nameZh']
+        else:
+            teacher = None
+        row = (
+            item['id'], 
+            item['code'], 
+            item['course']['code'], 
+            item['course']['nameZh'], 
+            item['course']['credits'], 
+            json.dumps(item['suggestScheduleWeeks']), 
+            item['semester']['id'], 
+            teacher, 
+            item['requiredPeriodInfo']['total'], 
+            item['requiredPeriodInfo']['theory'], 
+            item['requiredPeriodInfo']['practice'],
+            item['stdCount'],
+            item['limitCount'],
+            item['scheduleText']['dateTimeText']['text'],
+            item['scheduleText']['dateTimePlaceText']['text'],
+        )
+        return row + (hashlib.sha1(json.dumps(row, ensure_ascii=False).encode()).hexdigest(), self._schedule_mask(row[13], row[14]))
+
+    def _report_schedule_error(self, e: ScheduleError) -> None:
+        '''
+        warn once for each malformed schedule text
+        '''
+        metrics.count('schedule_errors')
+        key = (e.scheduleWeek, e.scheduleTime)
+        if key not in self.__schedule_errors:
+            self.__schedule_errors[key] = e.reason
+            Alarm.warning(str(e))
+
+    def _schedule_mask(self, scheduleWeek: str, scheduleTime: str) -> Optional[bytes]:
+        '''
+        return the occupancy bitmask of the schedule text as blob, None if it can't be parsed
+        '''
+        try:
+            return mask_to_blob(schedule_mask(scheduleWeek, scheduleTime))
+        except ScheduleError as e:
+            self._report_schedule_error(e)
+            return None
+
+    def _course_mask(self, course: Tuple) -> int:
+        '''
+        occupancy bitmask of a course row (scheduleWeek, scheduleTime, ..., scheduleMask)
+        parse the schedule text only if the mask is not stored, raise ScheduleError if it can't be parsed
+        '''
+        if course[-1] is not None:
+            return blob_to_mask(course[-1])
+        return schedule_mask(course[0], course[1])
 
     def update_db(self, semester_id: str):
         '''
         add all course info in the new semester to the database
+        lessons already in the database are updated, so it is safe to run it again
         '''
         self._check_login()
         if self.semester == '':
             Alarm.fail("Please set semester first!")
             return
+        if self._get_semester_store() is not None:
+            if self.refresh_semesters([semester_id])[str(semester_id)] is not None:
+                Alarm.success("Database updated")
+            return
         self._prepare_database()
-        courses_info_list = self._get_courses_by_semester(semester_id)
-        con = sqlite3.connect('course.db')
+        con = sqlite3.connect(self.db.path)
         cur = con.cursor()
+        course_cnt = 0
         try:
-            for item in tqdm(courses_info_list):
-                if item['teacherAssignmentList'] != []:
-                    teacher = item['teacherAssignmentList'][0]['teacher']['person']['nameZh']
-                else:
-                    teacher = None
-                cur.execute("INSERT INTO courses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
-                        item['id'], 
-                        item['code'], 
-                        item['course']['code'], 
-                        item['course']['nameZh'], 
-                        item['course']['credits'], 
-                        json.dumps(item['suggestScheduleWeeks']), 
-                        item['semester']['id'], 
-                        teacher, 
-                        item['requiredPeriodInfo']['total'], 
-                        item['requiredPeriodInfo']['theory'], 
-                        item['requiredPeriodInfo']['practice'],
-                        item['stdCount'],
-                        item['limitCount'],
-                        item['scheduleText']['dateTimeText']['text'],
-                        item['scheduleText']['dateTimePlaceText']['text'],
-                    )
-                )
+            # the whole semester is written in one transaction
+            # insert each batch as soon as it is decoded, the rest pages are still downloading
+            for rows in self._iter_course_rows(semester_id):
+                with metrics.span('insert'):
+                    cur.executemany(COURSE_UPSERT_SQL, rows)
+                metrics.count('rows', len(rows))
+                course_cnt += len(rows)
+            con.commit()
+            self.__solver = None
+            Alarm.success("Get courses success, get %d courses" % (course_cnt))
         except Exception as e:
-            Alarm.warning("some error occured, pls check")
-            print(item, e)
+            con.rollback()
+            Alarm.warning("some error occured, pls check: %s" % (e))
+            return
         finally:
-            con.commit()
             con.close()
+        self._drop_catalog()
         Alarm.success("Database updated")
 
-    def _get_courses_info(self) -> Dict[str, list]:
-        Alarm.info("Extracting schedule...")
-        con = sqlite3.connect('course.db')
+    def refresh_db(self, semester_id: str) -> Dict[str, list]:
+        '''
+        refresh a semester which is already in the database
+        only lessons inserted, changed (stdCount, limitCount, schedule, teacher...) or removed are written
+        return the id of those lessons
+        >>> mytable.refresh_db('141')
+        {'inserted': [], 'changed': [139236, 139240], 'removed': []}
+        a semester having its own file is updated by refresh_semesters()
+        '''
+        self._check_login()
+        if self.semester == '':
+            Alarm.fail("Please set semester first!")
+            return
+        if self._get_semester_store() is not None:
+            return self.refresh_semesters([semester_id])[str(semester_id)]
+        self._prepare_database()
+        con = sqlite3.connect(self.db.path)
         cur = con.cursor()
-        course_list = {}
-        for courseCode in tqdm(self.course_code_list):
+        summary = {'inserted': [], 'changed': [], 'removed': []}
+        try:
+            stored = dict(cur.execute("SELECT id, rowHash FROM courses WHERE semester = ?", (int(semester_id),)).fetchall())
+            seen = set()
+            for batch in self._iter_course_rows(semester_id):
+                rows = []
+                for row in batch:
+                    # a retried page yields its rows again
+                    if row[0] in seen:
+                        continue
+                    seen.add(row[0])
+                    if row[0] not in stored:
+                        summary['inserted'].append(row[0])
+                    elif stored[row[0]] != row[COURSE_COLUMNS.index('rowHash')]:
+                        summary['changed'].append(row[0])
+                    else:
+                        continue
+                    rows.append(row)
+                with metrics.span('insert'):
+                    cur.executemany(COURSE_UPSERT_SQL, rows)
+                metrics.count('rows', len(batch))
+                metrics.count('rows_written', len(rows))
+            # only reached when every page is fetched, so missing lessons are really removed
+            summary['removed'] = [lesson_id for lesson_id in stored if lesson_id not in seen]
+            cur.executemany("DELETE FROM courses WHERE semester = ? AND id = ?", [(int(semester_id), lesson_id) for lesson_id in summary['removed']])
+            con.commit()
+            if summary['inserted'] or summary['changed'] or summary['removed']:
+                self.__solver = None
+        except Exception as e:
+            con.rollback()
+            Alarm.warning("some error occured, pls check: %s" % (e))
+            return
+        finally:
+            con.close()
+        self._drop_catalog()
+        Alarm.success("Database refreshed, %d inserted, %d changed, %d removed" % (
+            len(summary['inserted']), len(summary['changed']), len(summary['removed'])))
+        return summary
+
+    def _get_semester_store(self) -> Optional[SemesterStore]:
+        '''
+        files of the semesters db reads from, None if every semester is kept in course.db
+        '''
+        return self.db.store() if hasattr(self.db, 'store') else None
+
+    def _legacy_semester(self, semester_id: str, columns: List[str]) -> List[Tuple]:
+        '''
+        rows of the semester still in the courses table of course.db
+        '''
+        if not os.path.exists(self.db.path):
+            return []
+        con = sqlite3.connect(self.db.path)
+        try:
+            if con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'courses'").fetchone() is None:
+                return []
+            return con.execute("SELECT %s FROM courses WHERE semester = ? ORDER BY id" % (', '.join(columns)), (int(semester_id),)).fetchall()
+        finally:
+            con.close()
+
+    def _drop_legacy_semesters(self, semester_ids: List[str]) -> int:
+        '''
+        delete the semesters moved to their own files from course.db, return the lessons deleted
+        '''
+        if semester_ids == [] or not os.path.exists(self.db.path):
+            return 0
+        con = sqlite3.connect(self.db.path)
+        try:
+            if con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'courses'").fetchone() is None:
+                return 0
+            cur = con.executemany("DELETE FROM courses WHERE semester = ?", [(int(semester_id),) for semester_id in semester_ids])
+            con.commit()
+            return cur.rowcount
+        finally:
+            con.close()
+
+    def _refresh_semester(self, store: SemesterStore, semester_id: str, concurrency: int = None, rebuild: bool = False) -> Dict[str, list]:
+        '''
+        download the semester and write only the lessons inserted or changed into its file, those removed are deleted
+        the file is built into a new table replacing the old one when every page is written if it has no file yet or rebuild,
+        a semester still in course.db is compared with the lessons there
+        '''
+        if store.exists(semester_id) and not rebuild:
+            writing = store.update(semester_id)
+        else:
+            stored = dict(self._legacy_semester(semester_id, ['id', 'rowHash'])) if not store.exists(semester_id) else None
+            writing = store.replace(semester_id, stored)
+        with writing as writer:
+            for rows in self._iter_course_rows(semester_id, concurrency):
+                with metrics.span('insert'):
+                    writer.write(rows)
+                metrics.count('rows', len(rows))
+        metrics.count('rows_written', writer.rows)
+        return writer.summary
+
+    @metrics.timed('refresh_semesters')
+    def refresh_semesters(self, semester_ids: List[str], concurrency: int = None, rebuild: bool = False) -> Dict[str, Optional[Dict[str, list]]]:
+        '''
+        download several semesters at the same time over the logged in session, each into its own file, see semester_store.py
+        a semester is changed at once after all of its pages are written, so readers never see it half loaded
+        rebuild: build the files again from scratch instead of writing the changed lessons only
+        return the summary of each semester like refresh_db(), None if it failed, a failed semester is kept as it was
+        >>> mytable.refresh_semesters(['121', '141'])
+        {'121': {'inserted': [], 'changed': [], 'removed': []}, '141': {'inserted': [], 'changed': [139236], 'removed': []}}
+        '''
+        from concurrent.futures import ThreadPoolExecutor
+        self._check_login()
+        semester_ids = list(dict.fromkeys(str(semester_id) for semester_id in semester_ids))
+        store = self._get_semester_store()
+        if store is None:
+            return {semester_id: self.refresh_db(semester_id) for semester_id in semester_ids}
+        workers = max(1, min(concurrency or self.semester_concurrency, len(semester_ids)))
+        page_concurrency = max(1, self.fetch_concurrency // workers)
+        Alarm.info("Refreshing semester %s, %d at the same time..." % (', '.join(semester_ids), workers))
+        results = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {semester_id: executor.submit(self._refresh_semester, store, semester_id, page_concurrency, rebuild) for semester_id in semester_ids}
+            for semester_id, future in futures.items():
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    Alarm.warning("Semester %s refresh failed, it is kept as it was: %s" % (semester_id, e))
+                    results[semester_id] = None
+                    continue
+                results[semester_id] = summary
+                Alarm.success("Semester %s refreshed, %d inserted, %d changed, %d removed" % (
+                    semester_id, len(summary['inserted']), len(summary['changed']), len(summary['removed'])))
+        refreshed = [semester_id for semester_id, summary in results.items() if summary is not None]
+        moved = self._drop_legacy_semesters(refreshed)
+        if moved > 0:
+            Alarm.info("%d lessons of semester %s moved out of course.db" % (moved, ', '.join(refreshed)))
+        if refreshed != []:
+            self.__solver = None
+            self._drop_catalog()
+        return results
+
+    def split_database(self) -> List[str]:
+        '''
+        move every semester in the courses table of course.db into its own file, then vacuum course.db
+        it's needed once for a course.db of old versions, return the semesters moved
+        '''
+        store = self._get_semester_store()
+        if store is None or not os.path.exists(self.db.path):
+            return []
+        con = sqlite3.connect(self.db.path)
+        try:
+            if con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'courses'").fetchone() is None:
+                return []
+            semester_ids = [str(row[0]) for row in con.execute("SELECT DISTINCT semester FROM courses ORDER BY semester").fetchall()]
+        finally:
+            con.close()
+        moved = []
+        for semester_id in semester_ids:
+            if store.exists(semester_id):
+                Alarm.warning("Semester %s already has its own file, its lessons in course.db are dropped" % (semester_id))
+            else:
+                with store.replace(semester_id) as writer:
+                    writer.write(self._legacy_semester(semester_id, COURSE_COLUMNS))
+                Alarm.info("Semester %s moved, %d lessons" % (semester_id, writer.rows))
+            moved.append(semester_id)
+        self._drop_legacy_semesters(moved)
+        con = sqlite3.connect(self.db.path)
+        try:
+            con.execute("VACUUM")
+        finally:
+            con.close()
+        self.db.close()
+        self._drop_catalog()
+        Alarm.success("Database split, %d semesters moved to %s" % (len(moved), store.directory))
+        return moved
+
+    def prune_semesters(self, keep: int) -> List[str]:
+        '''
+        remove the files of all but the newest `keep` semesters, return the semesters removed
+        semesters still in course.db are not touched, use split_database() first
+        >>> mytable.prune_semesters(4)
+        ['101', '102']
+        '''
+        store = self._get_semester_store()
+        if store is None:
+            Alarm.fail("Semesters are kept in course.db, nothing to prune")
+            return []
+        semester_ids = store.semesters()
+        removed = semester_ids[:max(0, len(semester_ids) - keep)]
+        # connections of the removed files are dropped
+        self.db.close()
+        freed = sum(store.remove(semester_id) for semester_id in removed)
+        if str(self.semester) in removed:
+            self.__solver = None
+            self._drop_catalog()
+        Alarm.success("Pruned %d semesters, %d bytes freed" % (len(removed), freed))
+        return removed
+
+    def vacuum_semesters(self, semester_ids: List[str] = None) -> Dict[str, Tuple[int, int]]:
+        '''
+        vacuum the file of each semester (all if None) one by one, return bytes before and after of each
+        '''
+        store = self._get_semester_store()
+        if store is None:
+            Alarm.fail("Semesters are kept in course.db, nothing to vacuum")
+            return {}
+        result = {}
+        for semester_id in semester_ids if semester_ids is not None else store.semesters():
+            if not store.exists(semester_id):
+                Alarm.warning("Semester %s has no file" % (semester_id))
+                continue
+            result[str(semester_id)] = store.vacuum(semester_id)
+            Alarm.info("Semester %s vacuumed, %d -> %d bytes" % (semester_id, *result[str(semester_id)]))
+        return result
+
+    def print_semester_stats(self) -> List[Dict[str, Any]]:
+        '''
+        lessons and bytes of every semester, and where it is stored
+        '''
+        from prettytable import PrettyTable
+        stats = []
+        store = self._get_semester_store()
+        if store is not None:
+            for semester_id in store.semesters():
+                stats.append({'semester': semester_id, 'lessons': store.count(semester_id), 'bytes': store.size(semester_id), 'stored': store.path(semester_id)})
+        if os.path.exists(self.db.path):
+            con = sqlite3.connect(self.db.path)
             try:
-                result = cur.execute("SELECT scheduleWeek, scheduleTime, courseName, classCode FROM courses WHERE courseCode = '%s' AND semester = '%s'" % (courseCode, self.semester)).fetchall()
-                course_list[courseCode] = result
-            except sqlite3.OperationalError as e:
-                Alarm.fail("Error with course code: %s" % (courseCode))
+                if con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'courses'").fetchone() is not None:
+                    for semester_id, cnt in con.execute("SELECT semester, COUNT(*) FROM courses GROUP BY semester").fetchall():
+                        stats.append({'semester': str(semester_id), 'lessons': cnt, 'bytes': None, 'stored': self.db.path})
+            finally:
+                con.close()
+        table = PrettyTable(['semester', 'lessons', 'bytes', 'stored'])
+        for item in sorted(stats, key=lambda item: int(item['semester'])):
+            table.add_row([item['semester'], item['lessons'], item['bytes'] if item['bytes'] is not None else '', item['stored']])
+        print(table)
+        return stats
+
+    def _get_courses_info(self) -> Dict[str, list]:
+        Alarm.info("Extracting schedule...")
+        try:
+            course_list = self._get_catalog().get_courses(self.semester, self.course_code_list, ['scheduleWeek', 'scheduleTime', 'courseName', 'classCode', 'teacher', 'scheduleMask'])
+        except sqlite3.OperationalError as e:
+            Alarm.fail("Error with course code: %s" % (', '.join(self.course_code_list)))
+            return {courseCode: [] for courseCode in self.course_code_list}
+        for courseCode, classes in course_list.items():
+            if classes == []:
+                Alarm.warning("No such course: %s" % (courseCode))
                 continue
-        con.close()
+            course_list[courseCode] = self._drop_bad_schedules(classes)
+            if course_list[courseCode] == []:
+                Alarm.warning("No class of %s has a valid schedule" % (courseCode))
         Alarm.success("Schedule extracted")
         return course_list
 
+    def _drop_bad_schedules(self, classes: List[Tuple]) -> List[Tuple]:
+        '''
+        return the classes without those whose schedule can't be parsed, so one malformed class doesn't abort the solve
+        '''
+        return [course for course in classes if self._checked_mask(course, course[3]) is not None]
+
+    def _checked_mask(self, course: Tuple, class_code: str) -> Optional[int]:
+        '''
+        same as _course_mask(), but warn and return None if the schedule can't be parsed, the class is then skipped
+        '''
+        try:
+            return self._course_mask(course)
+        except ScheduleError as e:
+            metrics.count('schedule_errors')
+            Alarm.warning("Class %s dropped, malformed schedule %r / %r: %s" % (class_code, e.scheduleWeek, e.scheduleTime, e.reason))
+            return None
+
     def _extract_schedule(self, course: Tuple[str]):
-        if len(course[0].split(';')) != len(course[1].split(';')):
-            places_raw = zip(course[0].split(';') * len(course[1].split(';')), course[1].split(';'))
-        else:
-            places_raw = zip(course[0].split(';'), course[1].split(';'))
-        schedule = []
-        for weeks_raw, places in places_raw:
-            week_list = []
-            # split ','
-            t = weeks_raw.split(',')
-            for week_string in t:
-                week = re.findall(r'\d+', week_string)
-                if len(week) == 1:
-                    week_list += [int(week[0])]
-                elif len(week) == 2:
-                    if re.findall(r'单', week_string):
-                        week_list += [item for item in list(range(int(week[0]), int(week[1]) + 1)) if item % 2 == 1]
-                    elif re.findall(r'双', week_string):
-                        week_list += [item for item in list(range(int(week[0]), int(week[1]) + 1)) if item % 2 == 0]
-                    else:
-                        week_list += list(range(int(week[0]), int(week[1]) + 1))
-                else:
-                    print(week)
-                    raise Exception("week error")
-
-            room, day_time = places.split(':')
-            # print(room)
-            day = int(re.findall(r'\d+', day_time)[0])
-            day_lessons = re.findall(r'\d+', re.findall(r'\(.*\)', day_time)[0])
-            places_list = [(day, int(item)) for item in day_lessons]
-            schedule.append((week_list, places_list))
-            
+        '''
+        return ([(week list, [(day, period)])], course name, class code) of a course row (scheduleWeek, scheduleTime, courseName, classCode, ...)
+        '''
+        schedule = [(list(weeks), list(days)) for weeks, days in parse_schedule(course[0], course[1])]
         return schedule, course[2], course[3]
 
-    def _add_constraint(self, course_list: Dict[str, list]) -> z3.And():
+    @metrics.timed('constraint_build')
+    def _add_constraint(self, course_list: Dict[str, list], with_history: bool = True, with_prefer: bool = True) -> z3.And():
+        import z3
         Alarm.info("Adding constraint...")
         if course_list == []:
             Alarm.fail("No course")
@@ -377,48 +1318,45 @@ class classTable:
         # class code var
         ClassVar = {}
         cnt = 0
-        # class place var
-        __place_table = [[[[] for time in range(1, 14)] for week in range(1, 8)] for week in range(1, 19)]
         for courseCode in self.course_code_list:
             class_map[courseCode] = {}
             for course in course_list[courseCode]:
-                class_map[courseCode][cnt] = self._extract_schedule(course)
+                class_map[courseCode][cnt] = (self._course_mask(course), course[2], course[3])
                 ClassVar[cnt] = z3.Bool('%s_%i' % (class_map[courseCode][cnt][2], cnt))
-                schedule_list , _, _ = class_map[courseCode][cnt]
-                for weeks, days in schedule_list:
-                    for week in weeks:
-                        for day, time in days:
-                            try:
-                                __place_table[week-1][day-1][time-1].append(ClassVar[cnt])
-                            except Exception as e:
-                                print(week, day, time)
                 cnt += 1
+        self.__class_var = {class_schedule[2]: ClassVar[class_id] for cur_classes in class_map.values() for class_id, class_schedule in cur_classes.items()}
+        # class place var
+        conflict_graph = ConflictGraph({class_id: class_schedule[0] for cur_classes in class_map.values() for class_id, class_schedule in cur_classes.items()})
 
         place_constraint_list = []
-        for week in __place_table:
-            for day in week:
-                for time in day:
-                    one_place_constraint_list = []
-                    if len(time) > 1:
-                        for lesson in time:
-                            one_place_constraint_list.append(z3.And(lesson, z3.And([z3.Not(k) for k in time if k.get_id() != lesson.get_id()])))
-                        place_constraint_list.append(z3.Or(z3.Or(one_place_constraint_list), z3.And([z3.Not(k) for k in time])))
+        # classes sharing one slot, at most one of them can be chosen
+        for clique in conflict_graph.cliques():
+            time = [ClassVar[k] for k in clique]
+            if self.encoding == 'compact':
+                place_constraint_list.append(z3.AtMost(*time, 1))
+                continue
+            one_place_constraint_list = []
+            for lesson in time:
+                one_place_constraint_list.append(z3.And(lesson, z3.And([z3.Not(k) for k in time if k.get_id() != lesson.get_id()])))
+            place_constraint_list.append(z3.Or(z3.Or(one_place_constraint_list), z3.And([z3.Not(k) for k in time])))
         place_constraint = z3.And(place_constraint_list)
         Alarm.info("Place constraint added")
 
         history_constraint_list = []
-        for history in self.__history_model:
-            one_history_constraint_list = []
-            for item in history:
-                for num in ClassVar:
-                    if item == str(ClassVar[num]).split('_')[0]:
-                        one_history_constraint_list.append(ClassVar[num])
-            history_constraint_list.append(z3.Not(z3.And(one_history_constraint_list)))
+        if with_history:
+            for history in self.__history_model:
+                history_constraint_list.append(self._block_clause(history))
         history_constraint = z3.And(history_constraint_list)
         Alarm.info("History constraint added")
 
         lesson_constraint_list = []
         for courseCode, cur_classes in class_map.items():
+            if self.encoding == 'compact':
+                if cur_classes == {}:
+                    lesson_constraint_list.append(z3.BoolVal(False))
+                else:
+                    lesson_constraint_list.append(z3.PbEq([(ClassVar[class_id], 1) for class_id in cur_classes], 1))
+                continue
             one_class_constraint_list = []
             for class_id, class_schedule in cur_classes.items():
                 # choose one class must not choose other same class
@@ -430,73 +1368,339 @@ class classTable:
 
         prefer_constraint_list = []
         not_prefer_constraint_list = []
+        # class code -> var lookup, blocking clauses of history use it as well
         for classTuple in self.__prefer_class_list:
-            for prefer in classTuple[0]:
-                for num in ClassVar:
-                    if prefer == str(ClassVar[num]).split('_')[0]:
-                        prefer_constraint_list.append(ClassVar[num])
-            for not_prefer in classTuple[1]:
-                for num in ClassVar:
-                    if not_prefer == str(ClassVar[num]).split('_')[0]:
-                        not_prefer_constraint_list.append(ClassVar[num])
-        if len(self.__prefer_class_list) != 0:
+            prefer_constraint_list += [self.__class_var[item] for item in classTuple[0] if item in self.__class_var]
+            not_prefer_constraint_list += [self.__class_var[item] for item in classTuple[1] if item in self.__class_var]
+        if len(self.__prefer_class_list) != 0 and with_prefer:
             prefer_constraint = z3.And(z3.Or(prefer_constraint_list), z3.Not(z3.Or(not_prefer_constraint_list)))
         else:
             prefer_constraint = z3.And()
         Alarm.info("Prefer constraint added")
+        metrics.count('z3_vars', len(ClassVar))
+        metrics.count('z3_assertions', len(place_constraint_list) + len(lesson_constraint_list) + len(history_constraint_list) + len(prefer_constraint_list) + len(not_prefer_constraint_list))
         Alarm.success("Constraint added")
 
         return z3.And(place_constraint, lesson_constraint, history_constraint, prefer_constraint)
 
+    @metrics.timed('placement')
     def _place_lessons(self):
         Alarm.info("Try to place lessons...")
         cur_classes = self.__cur_classes
         self.__place_table = [[[[] for _ in range(13)] for _ in range(7)] for _ in range(18)]
-        con = sqlite3.connect('course.db')
-        cur = con.cursor()
+        try:
+            class_list = self._get_catalog().get_classes(self.semester, cur_classes, ['scheduleWeek', 'scheduleTime', 'courseName', 'classCode', 'courseName', 'teacher', 'scheduleMask'])
+        except sqlite3.OperationalError as e:
+            Alarm.fail("Error with class code: %s" % (', '.join(cur_classes)))
+            return
+        masks = {}
         for class_id in cur_classes:
-            try:
-                result = cur.execute("SELECT scheduleWeek, scheduleTime, courseName, classCode, courseName, teacher FROM courses WHERE classCode = '%s' AND semester = '%s'" % (class_id, self.semester)).fetchall()[0]
-            except sqlite3.OperationalError as e:
+            if class_id not in class_list:
                 Alarm.fail("Error with class code: %s" % (class_id))
                 continue
+            mask = self._checked_mask(class_list[class_id], class_id)
+            if mask is not None:
+                masks[class_id] = mask
+        for class_a, class_b in ConflictGraph(masks).edges():
+            Alarm.warning("Class %s conflicts with %s" % (class_a, class_b))
 
-            schedule_list , _, _ = self._extract_schedule(result)
-            for weeks, days in schedule_list:
-                for week in weeks:
-                    for day, time in days:
-                        try:
-                            assert self.__place_table[week-1][day-1][time-1] == []
-                            self.__place_table[week-1][day-1][time-1] = (result[3], result[4], result[5])
-                        except Exception as e:
-                            Alarm.warning("Error with class code: %s" % (class_id))
-                            print(week, day, time)
-        con.close()
+        for class_id, mask in masks.items():
+            result = class_list[class_id]
+            for week, day, time in mask_to_slots(mask):
+                if self.__place_table[week-1][day-1][time-1] == []:
+                    self.__place_table[week-1][day-1][time-1] = (result[3], result[4], result[5])
         Alarm.success("Schedule placed")
 
+    def print_conflicts(self):
+        '''
+        print how the courses in course_code_list conflict with each other
+        a course blocked by another course can never be chosen together with it
+        >>> mytable.print_conflicts()
+        +----------+----------+---------------------+---------+
+        | course A | course B | conflict class pair | blocked |
+        +----------+----------+---------------------+---------+
+        |  CS1502  | MARX1004 |        3 / 12       |         |
+        ...
+        '''
+        from prettytable import PrettyTable
+        course_list = self._get_courses_info()
+        class_course = {}
+        masks = {}
+        for courseCode, classes in course_list.items():
+            for course in classes:
+                class_course[course[3]] = courseCode
+                masks[course[3]] = self._course_mask(course)
+        pair_cnt = {}
+        for class_a, class_b in ConflictGraph(masks).edges():
+            course_a, course_b = sorted([class_course[class_a], class_course[class_b]], key=self.course_code_list.index)
+            if course_a != course_b:
+                pair_cnt[(course_a, course_b)] = pair_cnt.get((course_a, course_b), 0) + 1
+        table = PrettyTable(['course A', 'course B', 'conflict class pair', 'blocked'])
+        for (course_a, course_b), cnt in pair_cnt.items():
+            total = len(course_list[course_a]) * len(course_list[course_b])
+            table.add_row([course_a, course_b, "%d / %d" % (cnt, total), 'YES' if cnt == total else ''])
+        print(table)
+
+    def _block_clause(self, classes: List[str]) -> z3.BoolRef:
+        '''
+        forbid choosing all the classes again
+        '''
+        import z3
+        # a class not in the problem (e.g. removed by presolve) can't be chosen, so the solution can't come again
+        if any(item not in self.__class_var for item in classes):
+            return z3.BoolVal(True)
+        return z3.Not(z3.And([self.__class_var[item] for item in classes]))
+
+    def _section_masks(self, course_list: Dict[str, list]) -> Dict[str, List[Tuple[str, int]]]:
+        '''
+        course code -> [(class code, schedule mask)], the input of NativeBackend and presolve
+        '''
+        return {courseCode: [(course[3], self._course_mask(course)) for course in classes] for courseCode, classes in course_list.items()}
+
+    @metrics.timed('presolve')
+    def _presolve(self, course_list: Dict[str, list], with_prefer: bool = True) -> Dict[str, list]:
+        '''
+        return course_list without the classes which can't be in any solution, the classes removed are kept in the result of presolve()
+        not preferred classes are removed too if with_prefer
+        '''
+        if not self.presolve:
+            return course_list
+        prefer_class_list = self.__prefer_class_list if with_prefer else []
+        result = presolve(self._section_masks(course_list), prefer_class_list)
+        self.__presolve_result = result
+        self.__presolve_key = (self.semester, tuple(self.course_code_list), repr(prefer_class_list))
+        metrics.count('presolve_removed', len(result.removed))
+        Alarm.info("Presolve removed %d classes, %d courses have one class left" % (len(result.removed), len(result.fixed)))
+        return {courseCode: [course for course in classes if course[3] not in result.removed] for courseCode, classes in course_list.items()}
+
+    def diagnose(self, with_prefer: bool = True) -> Optional[List[str]]:
+        '''
+        tell why there is NO solution, return a minimal list of courses which can't be taken together
+        dropping any of them makes the rest solvable, None if the course list has a solution
+        >>> myTable.diagnose()
+        Courses CS1502, MARX1004 can't be taken together
+          MARX1004.01 conflicts with every class left of CS1502
+        '''
+        prefer_class_list = self.__prefer_class_list if with_prefer else []
+        result = self.__presolve_result
+        if self.__presolve_key != (self.semester, tuple(self.course_code_list), repr(prefer_class_list)) or result.conflict is None:
+            courses = self._section_masks(self._get_courses_info())
+            found = minimal_conflict(courses, prefer_class_list)
+            if found is None:
+                if NativeBackend(courses, prefer_class_list).next_solution() is None:
+                    Alarm.fail("None of the prefer classes can be chosen with the course list")
+                elif self.__history_model != []:
+                    Alarm.warning("The course list has solutions, all of them are in history, use clear() to start over")
+                else:
+                    Alarm.success("The course list has solutions")
+                return None
+            result = PresolveResult({}, {}, *found)
+        for line in result.explain():
+            Alarm.fail(line)
+        return result.conflict
+
+    def _get_solver(self) -> SolverBackend:
+        '''
+        return the solver session of current semester, course list and prefer classes
+        the problem is encoded once, history solutions are blocked so they can be dropped without re-encoding
+        '''
+        key = (self.semester, tuple(self.course_code_list), repr(self.__prefer_class_list), self.encoding, self.solver_backend)
+        if self.__solver is None or self.__solver_key != key:
+            Alarm.info("Building solver session...")
+            if self.solver_backend not in ('z3', 'native', 'check'):
+                Alarm.fail("Unknown solver backend: %s" % (self.solver_backend))
+                raise Exception("Unknown solver backend: %s" % (self.solver_backend))
+            course_list = self._presolve(self._get_courses_info())
+            if self.solver_backend != 'native':
+                backend = Z3Backend(self._add_constraint(course_list, with_history=False), self.__class_var)
+            if self.solver_backend != 'z3':
+                native_backend = NativeBackend(self._section_masks(course_list), self.__prefer_class_list)
+                if self.solver_backend == 'native':
+                    backend = native_backend
+                else:
+                    backend = CrossCheckBackend(backend, native_backend, Alarm.warning)
+            self.__solver = backend
+            self.__solver_key = key
+            self._reset_history_constraint()
+        return self.__solver
+
+    def _reset_history_constraint(self):
+        '''
+        drop all blocking clauses of the solver session and add them again from history_model
+        '''
+        if self.__solver is None:
+            return
+        self.__solver.reset(self.__history_model)
+
+    @metrics.timed('check')
+    def _next_solution(self) -> Optional[List[str]]:
+        '''
+        find a solution different from all solutions in history_model and save it to history_model
+        return None if NO solution
+        '''
+        cur_classes = self._get_solver().next_solution()
+        if cur_classes is None:
+            return None
+        metrics.count('solutions')
+        self.__history_model.append(cur_classes)
+        return cur_classes
+
+    def iter_solutions(self) -> Iterator[List[str]]:
+        '''
+        lazily yield distinct solutions, every solution yielded is saved to history_model
+        >>> for classes in myTable.iter_solutions():
+        ...     print(classes)
+        '''
+        while True:
+            cur_classes = self._next_solution()
+            if cur_classes is None:
+                return
+            yield cur_classes
+
+    def enumerate_solutions(self, k: int) -> List[List[str]]:
+        '''
+        return at most k new distinct solutions, they are saved to history_model
+        >>> myTable.enumerate_solutions(10)
+        '''
+        solutions = list(islice(self.iter_solutions(), k))
+        Alarm.success("Found %d solutions" % (len(solutions)))
+        return solutions
+
+    def _add_soft_constraint(self, opt: z3.Optimize, course_list: Dict[str, list]) -> None:
+        '''
+        add weighted soft objectives of solve_optimal(), must be called after _add_constraint()
+        '''
+        import z3
+        weight = self.optimize_weight
+        for classTuple in self.__prefer_class_list:
+            prefer = [self.__class_var[item] for item in classTuple[0] if item in self.__class_var]
+            if prefer != []:
+                opt.add_soft(z3.Or(prefer), weight['prefer'])
+        early_mask = 0
+        for week in range(1, WEEK_CNT + 1):
+            for day in range(1, DAY_CNT + 1):
+                for time in self.early_time_list:
+                    early_mask |= 1 << slot_bit(week, day, time)
+        day_var = {day: [] for day in range(1, DAY_CNT + 1)}
+        for courseCode, classes in course_list.items():
+            for course in classes:
+                mask = self._checked_mask(course, course[3])
+                if mask is None:
+                    continue
+                var = self.__class_var[course[3]]
+                if course[4] in self.avoid_teacher_list:
+                    opt.add_soft(z3.Not(var), weight['teacher'])
+                early_cnt = len({(day, time) for _, day, time in mask_to_slots(mask & early_mask)})
+                if early_cnt > 0:
+                    opt.add_soft(z3.Not(var), weight['early'] * early_cnt)
+                for day in {day for _, day, _ in mask_to_slots(mask)}:
+                    day_var[day].append(var)
+        for day, classes in day_var.items():
+            if classes != []:
+                opt.add_soft(z3.Not(z3.Or(classes)), weight['day'])
+        Alarm.info("Soft constraint added")
+
+    def _is_schedule(self, course_list: Dict[str, list], cur_classes: List[str]) -> bool:
+        '''
+        whether cur_classes takes exactly one class of every course, none of them conflict and it is not in history
+        a model of an interrupted optimization may be only partly assigned
+        '''
+        courses = self._section_masks(course_list)
+        chosen = set(cur_classes)
+        # the blocking clauses of _add_constraint(), all classes of a history solution can't be chosen again
+        if any(set(history) <= chosen for history in self.__history_model):
+            return False
+        masks = {}
+        for courseCode, classes in courses.items():
+            taken = [(class_code, mask) for class_code, mask in classes if class_code in chosen]
+            if len(taken) != 1:
+                return False
+            masks[taken[0][0]] = taken[0][1]
+        return len(masks) == len(chosen) and next(iter(ConflictGraph(masks).edges()), None) is None
+
+    @metrics.timed('optimize')
+    def solve_optimal(self, timeout: int = 10000, rlimit: int = None):
+        '''
+        get the best class schedule solution within timeout (ms), the solution will be saved to history_model
+        rlimit bounds the solver work (z3 resource limit) if you want a budget independent of the machine
+        prefer classes become soft objectives, so an unsatisfiable prefer class will NOT make it "Not sat!"
+        avoid_teacher_list, early_time_list and optimize_weight are the other objectives
+        if the timeout is reached, return the best solution found so far
+        >>> myTable.avoid_teacher_list = ['张三']
+        >>> myTable.solve_optimal(5000)
+        '''
+        import z3
+        Alarm.info("Optimizing...")
+        course_list = self._presolve(self._get_courses_info(), with_prefer=False)
+        opt = z3.Optimize()
+        opt.set('timeout', timeout)
+        if rlimit is not None:
+            opt.set('rlimit', rlimit)
+        opt.add(self._add_constraint(course_list, with_prefer=False))
+        self._add_soft_constraint(opt, course_list)
+        r = opt.check()
+        if r == z3.unsat:
+            Alarm.fail("Not sat!")
+            self.diagnose(with_prefer=False)
+            return
+        try:
+            model = opt.model()
+        except z3.Z3Exception:
+            # the budget ran out before any model was found
+            Alarm.fail("No solution found within budget")
+            return
+        cur_classes = []
+        for item in model:
+            if model[item] == z3.BoolVal(True):
+                cur_classes.append(str(item).split('_')[0])
+        if r == z3.unknown:
+            if not self._is_schedule(course_list, cur_classes):
+                Alarm.fail("No solution found within budget")
+                return
+            Alarm.warning("Budget exhausted, use the best solution found so far")
+        Alarm.success("Solved! Saving current solution")
+        self.__history_model.append(cur_classes)
+        if self.__solver is not None:
+            self.__solver.block(cur_classes)
+        self.__cur_classes = cur_classes
+        Alarm.success("Solution saved, solution is " + str(cur_classes))
+        self._place_lessons()
+        return cur_classes
+
+    def enumerate_solutions_parallel(self, k: int = None, processes: int = None) -> List[List[str]]:
+        '''
+        return at most k (all if k is None) new distinct solutions found by a process pool, they are saved to history_model
+        the problem is split by the class chosen for the courses with fewest classes, every process runs its own solver
+        >>> myTable.enumerate_solutions_parallel(1000, processes=8)
+        '''
+        Alarm.info("Enumerating in parallel...")
+        courses = self._section_masks(self._presolve(self._get_courses_info()))
+        backend_name = 'native' if self.solver_backend == 'native' else 'z3'
+        solutions = []
+        for cur_classes in enumerate_parallel(courses, self.__prefer_class_list, self.__history_model, backend_name, processes, k):
+            solutions.append(cur_classes)
+            self.__history_model.append(cur_classes)
+            if self.__solver is not None:
+                self.__solver.block(cur_classes)
+        Alarm.success("Found %d solutions" % (len(solutions)))
+        return solutions
+
     def solve(self):
         '''
         get your class schedule solution and the solution will be saved to history_model
         if you want to clear history_model, use clear()
-        if NO solution, will alarm "Not sat!"
+        if NO solution, will alarm "Not sat!" and tell which courses can't be taken together, see diagnose()
         >>> myTable.solve() # get a class table schedule solution
         >>> myTable.solve() # get a new class table schedule solution different from the solution before
         >>> myTable.clear() # clear history_model
         '''
         Alarm.info("Solving...")
-        sol = z3.Solver()
-        sol.add(self._add_constraint(self._get_courses_info()))
-        r = sol.check()
-        if r != z3.sat:
+        cur_classes = self._next_solution()
+        if cur_classes is None:
             Alarm.fail("Not sat!")
+            self.diagnose()
             return
-        model = sol.model()
         Alarm.success("Solved! Saving current solution")
-        cur_classes = []
-        for item in model:
-            if model[item] == z3.BoolVal(True):
-                cur_classes.append(str(item).split('_')[0])
-        self.__history_model.append(cur_classes)
         self.__cur_classes = cur_classes
         Alarm.success("Solution saved, solution is " + str(cur_classes))
         self._place_lessons()
@@ -506,6 +1710,7 @@ class classTable:
         print class table at a specific week
         >>> myTable.print_class_table(0)    # print class table at week 1
         '''
+        from prettytable import PrettyTable
         if self.__place_table == []:
             Alarm.warning("No place table, try to place")
             self._place_lessons()
@@ -516,68 +1721,292 @@ class classTable:
         table.add_rows([['\n'.join(self.__place_table[week][i][j])  if self.__place_table[week][i][j] != [] else '' for i in range(7)] for j in range(13)])
         print(table)
 
+    def export_class_table(self, path: str = None) -> List[Dict]:
+        '''
+        return the classes of current class table with their schedule, also write them to a json file if path is set
+        >>> myTable.export_class_table('table.json')
+        [{'classCode': 'CS1502.01', 'courseName': '计算机网络', 'teacher': '张三', 'scheduleWeek': '1~18周', 'scheduleTime': '...', 'slots': [[1, 2, 3], ...]}]
+        '''
+        class_list = self._get_catalog().get_classes(self.semester, self.__cur_classes, ['courseCode', 'courseName', 'teacher', 'scheduleWeek', 'scheduleTime', 'scheduleMask'])
+        table = []
+        for class_id in self.__cur_classes:
+            if class_id not in class_list:
+                Alarm.fail("Error with class code: %s" % (class_id))
+                continue
+            courseCode, courseName, teacher, scheduleWeek, scheduleTime, _ = class_list[class_id]
+            mask = self._checked_mask((scheduleWeek, scheduleTime, courseName, class_id, class_list[class_id][-1]), class_id)
+            if mask is None:
+                continue
+            table.append({'classCode': class_id, 'courseCode': courseCode, 'courseName': courseName, 'teacher': teacher,
+                          'scheduleWeek': scheduleWeek, 'scheduleTime': scheduleTime, 'slots': [list(slot) for slot in mask_to_slots(mask)]})
+        if path is not None:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(table, f, ensure_ascii=False, indent=2)
+            Alarm.success("Class table exported to " + path)
+        return table
+
     def get_study_plan(self):
         self._check_login()
         Alarm.info("Trying to get your plan...")
-        r = self.__session.get("https://jw.ustc.edu.cn/for-std/program")
-        soup = BeautifulSoup(r.text, "html.parser")
-        plan = soup.find("a")
-        Alarm.info("Your plan is: " + plan.text.strip("\n\t"))
-        planurl = "https://jw.ustc.edu.cn/for-std/program/root-module-json/" + plan["href"].split('/')[-1]
-        r = self.__session.get(planurl)
-        lessons = json.loads(r.text)
-
-        lessons['allPlanCourses'][0]
-        lesson_list = {}
-        for item in lessons['allPlanCourses']:
-            if item['termTextZhs'][0] not in lesson_list:
-                lesson_list[item['termTextZhs'][0]] = [(item['course']['nameZh'], item['course']['code'])]
-            else:
-                lesson_list[item['termTextZhs'][0]].append((item['course']['nameZh'], item['course']['code']))
 
-        lesson_list = dict(sorted(lesson_list.items(), key=lambda item: item[0]))
+        def parse_program(text):
+            from bs4 import BeautifulSoup
+            soup = BeautifulSoup(text, "html.parser")
+            plan = soup.find("a")
+            return [plan.text.strip("\n\t"), plan["href"].split('/')[-1]]
+
+        def parse_plan(text):
+            lessons = json.loads(text)
+            lessons['allPlanCourses'][0]
+            lesson_list = {}
+            for item in lessons['allPlanCourses']:
+                if item['termTextZhs'][0] not in lesson_list:
+                    lesson_list[item['termTextZhs'][0]] = [(item['course']['nameZh'], item['course']['code'])]
+                else:
+                    lesson_list[item['termTextZhs'][0]].append((item['course']['nameZh'], item['course']['code']))
+            return dict(sorted(lesson_list.items(), key=lambda item: item[0]))
+
+        plan_name, plan_id = self._get_parsed('program', "https://jw.ustc.edu.cn/for-std/program", parse_program)
+        Alarm.info("Your plan is: " + plan_name)
+        planurl = "https://jw.ustc.edu.cn/for-std/program/root-module-json/" + plan_id
+        lesson_list = self._get_parsed('plan', planurl, parse_plan)
         for k, v in lesson_list.items():
             print("--------------" + k + "--------------")
             for i in v:
                 print(i[0] + " " + i[1])
     
     def _select_prefer_class(self):
-        con = sqlite3.connect('course.db')
-        cur = con.cursor()
+        from prettytable import PrettyTable
+        try:
+            course_list = self._get_catalog().get_courses(self.semester, self.course_code_list, ['teacher', 'scheduleWeek', 'scheduleTime', 'courseName', 'classCode'])
+        except sqlite3.OperationalError as e:
+            Alarm.fail("Error with course code: %s" % (', '.join(self.course_code_list)))
+            return
         for courseCode in self.course_code_list:
-            try:
-                result = cur.execute("SELECT teacher, scheduleWeek, scheduleTime, courseName, classCode FROM courses WHERE courseCode = '%s' AND semester = '%s'" % (courseCode, self.semester)).fetchall()
-                if len(result) == 0:
-                    Alarm.fail("No such course: %s" % (courseCode))
-                    return
-                print("select your prefer class (seperate each class code by ',' and skip select by press ENTER\n e.g. >>> CS1502.01,CS1502.02,CS1502.03")
-                print("--------------" + result[0][3] + "--------------")
-                classes = []
-                table = PrettyTable(["Teacher", "Week", "Time", "Class Code"])
-                for item in result:
-                    classes.append(item[4])
-                    table.add_row([item[0], item[1], item[2], item[4]])
-                print(table)
-                selects = input().split(',')
-                if selects != ['']:
-                    select_list = []
-                    try:
-                        for item in selects:
-                            if item != '':
-                                print(item.strip())
-                                select_list.append(item.strip())
-                                classes.remove(item.strip())
-                        self.__prefer_class_list.append((select_list, classes))
-                    except Exception as e:
-                        Alarm.fail("Invalid input")
-            except sqlite3.OperationalError as e:
-                Alarm.fail("Error with course code: %s" % (courseCode))
-        con.close()
+            result = course_list[courseCode]
+            if len(result) == 0:
+                Alarm.fail("No such course: %s" % (courseCode))
+                return
+            print("select your prefer class (seperate each class code by ',' and skip select by press ENTER\n e.g. >>> CS1502.01,CS1502.02,CS1502.03")
+            print("--------------" + result[0][3] + "--------------")
+            classes = []
+            table = PrettyTable(["Teacher", "Week", "Time", "Class Code"])
+            for item in result:
+                classes.append(item[4])
+                table.add_row([item[0], item[1], item[2], item[4]])
+            print(table)
+            selects = input().split(',')
+            if selects != ['']:
+                select_list = []
+                try:
+                    for item in selects:
+                        if item != '':
+                            print(item.strip())
+                            select_list.append(item.strip())
+                            classes.remove(item.strip())
+                    self.__prefer_class_list.append((select_list, classes))
+                except Exception as e:
+                    Alarm.fail("Invalid input")
+
+def _split_codes(text: str) -> List[str]:
+    return [item.strip() for item in text.split(',') if item.strip() != '']
+
+def cli(argv: List[str]) -> int:
+    '''
+    non-interactive commands, heavy modules are imported only by the commands using them
+    $ python3 class_table.py update -u PB12345678 -p qwert123 -s 141
+    $ python3 class_table.py update -s 121,141,161    # refreshed at the same time, see refresh_semesters()
+    $ python3 class_table.py semesters --prune 4 --vacuum
+    $ python3 class_table.py --metrics metrics.json solve -s 141 -c CS1502,MARX1004
+    $ python3 class_table.py solve -s 141 -c CS1502,011103,MARX1004 -k 3
+    $ python3 class_table.py print -s 141 --select -1 --week 0
+    $ python3 class_table.py export -s 141 --classes CS1502.01,011103.02 -o table.json
+    $ python3 class_table.py batch requests.jsonl -o responses.jsonl    # see schedule_service.py
+    $ python3 class_table.py serve -s 141 --port 8000
+    $ python3 class_table.py cache --clear semester_index
+    $ python3 class_table.py watch -s 141 --interval 30 -o seats.jsonl
+    return the exit code
+    '''
+    import argparse
+    parser = argparse.ArgumentParser(prog='class_table.py', description="USTC class table scheduler, run without arguments for the interactive menu")
+    parser.add_argument('-q', '--quiet', action='store_true', help="drop the messages of every step")
+    parser.add_argument('--metrics', metavar='PATH', help="write the time spent in each phase and the counters to this json file")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    update = commands.add_parser('update', help="update course database from jw.ustc.edu.cn")
+    update.add_argument('-s', '--semester', required=True, help="semester ids seperated by ',', several of them are refreshed at the same time")
+    update.add_argument('--refresh', action='store_true', help="tell which lessons are inserted, changed or removed")
+    update.add_argument('--concurrency', type=int, default=classTable.semester_concurrency, help="semesters downloaded at the same time")
+    update.add_argument('--rebuild', action='store_true', help="build the semester files again instead of writing the changed lessons only")
+
+    solve = commands.add_parser('solve', help="get new class table solutions, they are saved to the history database")
+    solve.add_argument('-s', '--semester', required=True)
+    solve.add_argument('-c', '--courses', required=True, help="course codes seperated by ','")
+    solve.add_argument('-k', type=int, default=1, help="how many solutions")
+    solve.add_argument('--backend', choices=['z3', 'native', 'check'], default=classTable.solver_backend)
+    solve.add_argument('--optimal', action='store_true', help="get the best solution by solve_optimal()")
+    solve.add_argument('--avoid-teacher', default='', help="teachers seperated by ',', only used by --optimal")
+    solve.add_argument('--history', default=classTable.history_db)
+
+    for name, description in [('print', "print a class table of the history database"), ('export', "export a class table of the history database as json")]:
+        command = commands.add_parser(name, help=description)
+        command.add_argument('-s', '--semester', required=True)
+        command.add_argument('-c', '--courses', default='', help="course codes seperated by ',', default the course list solved last time")
+        command.add_argument('--history', default=classTable.history_db)
+        command.add_argument('--select', type=int, default=-1, help="number of the solution in the history database, default the last one")
+        command.add_argument('--classes', help="class codes seperated by ',', used instead of the history database")
+        if name == 'print':
+            command.add_argument('--week', type=int, default=0, help="from 0 to 17")
+        else:
+            command.add_argument('-o', '--output', help="json file, default stdout")
+
+    watch = commands.add_parser('watch', help="poll the seats of a class table of the history database until Ctrl-C, see seat_watcher.py")
+    watch.add_argument('-s', '--semester', required=True)
+    watch.add_argument('-c', '--courses', default='', help="course codes seperated by ',', default the course list solved last time")
+    watch.add_argument('--history', default=classTable.history_db)
+    watch.add_argument('--select', type=int, default=-1, help="number of the solution in the history database, default the last one")
+    watch.add_argument('--classes', help="class codes seperated by ',', used instead of the history database")
+    watch.add_argument('--all', action='store_true', help="watch every class of the courses instead of a class table")
+    watch.add_argument('--interval', type=float, default=60.0, help="seconds between polls")
+    watch.add_argument('--polls', type=int, help="stop after this many polls")
+    watch.add_argument('--rate', type=float, default=1.0, help="max requests per second")
+    watch.add_argument('-o', '--output', help="append change events to this jsonl file")
+    for command in [update, watch]:
+        command.add_argument('-u', '--username', default=os.environ.get('USTC_USERNAME', ''), help="student id, default $USTC_USERNAME")
+        command.add_argument('-p', '--password', default=os.environ.get('USTC_PASSWORD', ''), help="password, default $USTC_PASSWORD, not needed while the cached session is valid")
+
+    batch = commands.add_parser('batch', help="answer scheduling requests of a jsonl file ('-' for stdin), see schedule_service.py")
+    batch.add_argument('requests')
+    batch.add_argument('-o', '--output', help="jsonl file of responses, default stdout")
+    batch.add_argument('-s', '--semester', help="semesters to load seperated by ',', default those the requests ask for")
+    serve = commands.add_parser('serve', help="answer scheduling requests over http, POST /solve and GET /stats")
+    serve.add_argument('-s', '--semester', required=True, help="semesters to load seperated by ','")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8000)
+    for command in [batch, serve]:
+        command.add_argument('--processes', type=int, help="worker processes, default cpu count, 0 solves in this process")
+        command.add_argument('--verbose', action='store_true', help="json lines of every worker message to stderr")
+    cache = commands.add_parser('cache', help="show the cached responses of jw.ustc.edu.cn, see http_cache.py")
+    cache.add_argument('--clear', nargs='?', const='all', metavar='ENDPOINT', help="drop cached responses of the endpoint, default all")
+    semesters = commands.add_parser('semesters', help="show the semesters in the course database, see semester_store.py")
+    semesters.add_argument('--split', action='store_true', help="move the semesters in course.db into their own files")
+    semesters.add_argument('--prune', type=int, metavar='KEEP', help="remove all but the newest KEEP semesters")
+    semesters.add_argument('--vacuum', action='store_true', help="vacuum the file of every semester")
+
+    args = parser.parse_args(argv)
+    try:
+        return _run_command(args)
+    finally:
+        if args.metrics is not None:
+            metrics.export(args.metrics)
+
+def _run_command(args) -> int:
+    '''
+    run a command parsed by cli(), return the exit code
+    '''
+    if args.quiet:
+        from instrument import quiet_logger
+        Alarm.logger = quiet_logger
+    if args.command in ['batch', 'serve']:
+        import schedule_service
+        if args.command == 'batch' and args.output is None and Alarm.logger is None:
+            # responses go to stdout
+            from instrument import JsonLogger
+            Alarm.logger = JsonLogger()
+        semesters = _split_codes(args.semester) if args.semester else None
+        try:
+            if args.command == 'batch':
+                stats = schedule_service.run_batch(args.requests, args.output, semesters, args.processes, args.verbose)
+                return 0 if stats['errors'] == 0 else 1
+            schedule_service.serve(semesters, args.host, args.port, args.processes, args.verbose)
+            return 0
+        except Exception as e:
+            Alarm.fail(str(e))
+            return 1
+    myTable = classTable(getattr(args, 'username', ''), getattr(args, 'password', ''))
+    if args.command == 'cache':
+        try:
+            if args.clear is not None:
+                myTable.clear_http_cache(None if args.clear == 'all' else args.clear)
+            myTable.print_http_cache_stats()
+            return 0
+        except Exception as e:
+            Alarm.fail(str(e))
+            return 1
+    if args.command == 'semesters':
+        try:
+            if args.split:
+                myTable.split_database()
+            if args.prune is not None:
+                myTable.prune_semesters(args.prune)
+            if args.vacuum:
+                myTable.vacuum_semesters()
+            myTable.print_semester_stats()
+            return 0
+        except Exception as e:
+            Alarm.fail(str(e))
+            return 1
+    myTable.semester = args.semester
+    try:
+        if args.command == 'update':
+            myTable.login()
+            semester_ids = _split_codes(args.semester)
+            if len(semester_ids) > 1 or args.rebuild:
+                results = myTable.refresh_semesters(semester_ids, args.concurrency, args.rebuild)
+                return 0 if all(summary is not None for summary in results.values()) else 1
+            if args.refresh:
+                return 0 if myTable.refresh_db(args.semester) is not None else 1
+            myTable.update_db(args.semester)
+            return 0
+        myTable.history_db = args.history
+        myTable.course_code_list = _split_codes(args.courses)
+        if args.command == 'watch':
+            if args.classes is not None:
+                myTable.set_cur_class(_split_codes(args.classes))
+            elif not args.all:
+                myTable.load_history_model()
+                myTable.set_cur_class(args.select)
+            myTable.login()
+            myTable.watch_seats(args.interval, args.polls, args.all, args.output, rate=args.rate)
+            return 0
+        if args.command == 'solve':
+            myTable.solver_backend = args.backend
+            myTable.load_history_model()
+            if args.optimal:
+                myTable.avoid_teacher_list = _split_codes(args.avoid_teacher)
+                cur_classes = myTable.solve_optimal()
+                solutions = [cur_classes] if cur_classes is not None else []
+            else:
+                solutions = myTable.enumerate_solutions(args.k)
+            for classes in solutions:
+                print(','.join(classes))
+            myTable.save_history_model()
+            return 0 if solutions != [] else 1
+        if args.classes is not None:
+            myTable.set_cur_class(_split_codes(args.classes))
+        else:
+            myTable.load_history_model()
+            myTable.set_cur_class(args.select)
+        if args.command == 'print':
+            myTable.print_class_table(args.week)
+        else:
+            table = myTable.export_class_table(args.output)
+            if args.output is None:
+                print(json.dumps(table, ensure_ascii=False, indent=2))
+        return 0
+    except Exception as e:
+        Alarm.fail(str(e))
+        return 1
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # run in the imported module, so schedule_service and others share its Alarm and classTable
+        import class_table
+        sys.exit(class_table.cli(sys.argv[1:]))
     '''
     interactive mode
     '''
+    from prettytable import PrettyTable
     print("Welcome to use class table generator!")
     print("Please use function sequentially!")
     table = PrettyTable(['Func Num', 'Func Name', 'Description'])
@@ -593,6 +2022,14 @@ if __name__ == "__main__":
     table.add_row(['9', 'save', 'save history model'])
     table.add_row(['10', 'load', 'load history model'])
     table.add_row(['11', 'clear', 'clear history model and prefer class list'])
+    table.add_row(['12', 'refresh', 'only update changed lessons of current semester'])
+    table.add_row(['13', 'conflicts', 'show which of your lessons conflict with each other'])
+    table.add_row(['14', 'enumerate', 'get several new class table solutions at once'])
+    table.add_row(['15', 'optimize', 'get the best class table solution with prefer classes as soft goals'])
+    table.add_row(['16', 'metrics', 'show time spent in each phase and save it to metrics.json'])
+    table.add_row(['17', 'cache', 'show cached pages of jw.ustc.edu.cn and drop them'])
+    table.add_row(['18', 'watch', 'poll the seats of your current class table until Ctrl-C'])
+    table.add_row(['19', 'semesters', 'refresh several semesters at once, prune and vacuum old ones'])
     table.add_row(['other', 'exit', 'exit the program'])
     print(table)
     while True:
@@ -653,6 +2090,48 @@ if __name__ == "__main__":
                 myTable.load_history_model()
             elif num == 11:
                 myTable.clear()
+            elif num == 12:
+                myTable.refresh_db(myTable.semester)
+            elif num == 13:
+                myTable.print_conflicts()
+            elif num == 14:
+                print("Please input how many solutions you want\n e.g. >>> 10")
+                k = int(input())
+                for classes in myTable.enumerate_solutions(k):
+                    print(classes)
+                print("Use 'select previous combination' to print one of them")
+            elif num == 15:
+                print("Please input teachers you want to avoid (seperate each teacher by ',', skip by press ENTER)")
+                myTable.avoid_teacher_list = [item.strip() for item in input().split(',') if item.strip() != '']
+                myTable.solve_optimal()
+                print("Here's your lessons at week 0")
+                myTable.print_class_table(0)
+                print("PRESS ENTER TO CONTINUE")
+                input()
+            elif num == 16:
+                print(json.dumps(metrics.snapshot(), ensure_ascii=False, indent=2))
+                metrics.export('metrics.json')
+                Alarm.success("Metrics saved to metrics.json")
+            elif num == 17:
+                myTable.print_http_cache_stats()
+                print("Input the endpoint to drop (semester_index, lesson_page, program, plan or all), skip by press ENTER")
+                endpoint = input().strip()
+                if endpoint != '':
+                    myTable.clear_http_cache(None if endpoint == 'all' else endpoint)
+            elif num == 18:
+                print("Please input seconds between polls\n e.g. >>> 60")
+                myTable.watch_seats(float(input()))
+            elif num == 19:
+                myTable.print_semester_stats()
+                print("Input semester ids to refresh (seperate each semester by ','), skip by press ENTER\n e.g. >>> 121, 141")
+                semester_ids = _split_codes(input())
+                if semester_ids != []:
+                    myTable.refresh_semesters(semester_ids)
+                print("Input how many newest semesters to keep, older ones are removed, skip by press ENTER\n e.g. >>> 4")
+                keep = input().strip()
+                if keep != '':
+                    myTable.prune_semesters(int(keep))
+                    myTable.vacuum_semesters()
             else:
                 break
         except Exception as e:
@@ -0,0 +1,95 @@
+from typing import *
+
+'''
+>>> from conflict_graph import ConflictGraph
+>>> graph = ConflictGraph({'CS1502.01': 0b0110, 'CS1502.02': 0b1000, 'MARX1004.01': 0b0010})
+>>> graph.neighbors('MARX1004.01')
+{'CS1502.01'}
+>>> graph.cliques()
+[['CS1502.01', 'MARX1004.01']]
+'''
+
+class ConflictGraph:
+    '''
+    conflict graph of sections, two sections conflict if their schedule masks share a slot
+    masks are python int bitsets (see slot_bit() in schedule_parser.py), any hashable can be the key of a section
+    sections are numbered in insertion order and every set of sections is kept as an int bitset of those numbers
+    '''
+
+    def __init__(self, masks: Dict[Hashable, int]) -> None:
+        self.keys = list(masks.keys())
+        self.masks = [masks[key] for key in self.keys]
+        self.__index = {key: num for num, key in enumerate(self.keys)}
+        # slot -> bitset of sections occupy it
+        self.__slots = {}
+        for num, mask in enumerate(self.masks):
+            bit = 1 << num
+            while mask:
+                low = mask & -mask
+                slot = low.bit_length() - 1
+                mask ^= low
+                self.__slots[slot] = self.__slots.get(slot, 0) | bit
+        # section -> bitset of conflicting sections
+        self.__adjacency = [0] * len(self.keys)
+        for sections in set(self.__slots.values()):
+            if sections & (sections - 1) == 0:
+                continue
+            for num in self._bits(sections):
+                self.__adjacency[num] |= sections
+        for num in range(len(self.keys)):
+            self.__adjacency[num] &= ~(1 << num)
+
+    @staticmethod
+    def _bits(bitset: int) -> Iterator[int]:
+        while bitset:
+            low = bitset & -bitset
+            bitset ^= low
+            yield low.bit_length() - 1
+
+    def _to_keys(self, bitset: int) -> List[Hashable]:
+        return [self.keys[num] for num in self._bits(bitset)]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def index(self, key: Hashable) -> int:
+        return self.__index[key]
+
+    def adjacency(self, num: int) -> int:
+        '''
+        bitset of the sections conflicting with section number `num`
+        '''
+        return self.__adjacency[num]
+
+    def neighbors(self, key: Hashable) -> Set[Hashable]:
+        return set(self._to_keys(self.__adjacency[self.__index[key]]))
+
+    def conflict(self, a: Hashable, b: Hashable) -> bool:
+        return (self.__adjacency[self.__index[a]] >> self.__index[b]) & 1 == 1
+
+    def edges(self) -> Iterator[Tuple[Hashable, Hashable]]:
+        '''
+        yield every conflicting pair once
+        '''
+        for num, adjacency in enumerate(self.__adjacency):
+            for other in self._bits(adjacency >> (num + 1)):
+                yield self.keys[num], self.keys[num + 1 + other]
+
+    def cliques(self) -> List[List[Hashable]]:
+        '''
+        sections sharing one slot are pairwise conflicting
+        return those groups with more than one section, groups contained in another group are dropped
+        '''
+        groups = sorted({sections for sections in self.__slots.values() if sections & (sections - 1)},
+                        key=lambda sections: bin(sections).count('1'), reverse=True)
+        maximal = []
+        for sections in groups:
+            if all(sections & other != sections for other in maximal):
+                maximal.append(sections)
+        return [self._to_keys(sections) for sections in maximal]
+
+    def slot_sections(self, slot: int) -> List[Hashable]:
+        '''
+        sections occupying the slot, slot is the bit index of the schedule mask
+        '''
+        return self._to_keys(self.__slots.get(slot, 0))
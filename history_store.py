@@ -0,0 +1,119 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import *
+
+'''
+solutions saved per semester and per course list, replacing the single pickled history.plk
+>>> from history_store import HistoryStore
+>>> store = HistoryStore('history.db')
+>>> store.add('141', ['CS1502', 'MARX1004'], ['CS1502.01', 'MARX1004.03'])
+True
+>>> store.add('141', ['MARX1004', 'CS1502'], ['MARX1004.03', 'CS1502.01'])   # same course list, same solution
+False
+>>> store.load('141', ['CS1502', 'MARX1004'])
+[['CS1502.01', 'MARX1004.03']]
+'''
+
+HISTORY_TABLE_SQL = '''CREATE TABLE IF NOT EXISTS solutions (
+    seq integer PRIMARY KEY AUTOINCREMENT,
+    semester text NOT NULL,
+    courses text NOT NULL,
+    classes text NOT NULL,
+    created real NOT NULL,
+    UNIQUE (semester, courses, classes)
+)'''
+
+def course_key(course_codes: List[str]) -> str:
+    '''
+    the order of the course list does NOT matter
+    '''
+    return ','.join(sorted(set(course_codes)))
+
+def solution_key(classes: List[str]) -> str:
+    return ','.join(sorted(set(classes)))
+
+class HistoryStore:
+    '''
+    a solution is stored once per (semester, course list), solutions keep the order they were added in
+    hold one long-lived connection like CourseDB
+    '''
+
+    def __init__(self, path: str = 'history.db') -> None:
+        self.path = path
+        self.__con = None
+        self.__lock = threading.Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        if self.__con is None:
+            self.__con = sqlite3.connect(self.path, check_same_thread=False)
+            self.__con.execute(HISTORY_TABLE_SQL)
+            self.__con.execute("CREATE INDEX IF NOT EXISTS idx_solutions_semester ON solutions (semester, seq)")
+            self.__con.commit()
+        return self.__con
+
+    def close(self) -> None:
+        if self.__con is not None:
+            self.__con.close()
+            self.__con = None
+
+    def add_many(self, semester: str, course_codes: List[str], solutions: List[List[str]]) -> int:
+        '''
+        return how many of the solutions are new
+        '''
+        now = time.time()
+        rows = [(str(semester), course_key(course_codes), solution_key(classes), now) for classes in solutions]
+        with self.__lock:
+            con = self.connection()
+            before = con.total_changes
+            con.executemany("INSERT OR IGNORE INTO solutions (semester, courses, classes, created) VALUES (?, ?, ?, ?)", rows)
+            con.commit()
+            return con.total_changes - before
+
+    def add(self, semester: str, course_codes: List[str], classes: List[str]) -> bool:
+        '''
+        return False if the solution is already stored
+        '''
+        return self.add_many(semester, course_codes, [classes]) == 1
+
+    def load(self, semester: str, course_codes: List[str]) -> List[List[str]]:
+        with self.__lock:
+            rows = self.connection().execute("SELECT classes FROM solutions WHERE semester = ? AND courses = ? ORDER BY seq",
+                                             (str(semester), course_key(course_codes))).fetchall()
+        return [row[0].split(',') for row in rows]
+
+    def count(self, semester: str, course_codes: List[str]) -> int:
+        with self.__lock:
+            return self.connection().execute("SELECT COUNT(*) FROM solutions WHERE semester = ? AND courses = ?",
+                                             (str(semester), course_key(course_codes))).fetchone()[0]
+
+    def clear(self, semester: str, course_codes: List[str]) -> int:
+        '''
+        delete the solutions of the course list, return how many are deleted
+        '''
+        with self.__lock:
+            con = self.connection()
+            cur = con.execute("DELETE FROM solutions WHERE semester = ? AND courses = ?", (str(semester), course_key(course_codes)))
+            con.commit()
+            return cur.rowcount
+
+    def course_lists(self, semester: str) -> List[List[str]]:
+        '''
+        course lists of the semester having solutions, the one with the latest solution first
+        '''
+        with self.__lock:
+            rows = self.connection().execute("SELECT courses FROM solutions WHERE semester = ? GROUP BY courses ORDER BY MAX(seq) DESC",
+                                             (str(semester),)).fetchall()
+        return [row[0].split(',') for row in rows]
+
+    def import_pickle(self, path: str, semester: str, course_codes: List[str]) -> int:
+        '''
+        add the solutions of a history.plk saved by old versions, return how many are new
+        '''
+        if not os.path.exists(path):
+            return 0
+        with open(path, 'rb') as f:
+            solutions = pickle.load(f)
+        return self.add_many(semester, course_codes, solutions)
@@ -0,0 +1,285 @@
+import hashlib
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import *
+import requests
+from requests.adapters import BaseAdapter
+from requests.utils import get_encoding_from_headers
+from instrument import metrics
+
+'''
+on-disk cache of jw.ustc.edu.cn responses, mounted under the session as a transport adapter
+>>> from http_cache import HttpCache, CachingAdapter
+>>> cache = HttpCache('http_cache.db')
+>>> session.mount("https://jw.ustc.edu.cn/", CachingAdapter(session.get_adapter("https://jw.ustc.edu.cn/"), cache, "PB12345678"))
+a response younger than the ttl of its endpoint is served from the cache without any request,
+an older one is revalidated by If-None-Match / If-Modified-Since and served from the cache if the server answers 304
+endpoints of ttl 0 are not cached at all, their responses are passed through as they are
+results parsed from a response (e.g. the semester-id map) are cached too, they are valid while the body is the same
+requests with "Cache-Control: no-cache" always go to the server, e.g. checking whether the session is logged in
+'''
+
+# endpoint name -> url pattern, urls of no endpoint are never cached
+ENDPOINTS = [
+    ('semester_index', re.compile(r'^https://jw\.ustc\.edu\.cn/for-std/lesson-search/index/\d+$')),
+    ('lesson_page', re.compile(r'^https://jw\.ustc\.edu\.cn/for-std/lesson-search/semester/\d+/search/')),
+    ('program', re.compile(r'^https://jw\.ustc\.edu\.cn/for-std/program$')),
+    ('plan', re.compile(r'^https://jw\.ustc\.edu\.cn/for-std/program/root-module-json/')),
+]
+
+# seconds a response is used without asking the server
+# lesson pages are never cached since stdCount changes all the time, and a semester of pages is too big to keep a copy of
+DEFAULT_TTL = {'semester_index': 86400, 'lesson_page': 0, 'program': 86400, 'plan': 86400}
+
+# headers stored with the body, the body is stored decoded so Content-Encoding and Content-Length are dropped
+KEPT_HEADERS = ['Content-Type', 'ETag', 'Last-Modified']
+
+RESPONSE_TABLE_SQL = '''CREATE TABLE IF NOT EXISTS responses (
+    namespace text NOT NULL,
+    url text NOT NULL,
+    endpoint text NOT NULL,
+    headers text NOT NULL,
+    body blob NOT NULL,
+    bodyHash text NOT NULL,
+    fetched real NOT NULL,
+    PRIMARY KEY (namespace, url)
+)'''
+
+PARSED_TABLE_SQL = '''CREATE TABLE IF NOT EXISTS parsed (
+    namespace text NOT NULL,
+    url text NOT NULL,
+    kind text NOT NULL,
+    bodyHash text NOT NULL,
+    value text NOT NULL,
+    PRIMARY KEY (namespace, url, kind)
+)'''
+
+def body_hash(body: bytes) -> str:
+    return hashlib.sha1(body).hexdigest()
+
+class HttpCache:
+    '''
+    responses and parsed results are kept per namespace (the student id), since the study plan differs between students
+    the file may hold your study plan, so it is created readable only by you like session.plk
+    '''
+
+    def __init__(self, path: str = 'http_cache.db', ttl: Dict[str, float] = None) -> None:
+        self.path = path
+        self.ttl = dict(DEFAULT_TTL)
+        self.ttl.update(ttl or {})
+        # hit: served without request, revalidated: served after a 304, miss: answered by the server
+        # stored: miss written to the cache, bypass: no-cache request, parsed_hit: parsed result reused
+        self.counters = {'hit': 0, 'revalidated': 0, 'miss': 0, 'stored': 0, 'bypass': 0, 'parsed_hit': 0}
+        self.__con = None
+        self.__lock = threading.Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        if self.__con is None:
+            if not os.path.exists(self.path):
+                os.close(os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o600))
+            self.__con = sqlite3.connect(self.path, check_same_thread=False)
+            self.__con.execute(RESPONSE_TABLE_SQL)
+            self.__con.execute(PARSED_TABLE_SQL)
+            self.__con.commit()
+        return self.__con
+
+    def close(self) -> None:
+        if self.__con is not None:
+            self.__con.close()
+            self.__con = None
+
+    def count(self, event: str) -> None:
+        with self.__lock:
+            self.counters[event] += 1
+        metrics.count('http_cache_' + event)
+
+    def endpoint(self, url: str) -> Optional[str]:
+        for name, pattern in ENDPOINTS:
+            if pattern.match(url):
+                return name
+        return None
+
+    def fresh(self, endpoint: str, fetched: float) -> bool:
+        return time.time() - fetched < self.ttl.get(endpoint, 0)
+
+    def lookup(self, namespace: str, url: str) -> Optional[Tuple[Dict[str, str], bytes, float]]:
+        '''
+        return (headers, body, fetched time) of the cached response
+        '''
+        with self.__lock:
+            row = self.connection().execute("SELECT headers, body, fetched FROM responses WHERE namespace = ? AND url = ?", (namespace, url)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1], row[2]
+
+    def store(self, namespace: str, url: str, headers: Mapping[str, str], body: bytes) -> None:
+        kept = {key: headers[key] for key in KEPT_HEADERS if key in headers}
+        with self.__lock:
+            con = self.connection()
+            con.execute("INSERT OR REPLACE INTO responses (namespace, url, endpoint, headers, body, bodyHash, fetched) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (namespace, url, self.endpoint(url), json.dumps(kept), body, body_hash(body), time.time()))
+            con.commit()
+        self.count('stored')
+
+    def touch(self, namespace: str, url: str, headers: Mapping[str, str]) -> None:
+        '''
+        the cached body is still valid (304), restart its ttl and keep the new validators
+        '''
+        entry = self.lookup(namespace, url)
+        if entry is None:
+            return
+        kept = entry[0]
+        kept.update({key: headers[key] for key in ['ETag', 'Last-Modified'] if key in headers})
+        with self.__lock:
+            con = self.connection()
+            con.execute("UPDATE responses SET headers = ?, fetched = ? WHERE namespace = ? AND url = ?", (json.dumps(kept), time.time(), namespace, url))
+            con.commit()
+
+    def get_parsed(self, namespace: str, url: str, kind: str) -> Optional[Any]:
+        '''
+        return the result parsed from the cached response if the response is still fresh, None otherwise
+        '''
+        with self.__lock:
+            row = self.connection().execute(
+                "SELECT parsed.value, responses.endpoint, responses.fetched FROM parsed JOIN responses "
+                "ON parsed.namespace = responses.namespace AND parsed.url = responses.url AND parsed.bodyHash = responses.bodyHash "
+                "WHERE parsed.namespace = ? AND parsed.url = ? AND parsed.kind = ?", (namespace, url, kind)).fetchone()
+        if row is None or not self.fresh(row[1], row[2]):
+            return None
+        self.count('parsed_hit')
+        return json.loads(row[0])
+
+    def put_parsed(self, namespace: str, url: str, kind: str, body: bytes, value: Any) -> None:
+        '''
+        value must be json serializable, tuples come back as lists
+        '''
+        with self.__lock:
+            con = self.connection()
+            con.execute("INSERT OR REPLACE INTO parsed (namespace, url, kind, bodyHash, value) VALUES (?, ?, ?, ?, ?)",
+                        (namespace, url, kind, body_hash(body), json.dumps(value, ensure_ascii=False)))
+            con.commit()
+
+    def invalidate(self, endpoint: str = None) -> int:
+        '''
+        drop the cached responses of the endpoint (all if None) with their parsed results, return how many responses are dropped
+        '''
+        if endpoint is not None and endpoint not in self.ttl:
+            raise Exception("Unknown endpoint: %s" % (endpoint))
+        where, params = ("WHERE endpoint = ?", (endpoint,)) if endpoint is not None else ("", ())
+        with self.__lock:
+            con = self.connection()
+            con.execute("DELETE FROM parsed WHERE (namespace, url) IN (SELECT namespace, url FROM responses %s)" % (where), params)
+            cur = con.execute("DELETE FROM responses %s" % (where), params)
+            con.commit()
+            return cur.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        '''
+        counters of this process, and entries and bytes of each endpoint in the file
+        '''
+        with self.__lock:
+            rows = self.connection().execute("SELECT endpoint, COUNT(*), SUM(LENGTH(body)), MIN(fetched) FROM responses GROUP BY endpoint").fetchall()
+            parsed = self.connection().execute("SELECT COUNT(*) FROM parsed").fetchone()[0]
+            counters = dict(self.counters)
+        now = time.time()
+        entries = {row[0]: {'entries': row[1], 'bytes': row[2], 'oldest_seconds': round(now - row[3]), 'ttl': self.ttl.get(row[0], 0)} for row in rows}
+        return {'counters': counters, 'endpoints': entries, 'parsed': parsed}
+
+class _TeeRaw:
+    '''
+    raw response passing everything read through, the whole body is handed to on_complete once the end is read
+    a response not read to the end (e.g. broken json) is never stored
+    '''
+
+    def __init__(self, raw, on_complete: Callable[[bytes], None]) -> None:
+        self.__raw = raw
+        self.__on_complete = on_complete
+        self.__chunks = []
+
+    def read(self, amt: int = None, *args, **kwargs) -> bytes:
+        # urllib3 responses are read decoded, the cached body is served without Content-Encoding
+        data = self.__raw.read(amt, decode_content=True) if hasattr(self.__raw, 'stream') else self.__raw.read(amt)
+        if data:
+            self.__chunks.append(data)
+        elif self.__on_complete is not None:
+            on_complete, self.__on_complete = self.__on_complete, None
+            on_complete(b''.join(self.__chunks))
+            self.__chunks = []
+        return data
+
+    def stream(self, amt: int = 65536, decode_content: bool = None) -> Iterator[bytes]:
+        while True:
+            data = self.read(amt)
+            if not data:
+                return
+            yield data
+
+    def __getattr__(self, name: str) -> Any:
+        # release_conn, close, _original_response (cookies) ... of the real raw response
+        return getattr(self.__raw, name)
+
+class CachingAdapter(BaseAdapter):
+    '''
+    transport adapter answering GET requests of ENDPOINTS from the cache, others are sent by adapter directly
+    '''
+
+    def __init__(self, adapter: BaseAdapter, cache: HttpCache, namespace: str) -> None:
+        super().__init__()
+        self.adapter = adapter
+        self.cache = cache
+        self.namespace = namespace
+
+    def _cached_response(self, request, headers: Dict[str, str], body: bytes, state: str) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.headers.update(headers)
+        response.headers['X-Cache'] = state
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = io.BytesIO(body)
+        return response
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None) -> requests.Response:
+        endpoint = self.cache.endpoint(request.url)
+        kwargs = {'stream': stream, 'timeout': timeout, 'verify': verify, 'cert': cert, 'proxies': proxies}
+        if request.method != 'GET' or endpoint is None:
+            return self.adapter.send(request, **kwargs)
+        if 'no-cache' in request.headers.get('Cache-Control', ''):
+            self.cache.count('bypass')
+            return self.adapter.send(request, **kwargs)
+        if self.cache.ttl.get(endpoint, 0) <= 0:
+            return self.adapter.send(request, **kwargs)
+        entry = self.cache.lookup(self.namespace, request.url)
+        if entry is not None:
+            headers, body, fetched = entry
+            if self.cache.fresh(endpoint, fetched):
+                self.cache.count('hit')
+                return self._cached_response(request, headers, body, 'hit')
+            request = request.copy()
+            if 'ETag' in headers:
+                request.headers['If-None-Match'] = headers['ETag']
+            if 'Last-Modified' in headers:
+                request.headers['If-Modified-Since'] = headers['Last-Modified']
+        response = self.adapter.send(request, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            self.cache.touch(self.namespace, request.url, response.headers)
+            response.close()
+            self.cache.count('revalidated')
+            return self._cached_response(request, entry[0], entry[1], 'revalidated')
+        self.cache.count('miss')
+        if response.status_code == 200:
+            headers = response.headers
+            url = request.url
+            response.raw = _TeeRaw(response.raw, lambda body: self.cache.store(self.namespace, url, headers, body))
+        return response
+
+    def close(self) -> None:
+        self.adapter.close()
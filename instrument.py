@@ -0,0 +1,105 @@
+import functools
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import *
+
+'''
+timing spans and counters of every phase, and loggers for Alarm
+>>> from instrument import metrics
+>>> with metrics.span('login'):
+...     mytable.login()
+>>> metrics.count('pages', 3)
+>>> metrics.snapshot()
+{'spans': {'login': {'count': 1, 'total': 1.52, 'max': 1.52}}, 'counters': {'pages': 3}}
+>>> metrics.export('metrics.json')
+'''
+
+class Metrics:
+    '''
+    thread safe, spans with the same name are aggregated
+    '''
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.__lock:
+            self.__spans = {}
+            self.__counters = {}
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def timed(self, name: str) -> Callable:
+        '''
+        decorator recording every call of the function as a span of name, like span()
+        spans go to snapshot() and export() (--metrics) only, messages are logged by Alarm.logger
+        each call takes a lock, so time a batch instead of a function called for every row
+        '''
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def add_time(self, name: str, seconds: float) -> None:
+        with self.__lock:
+            span = self.__spans.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+            span['count'] += 1
+            span['total'] += seconds
+            span['max'] = max(span['max'], seconds)
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self.__lock:
+            self.__counters[name] = self.__counters.get(name, 0) + value
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self.__lock:
+            return {
+                'spans': {name: {'count': span['count'], 'total': round(span['total'], 6), 'max': round(span['max'], 6)} for name, span in self.__spans.items()},
+                'counters': dict(self.__counters),
+            }
+
+    def export(self, path: str) -> None:
+        '''
+        write the snapshot to a json file
+        '''
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+
+# shared by class_table.py and solver_backend.py
+metrics = Metrics()
+
+class JsonLogger:
+    '''
+    Alarm logger writing one json line per message
+    >>> Alarm.logger = JsonLogger(open('run.log', 'a'))
+    '''
+
+    def __init__(self, stream: IO = None) -> None:
+        self.stream = stream
+        self.__lock = threading.Lock()
+
+    def __call__(self, level: str, msg: str) -> None:
+        line = json.dumps({'time': round(time.time(), 3), 'level': level, 'msg': msg}, ensure_ascii=False)
+        with self.__lock:
+            stream = self.stream or sys.stderr
+            stream.write(line + '\n')
+            stream.flush()
+
+def quiet_logger(level: str, msg: str) -> None:
+    '''
+    Alarm logger dropping every message
+    '''
+    pass
@@ -0,0 +1,108 @@
+import codecs
+import json
+from typing import *
+
+'''
+decode one array of a json object while the response is still downloading
+>>> r = session.get(url, stream=True)
+>>> for lesson in iter_json_array(r.iter_content(65536), 'data'):
+...     print(lesson['code'])
+only the current element and the undecoded tail of the response are kept in memory
+'''
+
+WHITESPACE = ' \t\n\r'
+DELIMITER = WHITESPACE + ',:]}'
+
+class _Buffer:
+    '''
+    decoded text of the chunks read so far, the consumed head is dropped when more text is read
+    '''
+
+    def __init__(self, chunks: Iterable[Union[bytes, str]]) -> None:
+        self.__chunks = iter(chunks)
+        self.__decoder = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+
+    def more(self) -> bool:
+        '''
+        read one more chunk, return False at the end of the response
+        '''
+        if self.eof:
+            return False
+        for chunk in self.__chunks:
+            if isinstance(chunk, bytes):
+                chunk = self.__decoder.decode(chunk)
+            if chunk:
+                self.text = self.text[self.pos:] + chunk
+                self.pos = 0
+                return True
+        self.text = self.text[self.pos:] + self.__decoder.decode(b'', final=True)
+        self.pos = 0
+        self.eof = True
+        return False
+
+    def peek(self) -> str:
+        '''
+        return the next non-whitespace char without consuming it, '' at the end
+        '''
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.more():
+                return ''
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError("Expect %r at %d, got %r" % (char, self.pos, self.peek()))
+        self.pos += 1
+
+    def value(self, decoder: json.JSONDecoder) -> Any:
+        '''
+        decode the next json value, read more chunks until it is complete
+        a number may be cut by the chunk boundary ("2." of "2.5"), so a value is complete only if a delimiter follows it
+        '''
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.text, self.pos)
+                if (end < len(self.text) and self.text[end] in DELIMITER) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.more()
+
+def iter_json_array(chunks: Iterable[Union[bytes, str]], key: str) -> Iterator[Any]:
+    '''
+    yield the elements of the array `key` of the top level json object one by one
+    other members of the object are decoded and dropped, raise ValueError if the json is broken or has no array `key`
+    '''
+    decoder = json.JSONDecoder()
+    buf = _Buffer(chunks)
+    buf.expect('{')
+    while True:
+        if buf.peek() == '}':
+            raise ValueError("No array %r in the json object" % (key))
+        name = buf.value(decoder)
+        buf.expect(':')
+        if name == key and buf.peek() == '[':
+            break
+        buf.value(decoder)
+        if buf.peek() == ',':
+            buf.pos += 1
+    buf.expect('[')
+    if buf.peek() == ']':
+        return
+    while True:
+        yield buf.value(decoder)
+        char = buf.peek()
+        buf.pos += 1
+        if char == ']':
+            return
+        if char != ',':
+            raise ValueError("Broken json array at %d" % (buf.pos))
@@ -0,0 +1,141 @@
+from typing import *
+from conflict_graph import ConflictGraph
+from solver_backend import NativeBackend
+
+'''
+domain reduction before the solver, and which courses to blame when a course list has NO solution
+>>> from presolve import presolve
+>>> result = presolve({'CS1502': [('CS1502.01', 0b0110)], 'MARX1004': [('MARX1004.01', 0b0010), ('MARX1004.02', 0b1000)]})
+>>> result.domains
+{'CS1502': ['CS1502.01'], 'MARX1004': ['MARX1004.02']}
+>>> result.removed
+{'MARX1004.01': 'conflicts with every class left of CS1502'}
+a class is removed if it conflicts with every class left of another course, until nothing changes
+(a course with one class left fixes its slots, so this covers unit propagation)
+if a course has no class left, the course list has NO solution, and a minimal set of courses that can't be taken together is found
+'''
+
+class PresolveResult:
+    '''
+    domains: course code -> class codes left, in the order given
+    removed: class code -> why it can't be in any solution
+    conflict: courses that can't be taken together, dropping any of them makes the rest solvable, None if not proven
+    conflict_removed: removed of the courses in conflict only, tells how they block each other
+    '''
+
+    def __init__(self, domains: Dict[str, List[str]], removed: Dict[str, str], conflict: List[str] = None,
+                 conflict_removed: Dict[str, str] = None) -> None:
+        self.domains = domains
+        self.removed = removed
+        self.conflict = conflict
+        self.conflict_removed = conflict_removed or {}
+
+    @property
+    def fixed(self) -> Dict[str, str]:
+        '''
+        course code -> the only class left
+        '''
+        return {courseCode: classes[0] for courseCode, classes in self.domains.items() if len(classes) == 1}
+
+    def explain(self) -> List[str]:
+        '''
+        lines telling why conflict can't be taken together
+        '''
+        if self.conflict is None:
+            return []
+        if len(self.conflict) == 1:
+            lines = ["Course %s has no class to choose" % (self.conflict[0])]
+        else:
+            lines = ["Courses %s can't be taken together" % (', '.join(self.conflict))]
+        for class_code, reason in self.conflict_removed.items():
+            lines.append("  %s %s" % (class_code, reason))
+        if self.conflict_removed == {} and len(self.conflict) > 1:
+            lines.append("  every choice of their classes has a time conflict")
+        return lines
+
+def _course_of(courses: Dict[str, List[Tuple[str, int]]]) -> Dict[str, str]:
+    return {class_code: courseCode for courseCode, classes in courses.items() for class_code, _ in classes}
+
+def _propagate(graph: ConflictGraph, domains: Dict[str, int], removed: Dict[str, str]) -> Optional[str]:
+    '''
+    remove classes conflicting with every class left of another course, domains are bitsets of graph numbers
+    removed gets the reason of each class removed, return the first course without any class left
+    '''
+    for courseCode, domain in domains.items():
+        if domain == 0:
+            return courseCode
+    changed = True
+    while changed:
+        changed = False
+        for courseCode in domains:
+            domain = domains[courseCode]
+            left = domain
+            while domain:
+                low = domain & -domain
+                domain ^= low
+                keep = ~graph.adjacency(low.bit_length() - 1)
+                for other, other_domain in domains.items():
+                    if other != courseCode and other_domain & keep == 0:
+                        removed[graph.keys[low.bit_length() - 1]] = "conflicts with every class left of %s" % (other)
+                        left ^= low
+                        break
+            if left != domains[courseCode]:
+                domains[courseCode] = left
+                changed = True
+                if left == 0:
+                    return courseCode
+    return None
+
+def _reduce(courses: Dict[str, List[Tuple[str, int]]], not_prefer: Set[str]) -> Tuple[ConflictGraph, Dict[str, int], Dict[str, str], Optional[str]]:
+    removed = {class_code: "is not preferred" for classes in courses.values() for class_code, _ in classes if class_code in not_prefer}
+    masks = {class_code: mask for classes in courses.values() for class_code, mask in classes if class_code not in not_prefer}
+    graph = ConflictGraph(masks)
+    domains = {courseCode: 0 for courseCode in courses}
+    for courseCode, classes in courses.items():
+        for class_code, _ in classes:
+            if class_code in masks:
+                domains[courseCode] |= 1 << graph.index(class_code)
+    empty = _propagate(graph, domains, removed)
+    return graph, domains, removed, empty
+
+def _infeasible(courses: Dict[str, List[Tuple[str, int]]], not_prefer: Set[str]) -> Tuple[bool, Dict[str, str]]:
+    '''
+    propagation first, the exact search of NativeBackend only if propagation can't tell
+    '''
+    graph, domains, removed, empty = _reduce(courses, not_prefer)
+    if empty is not None:
+        return True, removed
+    left = {courseCode: [(class_code, mask) for class_code, mask in classes if class_code not in removed] for courseCode, classes in courses.items()}
+    return NativeBackend(left).next_solution() is None, removed
+
+def minimal_conflict(courses: Dict[str, List[Tuple[str, int]]], prefer_class_list: List[Tuple[List[str], List[str]]] = []) -> Optional[Tuple[List[str], Dict[str, str]]]:
+    '''
+    a minimal set of courses having NO solution together, and the classes removed among them, None if all courses have a solution
+    every course is dropped once and kept only if the rest become solvable without it
+    '''
+    not_prefer = {item for classTuple in prefer_class_list for item in classTuple[1]}
+    infeasible, removed = _infeasible(courses, not_prefer)
+    if not infeasible:
+        return None
+    conflict = list(courses)
+    for courseCode in list(conflict):
+        rest = [item for item in conflict if item != courseCode]
+        infeasible, rest_removed = _infeasible({item: courses[item] for item in rest}, not_prefer)
+        if infeasible:
+            conflict, removed = rest, rest_removed
+    course_of = _course_of(courses)
+    return conflict, {class_code: reason for class_code, reason in removed.items() if course_of[class_code] in conflict}
+
+def presolve(courses: Dict[str, List[Tuple[str, int]]], prefer_class_list: List[Tuple[List[str], List[str]]] = []) -> PresolveResult:
+    '''
+    courses: course code -> [(class code, schedule mask)], prefer_class_list: same as classTable, not preferred classes are removed
+    if propagation leaves a course without class, the result has the minimal conflict
+    '''
+    graph, domains, removed, empty = _reduce(courses, {item for classTuple in prefer_class_list for item in classTuple[1]})
+    left = {courseCode: [class_code for class_code, _ in classes if class_code not in removed] for courseCode, classes in courses.items()}
+    result = PresolveResult(left, removed)
+    if empty is not None:
+        found = minimal_conflict(courses, prefer_class_list)
+        if found is not None:
+            result.conflict, result.conflict_removed = found
+    return result
@@ -0,0 +1,179 @@
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+from email.message import Message
+from types import SimpleNamespace
+from typing import *
+from urllib.parse import urlparse, parse_qs
+import requests
+from requests.adapters import BaseAdapter
+
+'''
+offline stand-in of passport.ustc.edu.cn and jw.ustc.edu.cn, mount it as the transport of classTable
+>>> from replay import ReplayAdapter, synthetic_lessons
+>>> adapter = ReplayAdapter({'141': synthetic_lessons('141', 5000)}, latency=0.05, failure_rate=0.1)
+>>> mytable = classTable("PB12345678", "qwert123")
+>>> mytable.transport_adapter = adapter
+>>> mytable.login()
+>>> mytable.update_db('141')
+>>> adapter.stats
+{'login_page': 1, 'captcha': 1, 'login': 1, 'semester_index': 2, 'lesson_count': 1, 'lesson_page': 5, ...}
+'''
+
+LOGIN_COOKIE = 'REPLAY_SESSION'
+
+SEMESTER_NAMES = {'141': '2020年春季学期', '221': '2021年秋季学期', '241': '2022年春季学期'}
+
+def synthetic_lessons(semester_id: str, count: int, course_cnt: int = None, seed: int = 0) -> List[Dict]:
+    '''
+    generate lessons in the json format of lesson-search, every course has several classes
+    '''
+    rand = random.Random(seed)
+    course_cnt = course_cnt or max(1, count // 3)
+    lessons = []
+    for num in range(count):
+        course = num % course_cnt
+        segments = []
+        for _ in range(rand.randint(1, 2)):
+            start = rand.randint(1, 12)
+            segments.append("%s: %d(%s)" % ("3C%03d" % (rand.randint(100, 500)), rand.randint(1, 7),
+                                            ','.join(str(time) for time in range(start, min(start + rand.randint(1, 3), 14)))))
+        lessons.append({
+            'id': int(semester_id) * 100000 + num,
+            'code': "S%05d.%02d" % (course, num // course_cnt + 1),
+            'course': {'code': "S%05d" % (course), 'nameZh': "课程%d" % (course), 'credits': rand.choice([1.0, 2.0, 3.0, 4.0])},
+            'suggestScheduleWeeks': [],
+            'semester': {'id': int(semester_id)},
+            'teacherAssignmentList': [{'teacher': {'person': {'nameZh': "教师%d" % (rand.randint(1, count // 2 + 1))}}}],
+            'requiredPeriodInfo': {'total': 60, 'theory': 60, 'practice': 0},
+            'stdCount': rand.randint(0, 120),
+            'limitCount': 120,
+            'scheduleText': {
+                'dateTimeText': {'text': rand.choice(["1~18周", "1~9周", "10~18周", "1~17周(单)", "2~18周(双)"])},
+                'dateTimePlaceText': {'text': ';'.join(segments)},
+            },
+        })
+    return lessons
+
+def load_recorded(path: str) -> List[Dict]:
+    '''
+    load lessons recorded from lesson-search, the file is a json list of lessons or a saved search page
+    '''
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return data['data'] if isinstance(data, dict) else data
+
+def _captcha_png() -> bytes:
+    import PIL.Image
+    img = PIL.Image.new('RGB', (60, 20), (255, 255, 255))
+    f = io.BytesIO()
+    img.save(f, 'PNG')
+    return f.getvalue()
+
+class ReplayAdapter(BaseAdapter):
+    '''
+    requests transport adapter serving lesson pages, semester html, study plan and captcha images
+    latency: seconds added to every request, or a callable (request) -> seconds
+    failure_rate: probability of a lesson page answering 500 or a truncated json
+    pages of jw.ustc.edu.cn carry an ETag, and are answered 304 if If-None-Match still matches
+    '''
+
+    def __init__(self, semesters: Dict[str, List[Dict]], latency: Union[float, Callable] = 0.0, failure_rate: float = 0.0, seed: int = 0) -> None:
+        super().__init__()
+        self.semesters = {str(semester_id): lessons for semester_id, lessons in semesters.items()}
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.stats = {}
+        self.__rand = random.Random(seed)
+        self.__lock = threading.Lock()
+
+    def _count(self, endpoint: str) -> None:
+        with self.__lock:
+            self.stats[endpoint] = self.stats.get(endpoint, 0) + 1
+
+    def _fail(self) -> bool:
+        with self.__lock:
+            return self.__rand.random() < self.failure_rate
+
+    def _response(self, request, status: int = 200, body: Union[str, bytes] = b'', headers: Dict[str, str] = {}) -> requests.Response:
+        response = requests.Response()
+        response.status_code = status
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.headers.update(headers)
+        # the body is read from raw, so stream=True gets it chunk by chunk like a real connection
+        response.raw = io.BytesIO(body.encode('utf-8') if isinstance(body, str) else body)
+        response.raw.release_conn = lambda: None
+        # requests reads Set-Cookie from the raw response
+        msg = Message()
+        for key, value in headers.items():
+            msg[key] = value
+        response.raw._original_response = SimpleNamespace(msg=msg)
+        return response
+
+    def _page(self, request, endpoint: str, body: str) -> requests.Response:
+        etag = '"%s"' % (hashlib.sha1(body.encode('utf-8')).hexdigest()[:16])
+        if request.headers.get('If-None-Match') == etag:
+            self._count(endpoint + '_not_modified')
+            return self._response(request, 304, headers={'ETag': etag})
+        self._count(endpoint)
+        return self._response(request, body=body, headers={'ETag': etag})
+
+    def _logged_in(self, request) -> bool:
+        return LOGIN_COOKIE in request.headers.get('Cookie', '')
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None) -> requests.Response:
+        latency = self.latency(request) if callable(self.latency) else self.latency
+        if latency:
+            time.sleep(latency)
+        url = urlparse(request.url)
+        path = url.path
+        if url.netloc == 'passport.ustc.edu.cn':
+            if path == '/validatecode.jsp':
+                self._count('captcha')
+                return self._response(request, body=_captcha_png(), headers={'Content-Type': 'image/png'})
+            if request.method == 'POST':
+                self._count('login')
+                return self._response(request, body='<html>ok</html>', headers={'Set-Cookie': '%s=1; Domain=.ustc.edu.cn; Path=/' % (LOGIN_COOKIE)})
+            self._count('login_page')
+            return self._response(request, body='<form><input type="hidden" name="CAS_LT" value="LT-replay0000"></form>')
+        if not self._logged_in(request):
+            self._count('redirect')
+            return self._response(request, 302, headers={'Location': 'https://passport.ustc.edu.cn/login'})
+        if path == '/for-std/lesson-search/index/24441':
+            options = ''.join('<option value="%s">%s</option>' % (semester_id, SEMESTER_NAMES.get(semester_id, semester_id + '学期'))
+                              for semester_id in sorted(self.semesters, key=int, reverse=True))
+            return self._page(request, 'semester_index', '<html><select id="semester">%s</select></html>' % (options))
+        if path.startswith('/for-std/lesson-search/semester/'):
+            return self._lesson_page(request, path.split('/')[4], parse_qs(url.query))
+        if path == '/for-std/program':
+            return self._page(request, 'program', '<html><a href="/for-std/program/info/1">\n\t计算机科学与技术\n\t</a></html>')
+        if path.startswith('/for-std/program/root-module-json/'):
+            lessons = next(iter(self.semesters.values()), [])
+            plan = {'allPlanCourses': [{'termTextZhs': ['%d秋' % (num % 4 + 1)], 'course': {'nameZh': item['course']['nameZh'], 'code': item['course']['code']}}
+                                       for num, item in enumerate(lessons[:40])]}
+            return self._page(request, 'plan', json.dumps(plan, ensure_ascii=False))
+        self._count('not_found')
+        return self._response(request, 404)
+
+    def _lesson_page(self, request, semester_id: str, query: Dict[str, List[str]]) -> requests.Response:
+        lessons = self.semesters.get(semester_id, [])
+        narrow = 'codeLike' in query
+        if narrow:
+            lessons = [item for item in lessons if query['codeLike'][0] in item['code']]
+        page, size = [int(item) for item in query.get('queryPage__', ['1,20'])[0].split(',')]
+        if (size > 1 or narrow) and self._fail():
+            self._count('lesson_page_failed')
+            if self.__rand.random() < 0.5:
+                return self._response(request, 500)
+            return self._response(request, body='{"_page_": {"totalRows": ')
+        body = {'_page_': {'page': page, 'size': size, 'totalRows': len(lessons)}, 'data': lessons[(page - 1) * size:page * size]}
+        endpoint = 'lesson_search' if narrow else 'lesson_page' if size > 1 else 'lesson_count'
+        return self._page(request, endpoint, json.dumps(body, ensure_ascii=False))
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,198 @@
+import re
+from functools import lru_cache
+from typing import *
+
+'''
+parser of scheduleWeek and scheduleTime of lesson-search
+>>> from schedule_parser import parse_schedule, schedule_mask
+>>> parse_schedule("1~18周", "3C102: 2(3,4,5)")
+(((1, 2, ..., 18), ((2, 3), (2, 4), (2, 5))),)
+>>> schedule_mask("1~18周", "3C102: 2(3,4,5)") == sum(1 << slot_bit(week, 2, time) for week in range(1, 19) for time in [3, 4, 5])
+True
+results are tuples and ints, weeks and "day(periods)" of every segment are cached by their raw strings,
+since many classes share the same schedule text
+a string which can't be parsed raises ScheduleError telling which part is wrong
+'''
+
+WEEK_CNT = 18
+DAY_CNT = 7
+TIME_CNT = 13
+MASK_BYTES = (WEEK_CNT * DAY_CNT * TIME_CNT + 7) // 8
+
+# distinct schedule strings of a semester are a few thousand
+CACHE_SIZE = 16384
+
+DIGITS = re.compile(r'\d+')
+PARENS = re.compile(r'\(.*\)')
+
+def slot_bit(week: int, day: int, time: int) -> int:
+    '''
+    bit index of (week, day, time) in a schedule mask, all of them start from 1
+    '''
+    return ((week - 1) * DAY_CNT + (day - 1)) * TIME_CNT + (time - 1)
+
+def mask_to_slots(mask: int) -> Iterator[Tuple[int, int, int]]:
+    '''
+    yield every occupied (week, day, time) of a schedule mask
+    '''
+    while mask:
+        low = mask & -mask
+        index = low.bit_length() - 1
+        mask ^= low
+        yield index // (DAY_CNT * TIME_CNT) + 1, index // TIME_CNT % DAY_CNT + 1, index % TIME_CNT + 1
+
+def mask_to_blob(mask: int) -> bytes:
+    return mask.to_bytes(MASK_BYTES, 'little')
+
+def blob_to_mask(blob: bytes) -> int:
+    return int.from_bytes(blob, 'little')
+
+class ScheduleError(ValueError):
+    '''
+    raised for a malformed scheduleWeek or scheduleTime, reason tells which part is wrong
+    '''
+
+    def __init__(self, scheduleWeek: str, scheduleTime: str, reason: str) -> None:
+        super().__init__("Malformed schedule %r / %r: %s" % (scheduleWeek, scheduleTime, reason))
+        self.scheduleWeek = scheduleWeek
+        self.scheduleTime = scheduleTime
+        self.reason = reason
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse_weeks(weeks_raw: str) -> Union[Tuple[int, ...], str]:
+    '''
+    "1~9周,11~17周(单)" -> (1, 2, ..., 9, 11, 13, 15, 17), return the reason instead if malformed
+    '''
+    week_list = []
+    for week_string in weeks_raw.split(','):
+        week = DIGITS.findall(week_string)
+        if len(week) == 1:
+            week_list.append(int(week[0]))
+        elif len(week) == 2:
+            weeks = range(int(week[0]), int(week[1]) + 1)
+            if '单' in week_string:
+                week_list += [item for item in weeks if item % 2 == 1]
+            elif '双' in week_string:
+                week_list += [item for item in weeks if item % 2 == 0]
+            else:
+                week_list += weeks
+        else:
+            return "week %r should be one week or a range" % (week_string)
+    return tuple(week_list)
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse_periods(day_time: str) -> Union[Tuple[Tuple[int, int], ...], str]:
+    '''
+    " 2(3,4,5)" -> ((2, 3), (2, 4), (2, 5)), return the reason instead if malformed
+    '''
+    day = DIGITS.search(day_time)
+    periods = PARENS.search(day_time)
+    if day is None or periods is None:
+        return "%r has no day or periods" % (day_time)
+    return tuple((int(day.group(0)), int(item)) for item in DIGITS.findall(periods.group(0)))
+
+def _segments(scheduleWeek: str, scheduleTime: str) -> Union[List[Tuple[str, str]], str]:
+    '''
+    split the schedule into (weeks, day and periods) of each segment, the room is dropped
+    so segments of different rooms at the same time share the cache
+    '''
+    if not scheduleWeek or not scheduleTime:
+        return "empty schedule text"
+    weeks_split = scheduleWeek.split(';')
+    times_split = scheduleTime.split(';')
+    if len(weeks_split) != len(times_split):
+        # one week text for every segment of the time text
+        weeks_split = weeks_split * len(times_split)
+    segments = []
+    for weeks_raw, places in zip(weeks_split, times_split):
+        parts = places.split(':')
+        if len(parts) != 2:
+            return "%r should be 'room: day(periods)'" % (places)
+        segments.append((weeks_raw, parts[1]))
+    return segments
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse(scheduleWeek: str, scheduleTime: str) -> Union[Tuple, str]:
+    segments = _segments(scheduleWeek, scheduleTime)
+    if isinstance(segments, str):
+        return segments
+    schedule = []
+    for weeks_raw, day_time in segments:
+        weeks = _parse_weeks(weeks_raw)
+        if isinstance(weeks, str):
+            return weeks
+        days = _parse_periods(day_time)
+        if isinstance(days, str):
+            return days
+        schedule.append((weeks, days))
+    return tuple(schedule)
+
+def parse_schedule(scheduleWeek: str, scheduleTime: str) -> Tuple[Tuple[Tuple[int, ...], Tuple[Tuple[int, int], ...]], ...]:
+    '''
+    return ((weeks, ((day, period), ...)), ...), one item for each segment of scheduleTime seperated by ';'
+    '''
+    result = _parse(scheduleWeek, scheduleTime)
+    if isinstance(result, str):
+        raise ScheduleError(scheduleWeek, scheduleTime, result)
+    return result
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _segment_mask(weeks_raw: str, day_time: str) -> Union[int, str]:
+    weeks = _parse_weeks(weeks_raw)
+    if isinstance(weeks, str):
+        return weeks
+    days = _parse_periods(day_time)
+    if isinstance(days, str):
+        return days
+    mask = 0
+    for week in weeks:
+        for day, time in days:
+            # slots out of the table (e.g. week 19) are dropped
+            if 1 <= week <= WEEK_CNT and 1 <= day <= DAY_CNT and 1 <= time <= TIME_CNT:
+                mask |= 1 << slot_bit(week, day, time)
+    return mask
+
+def _mask(scheduleWeek: str, scheduleTime: str) -> Union[int, str]:
+    segments = _segments(scheduleWeek, scheduleTime)
+    if isinstance(segments, str):
+        return segments
+    mask = 0
+    for weeks_raw, day_time in segments:
+        segment = _segment_mask(weeks_raw, day_time)
+        if isinstance(segment, str):
+            return segment
+        mask |= segment
+    return mask
+
+def schedule_mask(scheduleWeek: str, scheduleTime: str) -> int:
+    '''
+    occupancy bitmask of the schedule, see slot_bit()
+    '''
+    result = _mask(scheduleWeek, scheduleTime)
+    if isinstance(result, str):
+        raise ScheduleError(scheduleWeek, scheduleTime, result)
+    return result
+
+def parse_masks(schedules: Iterable[Tuple[str, str]]) -> Tuple[List[Optional[int]], List[ScheduleError]]:
+    '''
+    masks of a whole semester at once, every distinct (scheduleWeek, scheduleTime) is parsed once
+    return the masks in the same order (None if malformed) and one ScheduleError for each distinct malformed schedule
+    '''
+    masks = []
+    errors = {}
+    for scheduleWeek, scheduleTime in schedules:
+        result = _mask(scheduleWeek, scheduleTime)
+        if isinstance(result, str):
+            if (scheduleWeek, scheduleTime) not in errors:
+                errors[(scheduleWeek, scheduleTime)] = ScheduleError(scheduleWeek, scheduleTime, result)
+            result = None
+        masks.append(result)
+    return masks, list(errors.values())
+
+def cache_info() -> Dict[str, Dict[str, int]]:
+    return {'schedule': _parse.cache_info()._asdict(), 'segment_mask': _segment_mask.cache_info()._asdict(),
+            'weeks': _parse_weeks.cache_info()._asdict(), 'periods': _parse_periods.cache_info()._asdict()}
+
+def cache_clear() -> None:
+    for func in [_parse, _segment_mask, _parse_weeks, _parse_periods]:
+        func.cache_clear()
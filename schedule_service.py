@@ -0,0 +1,307 @@
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from typing import *
+from class_table import classTable, Alarm, CourseDB
+from catalog import SemesterCatalog
+from instrument import metrics, JsonLogger, quiet_logger
+
+'''
+schedule many students at once, the courses of each semester are read from course.db only once
+and shared by every request, each request gets its own classTable
+>>> from schedule_service import ScheduleService
+>>> with ScheduleService(['141'], processes=4) as service:
+...     service.solve({'id': 'PB001', 'semester': '141', 'courses': ['CS1502', 'MARX1004'], 'k': 2})
+{'id': 'PB001', 'solutions': [['CS1502.01', 'MARX1004.03'], ['CS1502.02', 'MARX1004.03']]}
+request fields:
+    semester, courses: required
+    k: number of solutions, default 1
+    prefer: class codes you prefer, the other classes of their courses are NOT preferred
+    prefer_free: {'weeks': [...], 'days': [...], 'times': [...]} prefer sections NOT meeting then, see classTable.prefer_free()
+    backend: 'z3', 'native' or 'check'
+    optimal: use solve_optimal() instead, avoid_teachers is used as classTable.avoid_teacher_list
+    export: also return the first solution as export_class_table()
+a request which can't be answered gets 'error' and 'status' instead of solutions, e.g. an unknown semester or course code,
+so "solutions": [] always means NO class table of the courses exists
+$ python3 -m class_table batch requests.jsonl -o responses.jsonl
+$ python3 -m class_table serve -s 141 --port 8000
+$ curl -d '{"semester": "141", "courses": ["CS1502"]}' http://127.0.0.1:8000/solve
+'''
+
+class RequestError(Exception):
+    '''
+    the request is wrong rather than unsolvable, status is the http status of serve()
+    '''
+
+    def __init__(self, msg: str, status: int = 400) -> None:
+        super().__init__(msg)
+        self.status = status
+
+class SharedCatalog:
+    '''
+    read-only in-memory catalogs of some semesters, drop-in for CourseDB in classTable
+    schedule masks missing in course.db are parsed once here instead of in every request
+    '''
+
+    def __init__(self, semesters: List[str], db: CourseDB = None) -> None:
+        db = db if db is not None else CourseDB()
+        self.semesters = [str(semester) for semester in semesters]
+        self.__catalogs = {}
+        for semester in self.semesters:
+            catalog = SemesterCatalog.from_db(db, semester, lambda e: Alarm.warning(str(e)))
+            if len(catalog) == 0:
+                Alarm.warning("No course of semester %s, please update_db() first" % (semester))
+            self.__catalogs[semester] = catalog
+        Alarm.success("Catalog loaded, %d classes of semester %s" % (len(self), ', '.join(self.semesters)))
+
+    def __len__(self) -> int:
+        return sum(len(catalog) for catalog in self.__catalogs.values())
+
+    def catalog(self, semester: str) -> SemesterCatalog:
+        semester = str(semester)
+        if semester not in self.__catalogs:
+            raise Exception("Semester %s is not loaded" % (semester))
+        return self.__catalogs[semester]
+
+    def get_courses(self, semester: str, course_codes: List[str], columns: List[str]) -> Dict[str, List[Tuple]]:
+        '''
+        same as CourseDB.get_courses()
+        '''
+        return self.catalog(semester).get_courses(semester, course_codes, columns)
+
+    def get_classes(self, semester: str, class_codes: List[str], columns: List[str]) -> Dict[str, Tuple]:
+        '''
+        same as CourseDB.get_classes()
+        '''
+        return self.catalog(semester).get_classes(semester, class_codes, columns)
+
+def solve_request(catalog: SharedCatalog, request: Dict) -> Dict:
+    '''
+    answer one request with a new classTable reading from the catalog
+    errors are returned in 'error' with the http status in 'status', 4xx for a wrong request and 500 otherwise
+    '''
+    response = {'id': request.get('id')}
+    try:
+        for field in ['semester', 'courses']:
+            if field not in request:
+                raise RequestError("Missing field: %s" % (field))
+        try:
+            k = int(request.get('k', 1))
+        except (ValueError, TypeError):
+            raise RequestError("k must be an integer, got %r" % (request['k']))
+        if k < 1:
+            raise RequestError("k must be positive, got %d" % (k))
+        semester = str(request['semester'])
+        if semester not in catalog.semesters:
+            raise RequestError("Unknown semester: %s, loaded: %s" % (semester, ', '.join(catalog.semesters)), 404)
+        if len(catalog.catalog(semester)) == 0:
+            raise RequestError("Semester %s has no course" % (semester), 404)
+        missing = [courseCode for courseCode, classes in catalog.get_courses(semester, list(request['courses']), ['classCode']).items() if classes == []]
+        if missing != []:
+            raise RequestError("Course codes not found in semester %s: %s" % (semester, ', '.join(missing)), 404)
+        table = classTable("", "", catalog)
+        table.semester = semester
+        table.course_code_list = list(request['courses'])
+        table.solver_backend = request.get('backend', classTable.solver_backend)
+        if request.get('prefer'):
+            table.add_prefer_class(request['prefer'])
+        if request.get('prefer_free'):
+            free = request['prefer_free']
+            table.prefer_free(free.get('weeks'), free.get('days'), free.get('times'))
+        if request.get('optimal'):
+            table.avoid_teacher_list = list(request.get('avoid_teachers', []))
+            cur_classes = table.solve_optimal()
+            solutions = [cur_classes] if cur_classes is not None else []
+        else:
+            solutions = table.enumerate_solutions(k)
+        response['solutions'] = solutions
+        if request.get('export') and solutions != []:
+            table.set_cur_class(solutions[0])
+            response['table'] = table.export_class_table()
+    except RequestError as e:
+        response['error'] = str(e)
+        response['status'] = e.status
+    except Exception as e:
+        response['error'] = str(e)
+        response['status'] = 500
+    return response
+
+# catalog of a worker process, set by _init_worker()
+_catalog = None
+
+def _init_worker(catalog: SharedCatalog, verbose: bool) -> None:
+    global _catalog
+    _catalog = catalog
+    # Ctrl-C stops the service in the main process, the workers are closed by it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    Alarm.logger = JsonLogger() if verbose else quiet_logger
+
+def _solve_in_worker(request: Dict) -> Dict:
+    return solve_request(_catalog, request)
+
+class ScheduleService:
+    '''
+    a process pool answering requests, the catalog is handed to every worker once when the pool starts
+    (inherited without copying on fork), z3 is NOT thread safe so the workers are processes
+    processes=0 answers requests in the calling process one at a time, messages of Alarm are kept
+    '''
+
+    def __init__(self, semesters: List[str], processes: int = None, db: CourseDB = None, verbose: bool = False) -> None:
+        self.catalog = SharedCatalog(semesters, db)
+        self.processes = os.cpu_count() if processes is None else processes
+        self.stats = {'requests': 0, 'errors': 0, 'seconds': 0.0}
+        self.__lock = threading.Lock()
+        # solves of processes=0 share this process, one at a time
+        self.__solve_lock = threading.Lock()
+        self.__pool = None
+        if self.processes > 0:
+            import multiprocessing
+            self.__pool = multiprocessing.Pool(self.processes, _init_worker, (self.catalog, verbose))
+
+    def __enter__(self) -> 'ScheduleService':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.__pool is not None:
+            self.__pool.close()
+            self.__pool.join()
+            self.__pool = None
+
+    def _record(self, response: Dict, seconds: float) -> Dict:
+        with self.__lock:
+            self.stats['requests'] += 1
+            self.stats['errors'] += 'error' in response
+            self.stats['seconds'] += seconds
+        metrics.count('service_requests')
+        return response
+
+    def solve(self, request: Dict) -> Dict:
+        '''
+        answer one request, safe to call from many threads
+        '''
+        start = time.perf_counter()
+        if self.__pool is not None:
+            response = self.__pool.apply(_solve_in_worker, (request,))
+        else:
+            with self.__solve_lock:
+                response = solve_request(self.catalog, request)
+        return self._record(response, time.perf_counter() - start)
+
+    def solve_all(self, requests: Iterable[Dict], chunksize: int = 4) -> Iterator[Dict]:
+        '''
+        answer requests in order, they are solved in parallel by the pool, chunksize requests are sent to a worker at once
+        '''
+        if self.__pool is None:
+            for request in requests:
+                yield self.solve(request)
+            return
+        start = time.perf_counter()
+        for response in self.__pool.imap(_solve_in_worker, requests, chunksize):
+            now = time.perf_counter()
+            yield self._record(response, now - start)
+            start = now
+
+def read_requests(path: str) -> List[Dict]:
+    '''
+    read a jsonl file of requests ('-' for stdin), a broken line becomes a request with 'error'
+    '''
+    f = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    requests = []
+    try:
+        for num, line in enumerate(f, 1):
+            if line.strip() == '':
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("not a json object")
+            except ValueError as e:
+                request = {'id': None, 'error': "Line %d: %s" % (num, e)}
+            requests.append(request)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    return requests
+
+def run_batch(path: str, output: str = None, semesters: List[str] = None, processes: int = None, verbose: bool = False) -> Dict:
+    '''
+    answer every request of a jsonl file, responses are written as jsonl in the same order
+    semesters default to those the requests ask for
+    '''
+    requests = read_requests(path)
+    if semesters is None:
+        semesters = sorted({str(request['semester']) for request in requests if 'semester' in request and 'error' not in request})
+    out = sys.stdout if output is None else open(output, 'w', encoding='utf-8')
+    try:
+        with ScheduleService(semesters, processes, verbose=verbose) as service:
+            responses = service.solve_all(request for request in requests if 'error' not in request)
+            broken = 0
+            for request in requests:
+                if 'error' in request:
+                    broken += 1
+                    response = request
+                else:
+                    response = next(responses)
+                out.write(json.dumps(response, ensure_ascii=False) + '\n')
+            stats = dict(service.stats, errors=service.stats['errors'] + broken)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    Alarm.success("%d requests answered, %d errors" % (len(requests), stats['errors']))
+    return stats
+
+def serve(semesters: List[str], host: str = '127.0.0.1', port: int = 8000, processes: int = None, verbose: bool = False) -> None:
+    '''
+    answer requests over http until interrupted
+    POST /solve with a request as the json body, GET /stats for the counters of the service
+    '''
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    with ScheduleService(semesters, processes, verbose=verbose) as service:
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, status: int, body: Dict) -> None:
+                data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self) -> None:
+                if self.path == '/stats':
+                    self._reply(200, dict(service.stats, semesters=service.catalog.semesters))
+                else:
+                    self._reply(404, {'error': "Not found"})
+
+            def do_POST(self) -> None:
+                if self.path != '/solve':
+                    self._reply(404, {'error': "Not found"})
+                    return
+                try:
+                    request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                    if not isinstance(request, dict):
+                        raise ValueError("not a json object")
+                except ValueError as e:
+                    self._reply(400, {'error': str(e)})
+                    return
+                response = service.solve(request)
+                self._reply(response.get('status', 200), response)
+
+            def log_message(self, format: str, *args) -> None:
+                if verbose:
+                    super().log_message(format, *args)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        Alarm.success("Serving on http://%s:%d" % (host, server.server_address[1]))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,197 @@
+import json
+import random
+import threading
+import time
+from typing import *
+from class_table import Alarm
+from instrument import metrics
+
+'''
+watch the seats of a few classes instead of updating the whole semester
+>>> from seat_watcher import SeatWatcher
+>>> watcher = SeatWatcher(mytable, '141', courses=['CS1502', 'MARX1004'], classes=['CS1502.01', 'MARX1004.03'], jsonl='seats.jsonl')
+>>> watcher.run(interval=60)    # until Ctrl-C
+every poll asks lesson-search for the lessons of each watched course only (one small page per course),
+the seats are compared with the last poll and an event is emitted for every class that changed:
+    snapshot: first time the class is seen
+    opened: the class was full and has seats now
+    filled: the class had seats and is full now
+    changed: stdCount or limitCount changed otherwise
+    removed: the class is no longer in lesson-search
+{"time": 1650000000.0, "event": "opened", "semester": "141", "classCode": "CS1502.01", "courseName": "计算机网络", "stdCount": 119, "limitCount": 120, "seats": 1, ...}
+'''
+
+class RateLimiter:
+    '''
+    token bucket, at most `rate` requests per second on average with bursts of `burst` requests, thread safe
+    '''
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.__tokens = float(burst)
+        self.__last = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def acquire(self) -> float:
+        '''
+        wait until a request is allowed, return the seconds waited
+        '''
+        with self.__lock:
+            now = time.monotonic()
+            self.__tokens = min(self.burst, self.__tokens + (now - self.__last) * self.rate)
+            self.__last = now
+            self.__tokens -= 1
+            wait = -self.__tokens / self.rate if self.__tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0, rand: random.Random = random) -> float:
+    '''
+    "full jitter" exponential backoff, a random delay in [0, min(cap, base * 2 ** attempt)]
+    so watchers failing at the same time do not retry at the same time
+    '''
+    return rand.uniform(0, min(cap, base * 2 ** attempt))
+
+def seats_event(previous: Optional[Tuple[int, int]], current: Optional[Tuple[int, int]]) -> Optional[str]:
+    '''
+    kind of change from previous to current (stdCount, limitCount), None if nothing changed
+    '''
+    if previous is None:
+        return 'snapshot' if current is not None else None
+    if current is None:
+        return 'removed'
+    if previous == current:
+        return None
+    was_full = previous[0] >= previous[1]
+    is_full = current[0] >= current[1]
+    if was_full and not is_full:
+        return 'opened'
+    if not was_full and is_full:
+        return 'filled'
+    return 'changed'
+
+class SeatWatcher:
+    '''
+    table is a logged in classTable, its search_lessons() is used for the narrow queries
+    courses: course codes to query, classes: class codes of them to watch, every class of the courses if None
+    callback(event) and the jsonl file (a path appended to, or a file object) receive every event
+    '''
+
+    def __init__(self, table, semester: str, courses: List[str], classes: List[str] = None, callback: Callable[[Dict], None] = None,
+                 jsonl: Union[str, IO] = None, rate: float = 1.0, max_retry: int = 3, seed: int = None) -> None:
+        self.table = table
+        self.semester = str(semester)
+        self.courses = list(dict.fromkeys(courses))
+        self.classes = set(classes) if classes is not None else None
+        self.callback = callback
+        self.limiter = RateLimiter(rate)
+        self.max_retry = max_retry
+        # class code -> (stdCount, limitCount) of the last poll
+        self.snapshot = {}
+        # class code -> course code of the classes in snapshot
+        self.__course_of = {}
+        self.polls = 0
+        self.__jsonl = jsonl
+        self.__file = None
+        self.__rand = random.Random(seed)
+        self.__stop = threading.Event()
+
+    def stop(self) -> None:
+        '''
+        stop run() from another thread, it returns after the current poll
+        '''
+        self.__stop.set()
+
+    def close(self) -> None:
+        if self.__file is not None and self.__file is not self.__jsonl:
+            self.__file.close()
+        self.__file = None
+
+    def _emit(self, event: Dict) -> None:
+        metrics.count('watch_events')
+        if self.callback is not None:
+            self.callback(event)
+        if self.__jsonl is not None:
+            if self.__file is None:
+                self.__file = open(self.__jsonl, 'a', encoding='utf-8') if isinstance(self.__jsonl, str) else self.__jsonl
+            self.__file.write(json.dumps(event, ensure_ascii=False) + '\n')
+            self.__file.flush()
+
+    def _search(self, course_code: str) -> Optional[List[Dict]]:
+        '''
+        lessons of one course, retried with jittered backoff, None if every try failed
+        '''
+        for attempt in range(self.max_retry):
+            self.limiter.acquire()
+            metrics.count('watch_requests')
+            try:
+                return self.table.search_lessons(self.semester, course_code)
+            except Exception as e:
+                if attempt + 1 == self.max_retry:
+                    Alarm.warning("Seats of %s get failed: %s" % (course_code, e))
+                    return None
+                if self.__stop.wait(backoff_delay(attempt, rand=self.__rand)):
+                    return None
+        return None
+
+    def poll(self) -> List[Dict]:
+        '''
+        query every watched course once, emit and return the events of the classes changed since the last poll
+        classes of a course whose query failed keep their last seats
+        '''
+        events = []
+        now = round(time.time(), 3)
+        for course_code in self.courses:
+            lessons = self._search(course_code)
+            if lessons is None:
+                continue
+            current = {}
+            for item in lessons:
+                if self.classes is None or item['code'] in self.classes:
+                    current[item['code']] = item
+            known = [class_code for class_code, course in self.__course_of.items() if course == course_code]
+            for class_code in list(dict.fromkeys(known + list(current))):
+                item = current.get(class_code)
+                seats = (item['stdCount'], item['limitCount']) if item is not None else None
+                previous = self.snapshot.get(class_code)
+                kind = seats_event(previous, seats)
+                if seats is None:
+                    self.snapshot.pop(class_code, None)
+                    self.__course_of.pop(class_code, None)
+                else:
+                    self.snapshot[class_code] = seats
+                    self.__course_of[class_code] = course_code
+                if kind is None:
+                    continue
+                event = {'time': now, 'event': kind, 'semester': self.semester, 'classCode': class_code, 'courseCode': course_code}
+                if item is not None:
+                    teachers = item['teacherAssignmentList']
+                    event.update({'courseName': item['course']['nameZh'], 'teacher': teachers[0]['teacher']['person']['nameZh'] if teachers != [] else None,
+                                  'stdCount': seats[0], 'limitCount': seats[1], 'seats': seats[1] - seats[0]})
+                if previous is not None:
+                    event.update({'previousStdCount': previous[0], 'previousLimitCount': previous[1]})
+                events.append(event)
+                self._emit(event)
+        if self.polls == 0 and self.classes is not None:
+            for class_code in sorted(self.classes - set(self.snapshot)):
+                Alarm.warning("Class %s is not found in lesson-search" % (class_code))
+        self.polls += 1
+        metrics.count('watch_polls')
+        return events
+
+    def run(self, interval: float = 60.0, polls: int = None) -> None:
+        '''
+        poll every interval seconds (+-20% jitter) until stop(), Ctrl-C, or `polls` polls are done
+        '''
+        try:
+            while not self.__stop.is_set():
+                self.poll()
+                if polls is not None and self.polls >= polls:
+                    break
+                self.__stop.wait(interval * self.__rand.uniform(0.8, 1.2))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
@@ -0,0 +1,220 @@
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+from typing import *
+from class_table import COURSE_TABLE_SQL, COURSE_COLUMNS
+
+'''
+one sqlite file for each semester, so a semester is written, replaced, dropped and vacuumed without touching the others
+>>> from semester_store import SemesterStore
+>>> store = SemesterStore('courses')
+>>> with store.update('141') as writer:
+...     writer.write(rows)    # rows of courses table, as classTable._lesson_to_row()
+>>> writer.summary
+{'inserted': [139236, ...], 'changed': [], 'removed': []}
+>>> store.semesters()
+['121', '141']
+the file of a semester holds the courses table of course.db with the lessons of that semester only,
+update() writes only the lessons inserted or changed (by rowHash) and deletes those removed, all in one transaction,
+replace() fills courses_new and renames it to courses in the same transaction, for the first load and full rebuilds,
+either way readers see the old semester until the new one is complete, and a failed refresh leaves the old one as it was
+'''
+
+SEMESTER_FILE = re.compile(r'^(\d+)\.db$')
+
+# %s is the table written, courses_new by replace(), courses by update()
+INSERT_SQL = "INSERT OR REPLACE INTO %%s (%s) VALUES (%s)" % (', '.join(COURSE_COLUMNS), ', '.join(['?'] * len(COURSE_COLUMNS)))
+
+INDEX_SQL = [
+    "CREATE INDEX idx_courses_course_code ON courses (courseCode, semester)",
+    "CREATE INDEX idx_courses_class_code ON courses (classCode, semester)",
+]
+
+class PartitionWriter:
+    '''
+    rows written into one semester file, tells which lessons are inserted, changed or removed
+    in_place: write into courses itself, lessons unchanged are skipped and those removed are deleted by finish()
+    otherwise every row is written into courses_new
+    '''
+
+    def __init__(self, con: sqlite3.Connection, semester: str, stored: Dict[int, str], in_place: bool = False) -> None:
+        self.semester = semester
+        # id -> rowHash of the lessons before the refresh
+        self.stored = stored
+        self.in_place = in_place
+        self.summary = {'inserted': [], 'changed': [], 'removed': []}
+        # rows written to the file, only the inserted and changed ones if in_place
+        self.rows = 0
+        self.__con = con
+        self.__seen = set()
+
+    def write(self, rows: List[Tuple]) -> None:
+        '''
+        rows of the same lesson written twice (a retried page) are written once
+        '''
+        id_col = COURSE_COLUMNS.index('id')
+        hash_col = COURSE_COLUMNS.index('rowHash')
+        new_rows = []
+        for row in rows:
+            if row[id_col] in self.__seen:
+                continue
+            self.__seen.add(row[id_col])
+            if row[id_col] not in self.stored:
+                self.summary['inserted'].append(row[id_col])
+            elif self.stored[row[id_col]] != row[hash_col]:
+                self.summary['changed'].append(row[id_col])
+            elif self.in_place:
+                continue
+            new_rows.append(row)
+        self.__con.executemany(INSERT_SQL % ('courses' if self.in_place else 'courses_new'), new_rows)
+        self.rows += len(new_rows)
+
+    def finish(self) -> None:
+        self.summary['removed'] = [lesson_id for lesson_id in self.stored if lesson_id not in self.__seen]
+        if self.in_place:
+            self.__con.executemany("DELETE FROM courses WHERE id = ?", [(lesson_id,) for lesson_id in self.summary['removed']])
+
+class SemesterStore:
+    '''
+    files are named <semester id>.db in directory, created when a semester is written first time
+    '''
+
+    def __init__(self, directory: str = 'courses') -> None:
+        self.directory = directory
+
+    def path(self, semester: str) -> str:
+        return os.path.join(self.directory, '%s.db' % (semester))
+
+    def exists(self, semester: str) -> bool:
+        return os.path.exists(self.path(semester))
+
+    def semesters(self) -> List[str]:
+        '''
+        semesters having a file, oldest first
+        '''
+        if not os.path.isdir(self.directory):
+            return []
+        found = [match.group(1) for match in map(SEMESTER_FILE.match, os.listdir(self.directory)) if match is not None]
+        return sorted(found, key=int)
+
+    def connect(self, semester: str, path: str = None) -> sqlite3.Connection:
+        '''
+        transactions are begun and committed explicitly
+        '''
+        os.makedirs(self.directory, exist_ok=True)
+        con = sqlite3.connect(path or self.path(semester), timeout=30, isolation_level=None, check_same_thread=False)
+        # WAL is persistent, readers are not blocked while the semester is being written
+        con.execute("PRAGMA journal_mode=WAL")
+        return con
+
+    @contextmanager
+    def update(self, semester: str) -> Iterator[PartitionWriter]:
+        '''
+        apply the rows written in the with block to the semester as a delta of the lessons in the file, at once when the block ends
+        only the lessons inserted or changed are written, so a refresh changing few lessons writes few rows
+        nothing is changed if the block raises, a semester having no file yet is built by replace()
+        '''
+        semester = str(semester)
+        if not self.exists(semester):
+            with self.replace(semester) as writer:
+                yield writer
+            return
+        con = self.connect(semester)
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                stored = dict(con.execute("SELECT id, rowHash FROM courses").fetchall())
+                writer = PartitionWriter(con, semester, stored, in_place=True)
+                yield writer
+                writer.finish()
+                con.execute("COMMIT")
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+        finally:
+            con.close()
+
+    @contextmanager
+    def replace(self, semester: str, stored: Dict[int, str] = None) -> Iterator[PartitionWriter]:
+        '''
+        replace every lesson of the semester by the rows written in the with block, at once when the block ends
+        nothing is changed if the block raises
+        stored: id -> rowHash the summary compares with instead of the lessons in the file, e.g. those still in course.db
+        a new semester is built in a temporary file renamed when complete, so it has no file before
+        '''
+        semester = str(semester)
+        new = not self.exists(semester)
+        path = self.path(semester) + '.tmp' if new else self.path(semester)
+        if new:
+            self._remove_file(path)
+        con = self.connect(semester, path)
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                has_table = con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'courses'").fetchone() is not None
+                if stored is None:
+                    stored = dict(con.execute("SELECT id, rowHash FROM courses").fetchall()) if has_table else {}
+                con.execute("DROP TABLE IF EXISTS courses_new")
+                con.execute(COURSE_TABLE_SQL % ("courses_new"))
+                writer = PartitionWriter(con, semester, stored)
+                yield writer
+                writer.finish()
+                con.execute("DROP TABLE IF EXISTS courses")
+                con.execute("ALTER TABLE courses_new RENAME TO courses")
+                for sql in INDEX_SQL:
+                    con.execute(sql)
+                con.execute("COMMIT")
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+        except BaseException:
+            con.close()
+            if new:
+                self._remove_file(path)
+            raise
+        con.close()
+        if new:
+            # the log is checkpointed and removed by the close
+            os.replace(path, self.path(semester))
+
+    def count(self, semester: str) -> int:
+        con = sqlite3.connect(self.path(semester))
+        try:
+            return con.execute("SELECT COUNT(*) FROM courses").fetchone()[0]
+        finally:
+            con.close()
+
+    def size(self, semester: str) -> int:
+        '''
+        bytes of the file with its write-ahead log
+        '''
+        path = self.path(semester)
+        return sum(os.path.getsize(path + suffix) for suffix in ['', '-wal', '-shm'] if os.path.exists(path + suffix))
+
+    def vacuum(self, semester: str) -> Tuple[int, int]:
+        '''
+        rebuild the file of the semester only, return its bytes before and after
+        '''
+        before = self.size(semester)
+        con = self.connect(semester)
+        try:
+            con.execute("VACUUM")
+            con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            con.close()
+        return before, self.size(semester)
+
+    def remove(self, semester: str) -> int:
+        '''
+        delete the file of the semester, return the bytes freed
+        '''
+        return self._remove_file(self.path(semester))
+
+    def _remove_file(self, path: str) -> int:
+        freed = 0
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.exists(path + suffix):
+                freed += os.path.getsize(path + suffix)
+                os.remove(path + suffix)
+        return freed
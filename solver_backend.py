@@ -0,0 +1,350 @@
+from abc import ABC, abstractmethod
+from typing import *
+from conflict_graph import ConflictGraph
+
+'''
+backends behind classTable.solve(), choose one by classTable.solver_backend
+>>> mytable.solver_backend = 'native'   # pure python backtracking, z3 is not needed
+>>> mytable.solver_backend = 'z3'       # z3 SMT solver
+>>> mytable.solver_backend = 'check'    # run both and cross-check the results
+'''
+
+class SolverBackend(ABC):
+    '''
+    a backend holds the encoded problem of one course list
+    every solution found is blocked, so next_solution() never returns the same solution twice
+    '''
+    name = ''
+
+    @abstractmethod
+    def block(self, classes: List[str]) -> None:
+        '''
+        forbid choosing all the classes again
+        '''
+
+    @abstractmethod
+    def reset(self, history: List[List[str]]) -> None:
+        '''
+        drop all blocked solutions, then block every solution in history
+        '''
+
+    @abstractmethod
+    def next_solution(self) -> Optional[List[str]]:
+        '''
+        return the class codes of a new solution, None if NO solution
+        '''
+
+class Z3Backend(SolverBackend):
+    '''
+    the constraint is encoded once at the base level, blocking clauses live in a pushed level
+    '''
+    name = 'z3'
+
+    def __init__(self, constraint, class_var: Dict[str, Any]) -> None:
+        import z3
+        self.__class_var = class_var
+        self.__solver = z3.Solver()
+        self.__solver.add(constraint)
+        self.__solver.push()
+
+    def _block_clause(self, classes: List[str]):
+        import z3
+        # a class not in the problem (e.g. removed by presolve) can't be chosen, so the solution can't come again
+        if any(item not in self.__class_var for item in classes):
+            return z3.BoolVal(True)
+        return z3.Not(z3.And([self.__class_var[item] for item in classes]))
+
+    def block(self, classes: List[str]) -> None:
+        self.__solver.add(self._block_clause(classes))
+
+    def reset(self, history: List[List[str]]) -> None:
+        self.__solver.pop()
+        self.__solver.push()
+        for classes in history:
+            self.block(classes)
+
+    def next_solution(self) -> Optional[List[str]]:
+        import z3
+        if self.__solver.check() != z3.sat:
+            return None
+        model = self.__solver.model()
+        cur_classes = []
+        for item in model:
+            if model[item] == z3.BoolVal(True):
+                cur_classes.append(str(item).split('_')[0])
+        self.block(cur_classes)
+        return cur_classes
+
+class NativeBackend(SolverBackend):
+    '''
+    backtracking search over the sections of each course
+    the course with the fewest sections left is chosen first, and after each choice the sections
+    conflicting with it are removed from the other courses (conflict bitsets of ConflictGraph),
+    a course without sections left prunes the branch at once
+    '''
+    name = 'native'
+
+    def __init__(self, courses: Dict[str, List[Tuple[str, int]]], prefer_class_list: List[Tuple[List[str], List[str]]] = []) -> None:
+        '''
+        courses: course code -> [(class code, schedule mask)]
+        prefer_class_list: [(prefer class codes, not prefer class codes)], same as classTable
+        '''
+        self.__courses = list(courses.keys())
+        not_prefer = {item for classTuple in prefer_class_list for item in classTuple[1]}
+        masks = {}
+        course_of = {}
+        for courseCode, classes in courses.items():
+            for classCode, mask in classes:
+                course_of[classCode] = courseCode
+                if classCode not in not_prefer:
+                    masks[classCode] = mask
+        self.__class_codes = set(course_of.keys())
+        self.__graph = ConflictGraph(masks)
+        self.__domains = {courseCode: 0 for courseCode in self.__courses}
+        for classCode in masks:
+            self.__domains[course_of[classCode]] |= 1 << self.__graph.index(classCode)
+        # at least one of them must be chosen, None means no such requirement
+        self.__prefer = None
+        if prefer_class_list != []:
+            self.__prefer = {item for classTuple in prefer_class_list for item in classTuple[0] if item in self.__class_codes}
+        self.__course_of = course_of
+        self.reset([])
+
+    def _restrict(self, classes: List[str]) -> Optional[FrozenSet[str]]:
+        '''
+        None if some class is not in the problem, such a solution can't come again
+        '''
+        if any(item not in self.__class_codes for item in classes):
+            return None
+        return frozenset(classes)
+
+    def block(self, classes: List[str]) -> None:
+        blocked = self._restrict(classes)
+        if blocked is not None:
+            self.__blocked.append(blocked)
+
+    def reset(self, history: List[List[str]]) -> None:
+        self.__blocked = [blocked for blocked in map(self._restrict, history) if blocked is not None]
+        self.__search = self._search(self.__domains, [])
+
+    def _search(self, domains: Dict[str, int], chosen: List[int]) -> Iterator[List[int]]:
+        if domains == {}:
+            yield chosen
+            return
+        course = min(domains, key=lambda courseCode: bin(domains[courseCode]).count('1'))
+        rest = {courseCode: domain for courseCode, domain in domains.items() if courseCode != course}
+        domain = domains[course]
+        while domain:
+            low = domain & -domain
+            domain ^= low
+            num = low.bit_length() - 1
+            keep = ~self.__graph.adjacency(num)
+            new_domains = {}
+            for courseCode, other in rest.items():
+                other &= keep
+                if other == 0:
+                    break
+                new_domains[courseCode] = other
+            else:
+                yield from self._search(new_domains, chosen + [num])
+
+    def _accept(self, classes: Set[str]) -> bool:
+        if self.__prefer is not None and self.__prefer.isdisjoint(classes):
+            return False
+        return not any(blocked <= classes for blocked in self.__blocked)
+
+    def next_solution(self) -> Optional[List[str]]:
+        for chosen in self.__search:
+            classes = {self.__graph.keys[num] for num in chosen}
+            if self._accept(classes):
+                cur_classes = sorted(classes, key=lambda item: self.__courses.index(self.__course_of[item]))
+                self.block(cur_classes)
+                return cur_classes
+        return None
+
+    def is_solution(self, classes: List[str]) -> bool:
+        '''
+        check the classes are a valid and NOT blocked solution of the problem
+        '''
+        classes = set(classes)
+        if sorted(self.__course_of[item] for item in classes if item in self.__course_of) != sorted(self.__courses) or not classes <= self.__class_codes:
+            return False
+        nums = []
+        for item in classes:
+            if item not in self.__graph.keys:
+                return False
+            nums.append(self.__graph.index(item))
+        if any(self.__graph.adjacency(a) >> b & 1 for a in nums for b in nums):
+            return False
+        return self._accept(classes)
+
+class CrossCheckBackend(SolverBackend):
+    '''
+    run the z3 backend and the native backend together, warn if they disagree
+    solutions returned are from the z3 backend and blocked in both backends
+    '''
+    name = 'check'
+
+    def __init__(self, z3_backend: Z3Backend, native_backend: NativeBackend, warn: Callable[[str], None] = print) -> None:
+        self.__z3 = z3_backend
+        self.__native = native_backend
+        self.__warn = warn
+        self.mismatch = 0
+
+    def block(self, classes: List[str]) -> None:
+        self.__z3.block(classes)
+        self.__native.block(classes)
+
+    def reset(self, history: List[List[str]]) -> None:
+        self.__z3.reset(history)
+        self.__native.reset(history)
+
+    def next_solution(self) -> Optional[List[str]]:
+        cur_classes = self.__z3.next_solution()
+        if cur_classes is None:
+            witness = self.__native.next_solution()
+            if witness is not None:
+                self.mismatch += 1
+                self.__warn("z3 found no solution but native found " + str(witness))
+            return None
+        if not self.__native.is_solution(cur_classes):
+            self.mismatch += 1
+            self.__warn("native rejects z3 solution " + str(cur_classes))
+        self.__native.block(cur_classes)
+        return cur_classes
+
+def z3_constraint(courses: Dict[str, List[Tuple[str, int]]], prefer_class_list: List[Tuple[List[str], List[str]]] = []) -> Tuple[Any, Dict[str, Any]]:
+    '''
+    compact z3 encoding of the problem, same as classTable._add_constraint without history
+    return the constraint and class code -> z3 var
+    '''
+    import z3
+    class_var = {}
+    masks = {}
+    cnt = 0
+    for courseCode, classes in courses.items():
+        for classCode, mask in classes:
+            class_var[classCode] = z3.Bool('%s_%i' % (classCode, cnt))
+            masks[classCode] = mask
+            cnt += 1
+    constraint_list = [z3.AtMost(*[class_var[item] for item in clique], 1) for clique in ConflictGraph(masks).cliques()]
+    for courseCode, classes in courses.items():
+        if classes == []:
+            constraint_list.append(z3.BoolVal(False))
+        else:
+            constraint_list.append(z3.PbEq([(class_var[classCode], 1) for classCode, _ in classes], 1))
+    if prefer_class_list != []:
+        prefer = [class_var[item] for classTuple in prefer_class_list for item in classTuple[0] if item in class_var]
+        not_prefer = [class_var[item] for classTuple in prefer_class_list for item in classTuple[1] if item in class_var]
+        constraint_list.append(z3.And(z3.Or(prefer), z3.Not(z3.Or(not_prefer))))
+    return z3.And(constraint_list), class_var
+
+# solutions a worker sends at once, the first ones are yielded before a subproblem is done
+BATCH_SIZE = 16
+
+# queue of (kind, payload) and count of solutions found by all workers, set by _init_worker() in every process of the pool
+_results = None
+_found = None
+
+def _init_worker(results, found) -> None:
+    global _results, _found
+    _results, _found = results, found
+
+def _enumerate_worker(args: Tuple) -> int:
+    '''
+    send the solutions of one subproblem in batches, then ('done', count), or ('error', traceback) if it fails
+    stop as soon as all workers together found limit solutions
+    '''
+    import traceback
+    backend_name, courses, prefer_class_list, history, limit = args
+    cnt = 0
+    try:
+        if backend_name == 'z3':
+            backend = Z3Backend(*z3_constraint(courses, prefer_class_list))
+        else:
+            backend = NativeBackend(courses, prefer_class_list)
+        backend.reset(history)
+        batch = []
+        while limit is None or _found.value < limit:
+            cur_classes = backend.next_solution()
+            if cur_classes is None:
+                break
+            with _found.get_lock():
+                _found.value += 1
+            batch.append(cur_classes)
+            cnt += 1
+            if len(batch) >= BATCH_SIZE:
+                _results.put(('solutions', batch))
+                batch = []
+        if batch != []:
+            _results.put(('solutions', batch))
+    except Exception:
+        _results.put(('error', traceback.format_exc()))
+        raise
+    # after the last batch of this process, so no batch is missed
+    _results.put(('done', cnt))
+    return cnt
+
+def split_problem(courses: Dict[str, List[Tuple[str, int]]], history: List[List[str]], min_parts: int) -> List[Tuple[Dict, List[List[str]]]]:
+    '''
+    split the problem by the section chosen for the most constrained courses (fewest sections first)
+    until there are at least min_parts subproblems, return [(courses, history)] of every subproblem
+    history solutions which can't happen in a subproblem are dropped from it
+    '''
+    parts = [(courses, history)]
+    for courseCode in sorted(courses, key=lambda courseCode: len(courses[courseCode])):
+        if len(parts) >= min_parts:
+            break
+        if len(courses[courseCode]) <= 1:
+            continue
+        codes = {classCode for classCode, _ in courses[courseCode]}
+        new_parts = []
+        for part_courses, part_history in parts:
+            for section in part_courses[courseCode]:
+                new_courses = dict(part_courses)
+                new_courses[courseCode] = [section]
+                new_history = [classes for classes in part_history if section[0] in classes or codes.isdisjoint(classes)]
+                new_parts.append((new_courses, new_history))
+        parts = new_parts
+    return parts
+
+def enumerate_parallel(courses: Dict[str, List[Tuple[str, int]]], prefer_class_list: List[Tuple[List[str], List[str]]] = [], history: List[List[str]] = [],
+                       backend_name: str = 'native', processes: int = None, limit: int = None) -> Iterator[List[str]]:
+    '''
+    enumerate solutions NOT in history with a process pool, each subproblem of split_problem() runs its own backend
+    solutions are yielded as soon as a worker sends a batch of them, at most limit solutions if limit is set,
+    then the pool is terminated, raise the error of a failed worker
+    '''
+    import multiprocessing
+    import queue
+    processes = processes or multiprocessing.cpu_count()
+    parts = split_problem(courses, history, processes * 4)
+    seen = {frozenset(classes) for classes in history}
+    cnt = 0
+    results = multiprocessing.Queue()
+    found = multiprocessing.Value('q', 0)
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(results, found)) as pool:
+        tasks = pool.imap_unordered(_enumerate_worker, [(backend_name, part_courses, prefer_class_list, part_history, limit) for part_courses, part_history in parts])
+        remaining = len(parts)
+        while remaining > 0:
+            try:
+                kind, payload = results.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if kind == 'error':
+                raise Exception("Enumeration worker failed:\n%s" % (payload))
+            if kind == 'done':
+                remaining -= 1
+                continue
+            for cur_classes in payload:
+                if frozenset(cur_classes) in seen:
+                    continue
+                seen.add(frozenset(cur_classes))
+                yield cur_classes
+                cnt += 1
+                if limit is not None and cnt >= limit:
+                    pool.terminate()
+                    return
+        # wait for every subproblem, the error of one is raised here even if it was not sent on the queue
+        for _ in tasks:
+            pass
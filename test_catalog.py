@@ -0,0 +1,93 @@
+import pytest
+from catalog import SemesterCatalog, slots_mask
+from class_table import classTable, Alarm, CourseDB, COURSE_COLUMNS
+from instrument import quiet_logger
+from replay import synthetic_lessons
+from semester_store import SemesterStore
+
+'''
+a catalog must give the same rows as course.db, whether read from it or mapped from the prebuilt file,
+and the file must be rebuilt once the rows of the semester change
+$ python3 -m pytest -q test_catalog.py
+'''
+
+@pytest.fixture
+def lessons():
+    lessons = synthetic_lessons('141', 200)
+    # a malformed schedule and empty numbers
+    lessons[0]['scheduleText']['dateTimePlaceText']['text'] = 'bad'
+    lessons[1]['limitCount'] = None
+    return lessons
+
+@pytest.fixture
+def db(tmp_path, lessons):
+    logger, Alarm.logger = Alarm.logger, quiet_logger
+    write(tmp_path, lessons)
+    db = CourseDB(str(tmp_path / 'course.db'), str(tmp_path / 'courses'))
+    yield db
+    db.close()
+    Alarm.logger = logger
+
+def write(tmp_path, lessons) -> None:
+    table = classTable("", "")
+    with SemesterStore(str(tmp_path / 'courses')).update('141') as writer:
+        writer.write([table._lesson_to_row(item) for item in lessons])
+
+def db_rows(db):
+    return db.connection('141').execute("SELECT %s FROM courses ORDER BY id" % (', '.join(COURSE_COLUMNS))).fetchall()
+
+def catalog_rows(catalog):
+    return sorted(tuple(catalog.value(row, column) for column in COURSE_COLUMNS) for row in range(len(catalog)))
+
+def test_round_trip(db, lessons, tmp_path):
+    catalog = SemesterCatalog.from_db(db, '141')
+    assert catalog_rows(catalog) == db_rows(db)
+    catalog.save(str(tmp_path / 'catalog_141.bin'))
+    mapped = SemesterCatalog.load(str(tmp_path / 'catalog_141.bin'))
+    assert catalog_rows(mapped) == db_rows(db)
+    assert mapped.fingerprint == catalog.fingerprint == SemesterCatalog.db_fingerprint(db, '141')
+    code = lessons[5]['course']['code']
+    assert mapped.get_courses('141', [code, 'NOPE'], ['classCode', 'teacher']) == db.get_courses('141', [code, 'NOPE'], ['classCode', 'teacher'])
+    classes = [lessons[num]['code'] for num in range(10)]
+    assert mapped.get_classes('141', classes, ['courseCode', 'scheduleMask']) == db.get_classes('141', classes, ['courseCode', 'scheduleMask'])
+    with pytest.raises(Exception):
+        mapped.get_courses('121', [code], ['classCode'])
+    mapped.close()
+
+def test_open_rebuilds_when_rows_change(db, lessons, tmp_path, monkeypatch):
+    path = str(tmp_path / 'catalog_141.bin')
+    built = []
+    from_db = SemesterCatalog.from_db
+    monkeypatch.setattr(SemesterCatalog, 'from_db', classmethod(lambda cls, *args: built.append(args[1]) or from_db(*args)))
+    SemesterCatalog.open(db, '141', path).close()
+    catalog = SemesterCatalog.open(db, '141', path)
+    assert built == ['141'], "an up to date file is built again"
+    catalog.close()
+    lessons[3]['stdCount'] += 1
+    write(tmp_path, lessons)
+    catalog = SemesterCatalog.open(db, '141', path)
+    assert built == ['141', '141']
+    assert catalog_rows(catalog) == db_rows(db)
+    catalog.close()
+    # a broken file is built again too
+    with open(path, 'wb') as f:
+        f.write(b'garbage')
+    catalog = SemesterCatalog.open(db, '141', path)
+    assert len(built) == 3 and catalog_rows(catalog) == db_rows(db)
+    catalog.close()
+
+def test_find_and_meeting(db, lessons):
+    catalog = SemesterCatalog.from_db(db, '141')
+    sections = catalog.find()
+    assert len(sections) == len(catalog)
+    assert sum(section.mask is None for section in sections) == 1
+    monday = slots_mask(days=[1], times=[1, 2, 3, 4, 5])
+    week_one = slots_mask(weeks=[1], days=[3], times=[6, 7])
+    code = lessons[0]['course']['code']
+    assert [section.classCode for section in catalog.find(code, avoid=monday)] == \
+        [section.classCode for section in sections if section.courseCode == code and section.mask is not None and not section.mask & monday]
+    assert {section.classCode for section in catalog.find(meets=week_one)} == \
+        {section.classCode for section in sections if section.mask is not None and section.mask & week_one}
+    assert set(catalog.meeting(week_one)) == {section.classCode for section in sections if section.mask is not None and section.mask & week_one}
+    teacher = sections[7].teacher
+    assert {section.classCode for section in catalog.find(teacher=teacher)} == {section.classCode for section in sections if section.teacher == teacher}
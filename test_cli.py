@@ -0,0 +1,54 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+from bench_startup import HEAVY_MODULES, heavy_modules
+from class_table import classTable
+from replay import synthetic_lessons
+from semester_store import SemesterStore
+
+'''
+importing class_table loads no heavy module, and the offline commands run from a semester file without one they don't need
+$ python3 -m pytest -q test_cli.py
+'''
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+@pytest.fixture(scope='module')
+def workdir(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp('cli')
+    table = classTable("", "")
+    with SemesterStore(str(workdir / 'courses')).replace('141') as writer:
+        writer.write([table._lesson_to_row(item) for item in synthetic_lessons('141', 300)])
+    return workdir
+
+def run_cli(workdir, argv: list) -> tuple:
+    '''
+    cli(argv) in a fresh interpreter, gives the exit code, stdout and the heavy modules it loaded
+    '''
+    code = "import sys, json, class_table; code = class_table.cli(%r); print(json.dumps([code, [m for m in %r if m in sys.modules]]), file=sys.stderr)" \
+        % (argv, HEAVY_MODULES)
+    r = subprocess.run([sys.executable, '-c', code], cwd=str(workdir), env=dict(os.environ, PYTHONPATH=ROOT), capture_output=True, text=True, check=True)
+    code, loaded = json.loads(r.stderr.strip().splitlines()[-1])
+    return code, r.stdout, loaded
+
+def test_import_is_light():
+    assert heavy_modules() == []
+
+def test_solve_offline(workdir):
+    code, out, loaded = run_cli(workdir, ['-q', 'solve', '-s', '141', '-c', 'S00001,S00002', '-k', '2', '--backend', 'native'])
+    assert code == 0 and loaded == []
+    solutions = out.split()
+    assert len(solutions) == 2
+    assert all(sorted(item.split('.')[0] for item in solution.split(',')) == ['S00001', 'S00002'] for solution in solutions)
+
+def test_export_offline(workdir):
+    code, out, loaded = run_cli(workdir, ['-q', 'export', '-s', '141', '-c', 'S00001,S00002'])
+    assert code == 0 and loaded == []
+    assert {item['courseCode'] for item in json.loads(out)} == {'S00001', 'S00002'}
+
+def test_print_loads_prettytable_only(workdir):
+    code, out, loaded = run_cli(workdir, ['-q', 'print', '-s', '141', '-c', 'S00001,S00002'])
+    assert code == 0 and loaded == ['prettytable']
+    assert 'Mon.' in out
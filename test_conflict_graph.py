@@ -0,0 +1,48 @@
+import random
+import pytest
+from conflict_graph import ConflictGraph
+
+'''
+ConflictGraph must agree with the pairwise AND of the schedule masks
+$ python3 -m pytest -q test_conflict_graph.py
+'''
+
+def random_masks(seed: int, sections: int = 30, slots: int = 40) -> dict:
+    rand = random.Random(seed)
+    return {'S%02d' % (num): sum(1 << rand.randrange(slots) for _ in range(rand.randint(0, 3))) for num in range(sections)}
+
+@pytest.mark.parametrize('seed', range(20))
+def test_edges_match_pairwise_and(seed):
+    masks = random_masks(seed)
+    graph = ConflictGraph(masks)
+    keys = list(masks)
+    expected = {frozenset((a, b)) for num, a in enumerate(keys) for b in keys[num + 1:] if masks[a] & masks[b]}
+    edges = list(graph.edges())
+    assert len(edges) == len(set(map(frozenset, edges))), "an edge is yielded twice"
+    assert set(map(frozenset, edges)) == expected
+    for a in keys:
+        assert graph.neighbors(a) == {b for b in keys if b != a and masks[a] & masks[b]}
+        for b in keys:
+            assert graph.conflict(a, b) == (a != b and masks[a] & masks[b] != 0)
+
+@pytest.mark.parametrize('seed', range(20))
+def test_cliques_cover_slots(seed):
+    masks = random_masks(seed)
+    graph = ConflictGraph(masks)
+    cliques = [set(clique) for clique in graph.cliques()]
+    for clique in cliques:
+        assert len(clique) > 1
+        assert all(graph.conflict(a, b) for a in clique for b in clique if a != b)
+        assert not any(clique < other for other in cliques), "a clique contained in another is kept"
+    for slot in range(40):
+        sections = {key for key, mask in masks.items() if mask >> slot & 1}
+        assert set(graph.slot_sections(slot)) == sections
+        if len(sections) > 1:
+            assert any(sections <= clique for clique in cliques)
+
+def test_empty_and_free_sections():
+    graph = ConflictGraph({'A': 0, 'B': 0b1, 'C': 0b10})
+    assert list(graph.edges()) == []
+    assert graph.cliques() == []
+    assert graph.neighbors('A') == set()
+    assert len(ConflictGraph({})) == 0
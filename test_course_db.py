@@ -0,0 +1,68 @@
+import pickle
+import sqlite3
+import pytest
+import requests
+from class_table import classTable, Alarm, CourseDB
+from instrument import quiet_logger
+from replay import ReplayAdapter, synthetic_lessons, LOGIN_COOKIE
+
+'''
+every read and write of classTable goes to CourseDB.path, not to course.db of the working directory
+$ python3 -m pytest -q test_course_db.py
+'''
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    logger, Alarm.logger = Alarm.logger, quiet_logger
+    yield tmp_path
+    Alarm.logger = logger
+
+def replay_table(adapter: ReplayAdapter, db: CourseDB) -> classTable:
+    '''
+    a table logged in to the replay adapter by a cached session
+    '''
+    table = classTable("PB00000000", "replay", db)
+    table.transport_adapter = adapter
+    table.http_cache_file = None
+    cookies = requests.cookies.RequestsCookieJar()
+    cookies.set(LOGIN_COOKIE, '1', domain='.ustc.edu.cn')
+    with open(table.session_file, 'wb') as f:
+        pickle.dump({'username': "PB00000000", 'cookies': cookies}, f)
+    table.login()
+    table.semester = '141'
+    return table
+
+def count(path, semester: str = '141') -> int:
+    con = sqlite3.connect(str(path))
+    try:
+        return con.execute("SELECT COUNT(*) FROM courses WHERE semester = ?", (semester,)).fetchone()[0]
+    finally:
+        con.close()
+
+def test_non_default_path(workdir):
+    lessons = synthetic_lessons('141', 300)
+    adapter = ReplayAdapter({'141': lessons})
+    db = CourseDB(str(workdir / 'legacy.db'), semester_dir=None)
+    table = replay_table(adapter, db)
+    table.update_db('141')
+    assert not (workdir / 'course.db').exists()
+    assert count(workdir / 'legacy.db') == 300
+    code = lessons[0]['course']['code']
+    assert db.get_courses('141', [code], ['classCode'])[code] != []
+    del adapter.semesters['141'][:10]
+    assert len(table.refresh_db('141')['removed']) == 10
+    assert count(workdir / 'legacy.db') == 290
+    assert not (workdir / 'course.db').exists()
+
+def test_semesters_move_out_of_non_default_path(workdir):
+    adapter = ReplayAdapter({'141': synthetic_lessons('141', 300)})
+    db = CourseDB(str(workdir / 'legacy.db'), semester_dir=None)
+    replay_table(adapter, db).update_db('141')
+    db.close()
+    db = CourseDB(str(workdir / 'legacy.db'), semester_dir=str(workdir / 'semesters'))
+    summary = replay_table(adapter, db).refresh_semesters(['141'])['141']
+    assert summary == {'inserted': [], 'changed': [], 'removed': []}
+    assert count(workdir / 'legacy.db') == 0
+    assert count(workdir / 'semesters' / '141.db') == 300
+    assert not (workdir / 'course.db').exists()
@@ -0,0 +1,41 @@
+import pickle
+from history_store import HistoryStore
+
+'''
+a solution is stored once per semester and course list, whatever the order of the courses and classes
+$ python3 -m pytest -q test_history_store.py
+'''
+
+def test_add_and_load(tmp_path):
+    store = HistoryStore(str(tmp_path / 'history.db'))
+    assert store.add('141', ['CS1502', 'MARX1004'], ['CS1502.01', 'MARX1004.03'])
+    assert not store.add('141', ['MARX1004', 'CS1502'], ['MARX1004.03', 'CS1502.01'])
+    assert store.add('141', ['CS1502', 'MARX1004'], ['CS1502.02', 'MARX1004.03'])
+    # another semester or course list is another history
+    assert store.add('121', ['CS1502', 'MARX1004'], ['CS1502.01', 'MARX1004.03'])
+    assert store.add('141', ['CS1502'], ['CS1502.01'])
+    assert store.load('141', ['MARX1004', 'CS1502']) == [['CS1502.01', 'MARX1004.03'], ['CS1502.02', 'MARX1004.03']]
+    assert store.count('141', ['CS1502', 'MARX1004']) == 2
+    assert store.course_lists('141') == [['CS1502'], ['CS1502', 'MARX1004']]
+    store.close()
+    # kept on disk
+    store = HistoryStore(str(tmp_path / 'history.db'))
+    assert store.count('141', ['CS1502', 'MARX1004']) == 2
+    assert store.clear('141', ['CS1502', 'MARX1004']) == 2
+    assert store.load('141', ['CS1502', 'MARX1004']) == []
+    assert store.count('121', ['CS1502', 'MARX1004']) == 1
+
+def test_add_many_counts_new(tmp_path):
+    store = HistoryStore(str(tmp_path / 'history.db'))
+    solutions = [['A.01', 'B.01'], ['A.02', 'B.01'], ['B.01', 'A.01']]
+    assert store.add_many('141', ['A', 'B'], solutions) == 2
+    assert store.add_many('141', ['A', 'B'], solutions) == 0
+
+def test_import_pickle(tmp_path):
+    store = HistoryStore(str(tmp_path / 'history.db'))
+    assert store.import_pickle(str(tmp_path / 'history.plk'), '141', ['A', 'B']) == 0
+    with open(tmp_path / 'history.plk', 'wb') as f:
+        pickle.dump([['A.01', 'B.01'], ['A.02', 'B.02']], f)
+    assert store.import_pickle(str(tmp_path / 'history.plk'), '141', ['A', 'B']) == 2
+    assert store.import_pickle(str(tmp_path / 'history.plk'), '141', ['A', 'B']) == 0
+    assert store.load('141', ['B', 'A']) == [['A.01', 'B.01'], ['A.02', 'B.02']]
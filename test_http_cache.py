@@ -0,0 +1,83 @@
+import pytest
+import requests
+from http_cache import HttpCache, CachingAdapter
+from replay import ReplayAdapter, synthetic_lessons, LOGIN_COOKIE
+
+'''
+responses are served from the cache while fresh, revalidated by ETag when stale, and lesson pages are never stored
+$ python3 -m pytest -q test_http_cache.py
+'''
+
+INDEX = "https://jw.ustc.edu.cn/for-std/lesson-search/index/24441"
+LESSON_PAGE = "https://jw.ustc.edu.cn/for-std/lesson-search/semester/141/search/24441?queryPage__=1%2C1000&sort__=code%2Casc"
+
+@pytest.fixture
+def replay():
+    return ReplayAdapter({'141': synthetic_lessons('141', 50)})
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = HttpCache(str(tmp_path / 'http_cache.db'))
+    yield cache
+    cache.close()
+
+def session_of(replay: ReplayAdapter, cache: HttpCache, namespace: str = 'PB00000000') -> requests.Session:
+    session = requests.Session()
+    session.cookies.set(LOGIN_COOKIE, '1', domain='.ustc.edu.cn')
+    session.mount("https://", replay)
+    session.mount("https://jw.ustc.edu.cn/", CachingAdapter(replay, cache, namespace))
+    return session
+
+def test_fresh_response_is_a_hit(replay, cache):
+    session = session_of(replay, cache)
+    first = session.get(INDEX)
+    assert first.headers.get('X-Cache') is None and cache.counters['stored'] == 1
+    second = session.get(INDEX)
+    assert second.headers['X-Cache'] == 'hit'
+    assert second.text == first.text
+    assert replay.stats['semester_index'] == 1
+
+def test_stale_response_is_revalidated(replay, cache):
+    session = session_of(replay, cache)
+    first = session.get(INDEX)
+    cache.ttl['semester_index'] = 1e-9
+    second = session.get(INDEX)
+    assert second.status_code == 200
+    assert second.headers['X-Cache'] == 'revalidated'
+    assert second.text == first.text
+    assert replay.stats == {'semester_index': 1, 'semester_index_not_modified': 1}
+    # the page changed, the server answers 200 and the new body is stored
+    replay.semesters['121'] = []
+    third = session.get(INDEX)
+    assert third.headers.get('X-Cache') is None
+    assert '121' in third.text and third.text != first.text
+    assert cache.lookup('PB00000000', INDEX)[1] == third.content
+
+def test_no_cache_and_namespaces(replay, cache):
+    session = session_of(replay, cache)
+    session.get(INDEX)
+    assert session.get(INDEX, headers={'Cache-Control': 'no-cache'}).headers.get('X-Cache') is None
+    assert cache.counters['bypass'] == 1
+    # another student doesn't get your pages
+    assert session_of(replay, cache, 'PB11111111').get(INDEX).headers.get('X-Cache') is None
+    assert replay.stats['semester_index'] == 3
+
+def test_lesson_pages_are_not_stored(replay, cache):
+    session = session_of(replay, cache)
+    for _ in range(2):
+        assert len(session.get(LESSON_PAGE).json()['data']) == 50
+    assert replay.stats['lesson_page'] == 2
+    assert cache.lookup('PB00000000', LESSON_PAGE) is None
+    assert cache.stats()['endpoints'] == {}
+
+def test_parsed_follows_body(replay, cache):
+    session = session_of(replay, cache)
+    body = session.get(INDEX).content
+    cache.put_parsed('PB00000000', INDEX, 'semesters', body, {'141': 'spring'})
+    assert cache.get_parsed('PB00000000', INDEX, 'semesters') == {'141': 'spring'}
+    cache.put_parsed('PB00000000', INDEX, 'semesters', b'another body', {'141': 'spring'})
+    assert cache.get_parsed('PB00000000', INDEX, 'semesters') is None
+    assert cache.invalidate('semester_index') == 1
+    assert cache.lookup('PB00000000', INDEX) is None
+    with pytest.raises(Exception):
+        cache.invalidate('unknown')
@@ -0,0 +1,31 @@
+import json
+import pytest
+from json_stream import iter_json_array
+
+'''
+iter_json_array must decode the same elements as json.loads, however the response is cut into chunks
+$ python3 -m pytest -q test_json_stream.py
+'''
+
+PAGE = {'pageInfo': {'total': 3, 'size': 2.5}, 'data': [{'code': 'CS1502.01', 'stdCount': 12}, {'code': '中文', 'teacher': None}, 7], 'tail': [1, 2]}
+
+def chunked(text: str, size: int) -> list:
+    raw = text.encode()
+    return [raw[start:start + size] for start in range(0, len(raw), size)]
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 1000])
+def test_matches_json_loads(size):
+    assert list(iter_json_array(chunked(json.dumps(PAGE, ensure_ascii=False), size), 'data')) == PAGE['data']
+
+def test_empty_array():
+    assert list(iter_json_array(chunked('{"pageInfo": {}, "data": []}', 4), 'data')) == []
+
+@pytest.mark.parametrize('text', ['{"pageInfo": {"total": 0}}', '{}', '{"Data": [1, 2]}', '{"datas": [1, 2], "total": 2}'])
+def test_missing_key(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(chunked(text, 3), 'data'))
+
+@pytest.mark.parametrize('text', ['{"data": [1, 2', '{"data": [1 2]}', '["data"]'])
+def test_broken_json(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(chunked(text, 3), 'data'))
@@ -0,0 +1,55 @@
+import pytest
+from presolve import presolve, minimal_conflict
+from test_solver_backend import random_courses, brute_force, prefer_of
+
+'''
+presolve must never remove a class of a solution, and the conflict it blames must be minimal
+$ python3 -m pytest -q test_presolve.py
+'''
+
+SEEDS = range(40)
+
+def infeasible_seeds(cnt: int = 10, course_cnt: int = 5, slots: int = 8) -> list:
+    '''
+    the first seeds whose random courses have NO solution
+    '''
+    seeds = []
+    seed = 0
+    while len(seeds) < cnt:
+        if brute_force(random_courses(seed, course_cnt, slots)) == set():
+            seeds.append(seed)
+        seed += 1
+    return seeds
+
+def without_not_prefer(courses, prefer_class_list):
+    not_prefer = {item for classTuple in prefer_class_list for item in classTuple[1]}
+    return {courseCode: [(class_code, mask) for class_code, mask in classes if class_code not in not_prefer] for courseCode, classes in courses.items()}
+
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('prefer', [False, True])
+def test_propagation_keeps_solutions(seed, prefer):
+    courses = random_courses(seed, course_cnt=5, slots=10)
+    prefer_class_list = prefer_of(courses) if prefer else []
+    result = presolve(courses, prefer_class_list)
+    for solution in brute_force(courses, prefer_class_list):
+        assert solution.isdisjoint(result.removed), "a class of a solution is removed"
+    if brute_force(courses, prefer_class_list) != set():
+        assert result.conflict is None
+
+@pytest.mark.parametrize('seed', infeasible_seeds())
+@pytest.mark.parametrize('prefer', [False, True])
+def test_minimal_conflict(seed, prefer):
+    courses = random_courses(seed, course_cnt=5, slots=8)
+    prefer_class_list = prefer_of(courses) if prefer else []
+    conflict, removed = minimal_conflict(courses, prefer_class_list)
+    left = without_not_prefer(courses, prefer_class_list)
+    assert brute_force({courseCode: left[courseCode] for courseCode in conflict}) == set()
+    for courseCode in conflict:
+        rest = {item: left[item] for item in conflict if item != courseCode}
+        assert brute_force(rest) != set(), "%s can be dropped from the conflict" % (courseCode)
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_feasible_has_no_conflict(seed):
+    courses = random_courses(seed, course_cnt=5, slots=10)
+    if brute_force(courses) != set():
+        assert minimal_conflict(courses) is None
@@ -0,0 +1,82 @@
+import pytest
+import requests
+from replay import ReplayAdapter, synthetic_lessons, LOGIN_COOKIE
+
+'''
+the replay adapter must answer like jw.ustc.edu.cn: login redirects, ETag revalidation, pages of lessons and failures
+$ python3 -m pytest -q test_replay.py
+'''
+
+INDEX = "https://jw.ustc.edu.cn/for-std/lesson-search/index/24441"
+SEARCH = "https://jw.ustc.edu.cn/for-std/lesson-search/semester/141/search/24441"
+
+def session_of(replay: ReplayAdapter, logged_in: bool = True) -> requests.Session:
+    session = requests.Session()
+    if logged_in:
+        session.cookies.set(LOGIN_COOKIE, '1', domain='.ustc.edu.cn')
+    session.mount("https://", replay)
+    return session
+
+def test_synthetic_lessons():
+    lessons = synthetic_lessons('141', 30, course_cnt=10)
+    assert lessons == synthetic_lessons('141', 30, course_cnt=10)
+    assert len({item['code'] for item in lessons}) == 30
+    assert len({item['course']['code'] for item in lessons}) == 10
+    assert all(item['code'].startswith(item['course']['code'] + '.') for item in lessons)
+
+def test_login_redirect():
+    replay = ReplayAdapter({'141': synthetic_lessons('141', 10)})
+    response = session_of(replay, logged_in=False).get(INDEX, allow_redirects=False)
+    assert response.status_code == 302
+    assert response.headers['Location'] == 'https://passport.ustc.edu.cn/login'
+    assert replay.stats == {'redirect': 1}
+    # the cookie set by the login post opens jw.ustc.edu.cn
+    session = session_of(replay, logged_in=False)
+    session.post("https://passport.ustc.edu.cn/login", data={})
+    assert session.get(INDEX).status_code == 200
+    assert replay.stats['login'] == 1 and replay.stats['semester_index'] == 1
+
+def test_etag_not_modified():
+    replay = ReplayAdapter({'141': synthetic_lessons('141', 10), '221': []})
+    session = session_of(replay)
+    first = session.get(INDEX)
+    assert '141' in first.text and '221' in first.text
+    etag = first.headers['ETag']
+    second = session.get(INDEX, headers={'If-None-Match': etag})
+    assert second.status_code == 304 and second.content == b''
+    assert replay.stats == {'semester_index': 1, 'semester_index_not_modified': 1}
+    replay.semesters['241'] = []
+    third = session.get(INDEX, headers={'If-None-Match': etag})
+    assert third.status_code == 200 and third.headers['ETag'] != etag
+
+def test_lesson_pages():
+    lessons = synthetic_lessons('141', 45)
+    replay = ReplayAdapter({'141': lessons})
+    session = session_of(replay)
+    count = session.get(SEARCH, params={'queryPage__': '1,1'}).json()
+    assert count['_page_']['totalRows'] == 45
+    pages = [session.get(SEARCH, params={'queryPage__': '%d,20' % (page)}).json() for page in (1, 2, 3)]
+    assert [len(page['data']) for page in pages] == [20, 20, 5]
+    assert [item for page in pages for item in page['data']] == lessons
+    assert session.get(SEARCH, params={'queryPage__': '4,20'}).json()['data'] == []
+    assert replay.stats == {'lesson_count': 1, 'lesson_page': 4}
+    found = session.get(SEARCH, params={'queryPage__': '1,1000', 'codeLike': lessons[7]['course']['code']}).json()
+    assert found['data'] == [item for item in lessons if item['course']['code'] == lessons[7]['course']['code']]
+    assert found['_page_']['totalRows'] == len(found['data'])
+    assert replay.stats['lesson_search'] == 1
+    assert session.get("https://jw.ustc.edu.cn/for-std/lesson-search/semester/121/search/24441").json()['data'] == []
+
+def test_failures():
+    replay = ReplayAdapter({'141': synthetic_lessons('141', 45)}, failure_rate=1.0)
+    session = session_of(replay)
+    statuses = set()
+    for _ in range(20):
+        response = session.get(SEARCH, params={'queryPage__': '1,20'})
+        if response.status_code == 200:
+            with pytest.raises(ValueError):
+                response.json()
+        statuses.add(response.status_code)
+    assert statuses == {200, 500}
+    assert replay.stats == {'lesson_page_failed': 20}
+    # counting the lessons never fails
+    assert session.get(SEARCH, params={'queryPage__': '1,1'}).json()['_page_']['totalRows'] == 45
@@ -0,0 +1,42 @@
+import pytest
+from class_table import classTable, Alarm, CourseDB
+from instrument import quiet_logger
+from replay import synthetic_lessons
+from schedule_service import SharedCatalog, solve_request
+from semester_store import SemesterStore
+
+'''
+a wrong request gets an error with a 4xx status, never a 500 or an empty solution list
+$ python3 -m pytest -q test_schedule_service.py
+'''
+
+@pytest.fixture(scope='module')
+def catalog(tmp_path_factory):
+    logger, Alarm.logger = Alarm.logger, quiet_logger
+    directory = tmp_path_factory.mktemp('service')
+    table = classTable("", "")
+    with SemesterStore(str(directory / 'courses')).replace('141') as writer:
+        writer.write([table._lesson_to_row(item) for item in synthetic_lessons('141', 300)])
+    yield SharedCatalog(['141'], CourseDB(str(directory / 'course.db'), str(directory / 'courses')))
+    Alarm.logger = logger
+
+def test_valid_request(catalog):
+    response = solve_request(catalog, {'id': 1, 'semester': '141', 'courses': ['S00001', 'S00002'], 'k': '2'})
+    assert 'error' not in response
+    assert len(response['solutions']) == 2
+
+@pytest.mark.parametrize('request_json, status', [
+    ({'courses': ['S00001']}, 400),
+    ({'semester': '141'}, 400),
+    ({'semester': '141', 'courses': ['S00001'], 'k': 'two'}, 400),
+    ({'semester': '141', 'courses': ['S00001'], 'k': None}, 400),
+    ({'semester': '141', 'courses': ['S00001'], 'k': [2]}, 400),
+    ({'semester': '141', 'courses': ['S00001'], 'k': 0}, 400),
+    ({'semester': '121', 'courses': ['S00001']}, 404),
+    ({'semester': '141', 'courses': ['S00001', 'NOPE']}, 404),
+])
+def test_wrong_request(catalog, request_json, status):
+    response = solve_request(catalog, dict(request_json, id=7))
+    assert response['id'] == 7
+    assert response['status'] == status
+    assert 'solutions' not in response
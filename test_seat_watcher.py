@@ -0,0 +1,126 @@
+import random
+import pytest
+import seat_watcher
+from class_table import Alarm
+from instrument import quiet_logger
+from seat_watcher import RateLimiter, SeatWatcher, backoff_delay, seats_event
+
+'''
+the watcher must stay below its request rate, back off within bounds and emit one event per change of seats
+$ python3 -m pytest -q test_seat_watcher.py
+'''
+
+class FakeClock:
+    '''
+    time.monotonic() and time.sleep() of seat_watcher, sleeping moves the clock instead of waiting
+    '''
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(seat_watcher.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(seat_watcher.time, 'sleep', clock.sleep)
+    return clock
+
+@pytest.fixture(autouse=True)
+def quiet():
+    logger, Alarm.logger = Alarm.logger, quiet_logger
+    yield
+    Alarm.logger = logger
+
+@pytest.mark.parametrize('rate, burst', [(2.0, 1), (2.0, 3), (0.5, 4), (10.0, 10)])
+def test_token_bucket(clock, rate, burst):
+    limiter = RateLimiter(rate, burst)
+    start = clock.now
+    assert [limiter.acquire() for _ in range(burst)] == [0.0] * burst
+    assert limiter.acquire() == pytest.approx(1 / rate)
+    for _ in range(99 - burst):
+        limiter.acquire()
+    # 100 requests, the first `burst` of them at once, then `rate` per second
+    assert clock.now - start == pytest.approx((100 - burst) / rate)
+    # an idle bucket refills up to burst only
+    clock.now += 1000
+    waits = [limiter.acquire() for _ in range(burst + 1)]
+    assert waits[:burst] == [0.0] * burst and waits[burst] > 0
+
+@pytest.mark.parametrize('base, cap', [(1.0, 60.0), (0.1, 5.0), (2.0, 2.0)])
+def test_backoff_bounds(base, cap):
+    rand = random.Random(0)
+    for attempt in range(12):
+        bound = min(cap, base * 2 ** attempt)
+        delays = [backoff_delay(attempt, base, cap, rand) for _ in range(200)]
+        assert all(0 <= delay <= bound for delay in delays)
+        # full jitter spreads over the whole range
+        assert max(delays) > bound * 0.9 and min(delays) < bound * 0.1
+
+@pytest.mark.parametrize('previous, current, kind', [
+    (None, (10, 20), 'snapshot'),
+    (None, None, None),
+    ((10, 20), None, 'removed'),
+    ((10, 20), (10, 20), None),
+    ((20, 20), (19, 20), 'opened'),
+    ((20, 20), (20, 25), 'opened'),
+    ((19, 20), (20, 20), 'filled'),
+    ((10, 20), (11, 20), 'changed'),
+    ((21, 20), (20, 20), 'changed'),
+])
+def test_seats_event(previous, current, kind):
+    assert seats_event(previous, current) == kind
+
+class FakeTable:
+    '''
+    search_lessons() of classTable answering from lessons, raising for the first `failures` calls
+    '''
+
+    def __init__(self, lessons: dict, failures: int = 0) -> None:
+        self.lessons = lessons
+        self.failures = failures
+        self.calls = 0
+
+    def search_lessons(self, semester_id: str, course_code: str) -> list:
+        self.calls += 1
+        if self.failures > 0:
+            self.failures -= 1
+            raise Exception("broken page")
+        return [lesson(class_code, *seats) for class_code, seats in self.lessons.items() if class_code.startswith(course_code + '.')]
+
+def lesson(class_code: str, stdCount: int, limitCount: int) -> dict:
+    return {'code': class_code, 'stdCount': stdCount, 'limitCount': limitCount, 'course': {'nameZh': class_code[:2]},
+            'teacherAssignmentList': [{'teacher': {'person': {'nameZh': 'teacher'}}}]}
+
+def kinds(events: list) -> dict:
+    return {event['classCode']: event['event'] for event in events}
+
+def test_poll_events(monkeypatch):
+    monkeypatch.setattr(seat_watcher, 'backoff_delay', lambda *args, **kwargs: 0.0)
+    table = FakeTable({'CS.01': (10, 20), 'CS.02': (20, 20), 'MA.01': (5, 30)})
+    emitted = []
+    watcher = SeatWatcher(table, '141', ['CS', 'MA'], classes=['CS.01', 'CS.02'], callback=emitted.append, rate=1e6)
+    assert kinds(watcher.poll()) == {'CS.01': 'snapshot', 'CS.02': 'snapshot'}
+    assert watcher.poll() == []
+    table.lessons.update({'CS.01': (20, 20), 'CS.02': (19, 20), 'MA.01': (6, 30)})
+    events = watcher.poll()
+    assert kinds(events) == {'CS.01': 'filled', 'CS.02': 'opened'}
+    assert events[1]['seats'] == 1 and events[1]['previousStdCount'] == 20
+    del table.lessons['CS.01']
+    assert kinds(watcher.poll()) == {'CS.01': 'removed'}
+    assert [event['event'] for event in emitted] == ['snapshot', 'snapshot', 'filled', 'opened', 'removed']
+    # a failing course is retried, one failing every try keeps its last seats
+    table.failures = 2
+    table.lessons['CS.02'] = (18, 20)
+    calls = table.calls
+    assert kinds(watcher.poll()) == {'CS.02': 'changed'}
+    assert table.calls - calls == 4
+    table.failures = 3
+    table.lessons['CS.02'] = (17, 20)
+    assert watcher.poll() == []
+    assert watcher.snapshot == {'CS.02': (18, 20)}
@@ -0,0 +1,26 @@
+import os
+import pickle
+import stat
+import sys
+import pytest
+import requests
+from class_table import classTable
+
+'''
+the cached session holds your login cookies, so it must be readable only by you
+$ python3 -m pytest -q test_session.py
+'''
+
+@pytest.mark.skipif(sys.platform == 'win32', reason="no unix file modes")
+def test_session_file_mode(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    table = classTable("PB00000000", "")
+    with open(table.session_file, 'wb') as f:
+        f.write(b'old session')
+    os.chmod(table.session_file, 0o644)
+    table._classTable__session = requests.Session()
+    table._save_session()
+    assert stat.S_IMODE(os.stat(table.session_file).st_mode) == 0o600
+    with open(table.session_file, 'rb') as f:
+        assert pickle.load(f)['username'] == "PB00000000"
+    assert os.listdir(tmp_path) == [table.session_file]
@@ -0,0 +1,189 @@
+import itertools
+import random
+from typing import *
+import pytest
+from class_table import classTable, Alarm
+from instrument import quiet_logger
+from schedule_parser import mask_to_blob
+from solver_backend import SolverBackend, NativeBackend, Z3Backend, z3_constraint, enumerate_parallel
+
+'''
+every backend and encoding must find exactly the solutions of a brute force search
+$ python3 -m pytest -q test_solver_backend.py
+'''
+
+# seed 9 has no solution
+SEEDS = [1, 2, 3, 4, 9]
+
+def random_courses(seed: int, course_cnt: int = 4, slots: int = 12) -> Dict[str, List[Tuple[str, int]]]:
+    '''
+    course code -> [(class code, schedule mask)], every class takes one or two of a few slots so many of them conflict
+    '''
+    rand = random.Random(seed)
+    courses = {}
+    for num in range(course_cnt):
+        courseCode = 'C%02d' % (num)
+        courses[courseCode] = [('%s.%02d' % (courseCode, section + 1), sum(1 << rand.randrange(slots) for _ in range(rand.randint(1, 2))))
+                               for section in range(rand.randint(1, 4))]
+    return courses
+
+def brute_force(courses: Dict[str, List[Tuple[str, int]]], prefer_class_list: List[Tuple[List[str], List[str]]] = []) -> Set[FrozenSet[str]]:
+    prefer = {item for classTuple in prefer_class_list for item in classTuple[0]}
+    not_prefer = {item for classTuple in prefer_class_list for item in classTuple[1]}
+    solutions = set()
+    for choice in itertools.product(*courses.values()):
+        masks = [mask for _, mask in choice]
+        if any(masks[a] & masks[b] for a in range(len(masks)) for b in range(a + 1, len(masks))):
+            continue
+        classes = frozenset(class_code for class_code, _ in choice)
+        if prefer_class_list != [] and (prefer.isdisjoint(classes) or not not_prefer.isdisjoint(classes)):
+            continue
+        solutions.add(classes)
+    return solutions
+
+def prefer_of(courses: Dict[str, List[Tuple[str, int]]]) -> List[Tuple[List[str], List[str]]]:
+    '''
+    prefer the first class of the first course, as classTable.add_prefer_class()
+    '''
+    classes = [class_code for class_code, _ in next(iter(courses.values()))]
+    return [(classes[:1], classes[1:])]
+
+class FakeDB:
+    '''
+    lessons of one semester for classTable, in place of CourseDB and its catalog
+    '''
+
+    def __init__(self, courses: Dict[str, List[Tuple[str, int]]]) -> None:
+        self.rows = {courseCode: [('1~18周', '', courseCode, class_code, 'teacher', mask_to_blob(mask)) for class_code, mask in classes]
+                     for courseCode, classes in courses.items()}
+
+    def catalog(self, semester: str) -> 'FakeDB':
+        return self
+
+    def get_courses(self, semester: str, course_codes: List[str], columns: List[str]) -> Dict[str, List[Tuple]]:
+        return {courseCode: self.rows.get(courseCode, []) for courseCode in course_codes}
+
+    def get_classes(self, semester: str, class_codes: List[str], columns: List[str]) -> Dict[str, Tuple]:
+        '''
+        the last row of each class code, as SemesterCatalog, courseName is the course code
+        '''
+        names = ['scheduleWeek', 'scheduleTime', 'courseName', 'classCode', 'teacher', 'scheduleMask']
+        by_class = {row[3]: row for rows in self.rows.values() for row in rows}
+        return {class_code: tuple(by_class[class_code][names.index('courseName' if column == 'courseCode' else column)] for column in columns)
+                for class_code in class_codes if class_code in by_class}
+
+@pytest.fixture(autouse=True)
+def quiet():
+    logger, Alarm.logger = Alarm.logger, quiet_logger
+    yield
+    Alarm.logger = logger
+
+def table_solutions(courses: Dict[str, List[Tuple[str, int]]], backend: str, encoding: str, prefer: bool, presolve: bool = True) -> Set[FrozenSet[str]]:
+    table = classTable("", "", FakeDB(courses))
+    table.semester = '141'
+    table.course_code_list = list(courses)
+    table.solver_backend = backend
+    table.encoding = encoding
+    table.presolve = presolve
+    if prefer:
+        table._classTable__prefer_class_list = prefer_of(courses)
+    found = [frozenset(classes) for classes in table.iter_solutions()]
+    assert len(found) == len(set(found)), "a solution is returned twice"
+    return set(found)
+
+def test_backend_is_abstract():
+    with pytest.raises(TypeError):
+        SolverBackend()
+
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('backend', ['z3', 'native', 'check'])
+@pytest.mark.parametrize('encoding', ['compact', 'classic'])
+@pytest.mark.parametrize('prefer', [False, True])
+def test_table_matches_brute_force(seed, backend, encoding, prefer):
+    courses = random_courses(seed)
+    expected = brute_force(courses, prefer_of(courses) if prefer else [])
+    assert table_solutions(courses, backend, encoding, prefer) == expected
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_without_presolve(seed):
+    courses = random_courses(seed)
+    assert table_solutions(courses, 'check', 'compact', False, presolve=False) == brute_force(courses)
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_backends_match_brute_force(seed):
+    courses = random_courses(seed)
+    for backend in [NativeBackend(courses), Z3Backend(*z3_constraint(courses))]:
+        found = set()
+        while True:
+            classes = backend.next_solution()
+            if classes is None:
+                break
+            found.add(frozenset(classes))
+        assert found == brute_force(courses)
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_history_is_blocked(seed):
+    courses = random_courses(seed)
+    expected = brute_force(courses)
+    history = [sorted(classes) for classes in list(expected)[:2]]
+    backend = NativeBackend(courses)
+    backend.reset(history)
+    found = set()
+    while True:
+        classes = backend.next_solution()
+        if classes is None:
+            break
+        found.add(frozenset(classes))
+    assert found == expected - {frozenset(classes) for classes in history}
+
+@pytest.mark.parametrize('backend', ['native', 'z3'])
+def test_enumerate_parallel(backend):
+    courses = random_courses(5, course_cnt=5)
+    expected = brute_force(courses)
+    found = [frozenset(classes) for classes in enumerate_parallel(courses, backend_name=backend, processes=2)]
+    assert len(found) == len(set(found))
+    assert set(found) == expected
+    limited = list(enumerate_parallel(courses, backend_name=backend, processes=2, limit=3))
+    assert len(limited) == min(3, len(expected))
+    assert {frozenset(classes) for classes in limited} <= expected
+
+@pytest.mark.parametrize('backend', ['z3', 'native'])
+def test_malformed_schedule_is_dropped(backend, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    courses = random_courses(1)
+    db = FakeDB(courses)
+    courseCode = next(iter(courses))
+    db.rows[courseCode].append(('第x周', '???', courseCode, '%s.99' % (courseCode), 'teacher', None))
+    # a malformed copy of every class of the course, the one found by class code when placing
+    db.rows[courseCode] += [('第x周', '???', courseCode, class_code, 'teacher', None) for class_code, _ in courses[courseCode]]
+    def new_table() -> classTable:
+        table = classTable("", "", db)
+        table.semester = '141'
+        table.course_code_list = list(courses)
+        table.solver_backend = backend
+        return table
+    assert {frozenset(classes) for classes in new_table().iter_solutions()} == brute_force(courses)
+    # solve() places the lessons too
+    table = new_table()
+    table.solve()
+    exported = table.export_class_table()
+    # the class of courseCode is placed from its malformed copy, so it is skipped
+    assert sorted(item['courseCode'] for item in exported) == sorted(courses)[1:]
+
+def test_is_schedule_checks_history():
+    courses = random_courses(1)
+    table = classTable("", "", FakeDB(courses))
+    table.semester = '141'
+    table.course_code_list = list(courses)
+    course_list = table._get_courses_info()
+    solution = sorted(min(brute_force(courses), key=sorted))
+    assert table._is_schedule(course_list, solution)
+    assert not table._is_schedule(course_list, solution[1:])
+    table._classTable__history_model = [solution]
+    assert not table._is_schedule(course_list, solution)
+
+def test_enumerate_parallel_worker_error():
+    courses = random_courses(5, course_cnt=5)
+    courses['C00'] = [(class_code, 'not a mask') for class_code, _ in courses['C00']]
+    with pytest.raises(Exception, match="worker failed"):
+        list(enumerate_parallel(courses, processes=2))